@@ -0,0 +1,87 @@
+import cProfile
+import io
+import pstats
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class Profiler:
+    """
+    Profiles the wrapped block with cProfile and records its SQL queries.
+
+        with Profiler("GET /") as profiler:
+            ...
+        print(profiler.report())
+    """
+
+    def __init__(self, title):
+        self.title = title
+        self.profile = cProfile.Profile()
+        self.queries = CaptureQueriesContext(connection)
+        self.duration = 0
+
+    def __enter__(self):
+        self.queries.__enter__()
+        self.started = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        self.duration = time.perf_counter() - self.started
+        self.queries.__exit__(*exc_info)
+
+    def report(self, limit=None):
+        """Return the pstats report sorted by the cumulative time,
+        followed by the SQL query log."""
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(
+            limit or settings.PROFILE_REPORT_LIMIT)
+
+        queries = self.queries.captured_queries
+        sql_time = sum(float(q["time"]) for q in queries)
+        lines = [
+            self.title,
+            f"Total: {self.duration * 1000:.2f} ms, "
+            f"{len(queries)} queries in {sql_time * 1000:.2f} ms",
+            "",
+            stream.getvalue(),
+            "SQL queries:",
+        ]
+        for i, query in enumerate(queries, 1):
+            lines.append(f"{i:>4}. [{float(query['time']) * 1000:.2f} ms] "
+                         f"{query['sql']}")
+        return "\n".join(lines) + "\n"
+
+
+class ProfiledCommand(BaseCommand):
+    """
+    A BaseCommand with a --profile option. The profile report of the
+    command is written to the given path.
+    """
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            '--profile', metavar='PATH',
+            help='Profile the command and write the report to PATH.')
+        return parser
+
+    def execute(self, *args, **options):
+        path = options.get("profile")
+        if not path:
+            return super().execute(*args, **options)
+
+        profiler = Profiler(f"Command: {self.__module__.split('.')[-1]}")
+        try:
+            with profiler:
+                return super().execute(*args, **options)
+        finally:
+            with open(path, "w") as f:
+                f.write(profiler.report())
+            self.stderr.write(f"Profile report is written to {path}.")
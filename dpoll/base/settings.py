@@ -1,4 +1,5 @@
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -34,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'middlewares.RequestStatsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -43,6 +45,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'middlewares.LoginReferrerMiddleware',
+    'middlewares.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'base.urls'
@@ -159,6 +162,108 @@ BROADCAST_TO_BLOCKCHAIN = True
 
 TEAM_MEMBERS = ["emrebeyler", "bluerobo", "isnochys", "tolgahanuzun"]
 
+# RPC nodes used by the web app
+HIVE_NODES = ["https://api.hivekings.com"]
+
+HIVESIGNER_OAUTH_BASE_URL = "https://hivesigner.com/oauth2/"
+HIVESIGNER_API_BASE_URL = "https://hivesigner.com/api/"
+
+# Broadcasts are queued in the outbox and sent by the broadcast_outbox
+# command. Failed broadcasts are retried with exponential backoff.
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_BASE = 5
+OUTBOX_BACKOFF_MAX = 600
+
+# Poll data fetched from the chain is cached for this long (seconds).
+CHAIN_DATA_CACHE_TTL = 300
+
+# Poll result summaries are shared between concurrent requests.
+# Requests waiting longer than the budget (seconds) get the last good result.
+# Configure a shared CACHES backend in production, the default LocMemCache
+# only coalesces the requests of the same process.
+POLL_SUMMARY_CACHE_TTL = 60
+POLL_SUMMARY_WAIT_BUDGET = 2
+
+# Vote transactions failing on a database lock are retried this many times,
+# waiting DB_LOCK_RETRY_DELAY * attempt seconds in between.
+DB_LOCK_RETRIES = 3
+DB_LOCK_RETRY_DELAY = 0.05
+
+# Per request SQL/RPC stats. Requests slower than the threshold (ms) are
+# logged with their most repeated SQL statements.
+SERVER_TIMING_HEADER = True
+SLOW_REQUEST_THRESHOLD_MS = 1000
+SLOW_REQUEST_TOP_QUERIES = 5
+
+# Change feed page sizes. Entries younger than the settle time (seconds)
+# are held back until the transactions writing them are committed. The
+# transactions running longer than that aren't waited for, see
+# ChangeFeedView.
+CHANGE_FEED_PAGE_SIZE = 100
+CHANGE_FEED_MAX_PAGE_SIZE = 1000
+CHANGE_FEED_SETTLE_SECONDS = 2
+
+# Live results (server-sent events): the change log is checked for new
+# votes every LIVE_RESULTS_POLL_INTERVAL seconds, idle streams get a
+# keepalive comment every LIVE_RESULTS_KEEPALIVE seconds and streams are
+# closed after LIVE_RESULTS_MAX_DURATION seconds (clients reconnect).
+LIVE_RESULTS_POLL_INTERVAL = 1
+LIVE_RESULTS_KEEPALIVE = 15
+LIVE_RESULTS_MAX_DURATION = 300
+LIVE_RESULTS_RETRY_MS = 3000
+# Every stream holds a worker thread until it ends. Over this many streams
+# per process, clients get a 503 telling them to poll the results API
+# every LIVE_RESULTS_FALLBACK_INTERVAL seconds instead.
+LIVE_RESULTS_MAX_STREAMS = 20
+LIVE_RESULTS_FALLBACK_INTERVAL = 5
+
+# Full-text search backend (dotted path). Picked by the database vendor
+# if it's not set, see polls.search.
+SEARCH_BACKEND = None
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Maximum number of users/polls looked up in a single batch API request
+BATCH_LOOKUP_MAX_KEYS = 200
+
+# Staff users can profile any page with ?profile. Management commands
+# accept --profile PATH. Reports list this many functions.
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_REPORT_LIMIT = 50
+
+# Metrics of every worker are dumped to this directory every
+# METRICS_FLUSH_INTERVAL seconds by a background thread, and summed up by
+# the /metrics endpoint. Leave it None for a single process.
+METRICS_MULTIPROC_DIR = None
+METRICS_FLUSH_INTERVAL = 1
+
+# /metrics and /export/<kind>/ are served to the staff users, and to the
+# clients sending "Authorization: Bearer <token>" if a token is set.
+METRICS_TOKEN = None
+EXPORT_TOKEN = None
+
+# the request log lines are dropped while running the tests, assertLogs
+# still captures them.
+TESTING = sys.argv[1:2] == ['test']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.NullHandler' if TESTING
+            else 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'dpoll.requests': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 
 try:
     from .local_settings import *
@@ -166,7 +271,7 @@ except ImportError:
     pass
 
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'polls.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
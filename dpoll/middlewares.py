@@ -1,7 +1,21 @@
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import ExitStack
 from urllib.parse import urlparse
 
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
 from django.utils.deprecation import MiddlewareMixin
 
+from base.profiling import Profiler
+from polls.clients import record_calls
+from polls.metrics import VIEW_DB_QUERIES, VIEW_LATENCY, registry
+
+logger = logging.getLogger("dpoll.requests")
+
 
 class LoginReferrerMiddleware(MiddlewareMixin):
 
@@ -16,3 +30,130 @@ class LoginReferrerMiddleware(MiddlewareMixin):
                     'HTTP_REFERER']
         except IndexError as e:
             pass
+
+
+class RequestStats:
+    """SQL and RPC stats of a single request."""
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0
+        self.rpc_count = 0
+        self.rpc_time = 0
+        # sql -> [count, total time]
+        self.statements = defaultdict(lambda: [0, 0])
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper. See connection.execute_wrapper()."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.sql_count += 1
+            self.sql_time += duration
+            self.statements[sql][0] += 1
+            self.statements[sql][1] += duration
+
+    def add_rpc(self, duration):
+        self.rpc_count += 1
+        self.rpc_time += duration
+
+    def top_statements(self, limit):
+        """Return the most repeated statements as (count, ms, sql) tuples."""
+        repeated = [
+            (count, round(duration * 1000, 2), sql)
+            for sql, (count, duration) in self.statements.items()]
+        repeated.sort(key=lambda row: (row[0], row[1]), reverse=True)
+        return repeated[:limit]
+
+
+class RequestStatsMiddleware:
+    """
+    Records the query count, SQL time, RPC call count and RPC time of
+    every request. Reports them with a Server-Timing header, a JSON
+    log line and the view metrics. Requests slower than
+    SLOW_REQUEST_THRESHOLD_MS are logged as warnings, with the most
+    repeated SQL statements (N+1 loops). RPC calls are counted if they
+    are made with the clients of polls.clients.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        registry.start_flusher()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            stack.enter_context(record_calls(stats))
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        if settings.SERVER_TIMING_HEADER:
+            response["Server-Timing"] = ", ".join([
+                f'sql;dur={stats.sql_time * 1000:.2f};'
+                f'desc="{stats.sql_count} queries"',
+                f'rpc;dur={stats.rpc_time * 1000:.2f};'
+                f'desc="{stats.rpc_count} calls"',
+                f'total;dur={total * 1000:.2f}',
+            ])
+
+        self.log(request, response, stats, total)
+        self.observe(request, stats, total)
+        return response
+
+    def observe(self, request, stats, total):
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        VIEW_LATENCY.observe(total, view=view)
+        VIEW_DB_QUERIES.inc(stats.sql_count, view=view)
+
+    def log(self, request, response, stats, total):
+        line = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(total * 1000, 2),
+            "sql_count": stats.sql_count,
+            "sql_ms": round(stats.sql_time * 1000, 2),
+            "rpc_count": stats.rpc_count,
+            "rpc_ms": round(stats.rpc_time * 1000, 2),
+        }
+        if total * 1000 < settings.SLOW_REQUEST_THRESHOLD_MS:
+            logger.info(json.dumps(line))
+            return
+        line["slow"] = True
+        line["top_queries"] = [
+            {"count": count, "ms": ms, "sql": sql}
+            for count, ms, sql in stats.top_statements(
+                settings.SLOW_REQUEST_TOP_QUERIES)]
+        logger.warning(json.dumps(line))
+
+
+class ProfilerMiddleware:
+    """
+    Staff users can append ?profile to any URL to get a cProfile report of
+    the request, with its SQL query log, instead of the response.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.PROFILE_QUERY_PARAM not in request.GET or \
+                not request.user.is_staff:
+            return self.get_response(request)
+
+        profiler = Profiler(f"{request.method} {request.get_full_path()}")
+        with profiler:
+            response = self.get_response(request)
+            if hasattr(response, "render") and callable(response.render):
+                # include the template rendering in the profile
+                response.render()
+        return HttpResponse(
+            f"Response status: {response.status_code}\n"
+            + profiler.report(),
+            content_type="text/plain; charset=utf-8")
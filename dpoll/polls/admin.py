@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import User, Question, Choice, PromotionTransaction, VoteAudit
+from .models import (
+    User, Question, Choice, PromotionTransaction, VoteAudit, PollResultSnapshot,
+    OutboxOperation, ChangeLogEntry, PollTag, TagPopularity,
+    TagPopularityRefresh)
 from django.contrib.auth.admin import UserAdmin
 
 
@@ -20,8 +23,21 @@ class VoteAuditAdmin(admin.ModelAdmin):
     exclude = ('choices', )
 
 
+class OutboxOperationAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'username', 'permlink', 'status', 'attempts',
+                    'created_at')
+    list_filter = ('status', 'kind')
+    exclude = ('access_token', )
+
+
 admin.site.register(User, MyUserAdmin)
 admin.site.register(Question)
 admin.site.register(Choice)
 admin.site.register(PromotionTransaction)
 admin.site.register(VoteAudit, VoteAuditAdmin)
+admin.site.register(PollResultSnapshot)
+admin.site.register(OutboxOperation, OutboxOperationAdmin)
+admin.site.register(ChangeLogEntry)
+admin.site.register(PollTag)
+admin.site.register(TagPopularity)
+admin.site.register(TagPopularityRefresh)
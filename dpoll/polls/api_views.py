@@ -1,31 +1,94 @@
+from datetime import timedelta
+
+from dateutil.parser import parse
+from django.conf import settings
+from django.db.models import Count, Prefetch
 from django.http import Http404
+from django.utils.decorators import method_decorator
+from django.utils.timezone import now
+from django.views.decorators.http import condition
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ViewSet
 from rest_framework.views import APIView
 from rest_framework.mixins import RetrieveModelMixin, ListModelMixin
 
-from .models import Question, User, VoteAudit
+from base.utils import add_tz_info
+from .models import Question, Choice, User, VoteAudit, ChangeLogEntry, \
+    TagPopularity
 from sponsors.models import Sponsor
 from .serializers import (
     QuestionSerializer, SponsorSerializer, UserSerializer,
-    UserDetailSerializer,
+    UserDetailSerializer, UserCompactSerializer, QuestionCompactSerializer,
+    TagPopularitySerializer,
 )
-from .views import TEAM_MEMBERS
+from .pagination import QUESTION_ORDERINGS
+from .search import get_backend as get_search_backend
+from .utils import get_poll_etag, get_poll_last_modified, get_votes_summary
+from .views import TEAM_MEMBERS, get_result_filters
+
+
+def question_lookup(request, pk):
+    try:
+        return {"pk": int(pk)}
+    except ValueError:
+        return {
+            "username": pk,
+            "permlink": request.query_params.get("permlink"),
+        }
+
+
+def question_etag(request, pk):
+    return get_poll_etag(request, **question_lookup(request, pk))
+
+
+def question_last_modified(request, pk):
+    return get_poll_last_modified(request, **question_lookup(request, pk))
+
+
+def audit_lookup(request):
+    return {
+        "username": request.query_params.get("username"),
+        "permlink": request.query_params.get("permlink"),
+    }
+
+
+def audit_etag(request):
+    return get_poll_etag(request, **audit_lookup(request))
+
+
+def audit_last_modified(request):
+    return get_poll_last_modified(request, **audit_lookup(request))
 
 
 class QuestionViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
     serializer_class = QuestionSerializer
-    queryset = Question.objects.all().order_by("-id")
+    queryset = Question.objects.all().select_related(
+        "result_snapshot").prefetch_related(
+        "choices__voted_users").order_by("-id")
+
+    def get_keyset_ordering(self, request):
+        order = request.query_params.get("order")
+        return QUESTION_ORDERINGS.get(order, QUESTION_ORDERINGS["new"])
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list" and \
+                self.request.query_params.get("order") == "promoted":
+            queryset = queryset.filter(promotion_amount__gt=0)
+        return queryset
 
+    @method_decorator(condition(
+        etag_func=question_etag, last_modified_func=question_last_modified))
     def retrieve(self, request, *args, **kwargs):
 
         try:
             try:
                 pk = int(kwargs.get("pk"))
-                account = Question.objects.get(pk=pk)
+                account = self.get_queryset().get(pk=pk)
             except ValueError as e:
                 # fallback to {uuid}
-                account = Question.objects.get(
+                account = self.get_queryset().get(
                     username=kwargs.get("pk"),
                     permlink=self.request.query_params.get("permlink"),
                 )
@@ -34,6 +97,49 @@ class QuestionViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
 
         return Response(QuestionSerializer(account).data)
 
+    @action(detail=True)
+    @method_decorator(condition(
+        etag_func=question_etag, last_modified_func=question_last_modified))
+    def results(self, request, *args, **kwargs):
+        """
+        Per choice vote counts, stake sums and percentages of the poll.
+        Accepts the filters of the detail page: rep, sp, age, post_count,
+        community and stake_based (1: SP, 2: square-root of vests).
+        """
+        try:
+            question = Question.objects.get(
+                **question_lookup(request, kwargs.get("pk")))
+        except Question.DoesNotExist:
+            raise Http404
+
+        filters = get_result_filters(request.query_params)
+        _, choice_list_ordered, choices_selected, filter_exists, \
+            all_votes = get_votes_summary(question, **filters)
+
+        choices = []
+        for choice in choice_list_ordered:
+            voters = choice["voters"]
+            choices.append({
+                "id": choice["id"],
+                "text": choice["text"],
+                "voter_count": len(voters),
+                "vote_count": choice["vote_count"],
+                "sp": sum(user["sp"] for user in voters),
+                "vests": sum(user["vests"] for user in voters),
+                "percent": choice["percent"],
+            })
+
+        return Response({
+            "id": question.id,
+            "username": question.username,
+            "permlink": question.permlink,
+            "filters": filters,
+            "filters_applied": filter_exists,
+            "all_votes": float(all_votes),
+            "choices_selected": choices_selected,
+            "choices": choices,
+        })
+
 
 class TeamView(ViewSet):
     def list(self, request, format=None):
@@ -42,6 +148,7 @@ class TeamView(ViewSet):
 class SponsorViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
     serializer_class = SponsorSerializer
     queryset = Sponsor.objects.all().order_by("-delegation_amount")
+    keyset_ordering = ("delegation_amount", "id")
 
 
 class UserViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
@@ -62,6 +169,8 @@ class AuditView(APIView):
 
     queryset = VoteAudit.objects.all()
 
+    @method_decorator(condition(
+        etag_func=audit_etag, last_modified_func=audit_last_modified))
     def get(self, request, **kwargs):
 
         try:
@@ -69,7 +178,9 @@ class AuditView(APIView):
                 username=request.query_params.get("username"),
                 permlink=request.query_params.get("permlink")
             )
-            vote_logs = VoteAudit.objects.filter(question=question)
+            vote_logs = VoteAudit.objects.filter(
+                question=question).select_related(
+                "voter").prefetch_related("choices")
         except (Question.DoesNotExist, VoteAudit.DoesNotExist):
             raise Http404
 
@@ -88,3 +199,188 @@ class AuditView(APIView):
             })
 
         return Response(audit)
+
+
+class ChangeFeedView(APIView):
+    """
+    Changes after a sequence number (?since=) or a time (?since_time=),
+    oldest first. Consumers pass the returned last_seq as the next since.
+
+    The newest CHANGE_FEED_SETTLE_SECONDS of the log are held back, so
+    the changes of the transactions still in progress aren't skipped.
+    SQLite commits the writers one at a time, so the ids are committed in
+    order there. With concurrent writers (PostgreSQL), ids are assigned at
+    insert time. An entry of a transaction running longer than the settle
+    time can commit after a higher id is served, and the consumers that
+    already moved past it skip it.
+    """
+
+    def get(self, request, **kwargs):
+        entries = ChangeLogEntry.objects.filter(
+            created_at__lte=now() - timedelta(
+                seconds=settings.CHANGE_FEED_SETTLE_SECONDS))
+        try:
+            since = int(request.query_params.get("since", 0))
+            limit = min(int(request.query_params.get(
+                "limit", settings.CHANGE_FEED_PAGE_SIZE)),
+                settings.CHANGE_FEED_MAX_PAGE_SIZE)
+            if limit <= 0:
+                raise ValueError("limit must be positive")
+            if request.query_params.get("since_time"):
+                entries = entries.filter(created_at__gt=add_tz_info(
+                    parse(request.query_params["since_time"])))
+        except (ValueError, OverflowError):
+            return Response({"detail": "Invalid parameters."}, status=400)
+
+        changes = list(entries.filter(id__gt=since).order_by(
+            "id")[:limit + 1])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        return Response({
+            "last_seq": changes[-1].id if changes else since,
+            "has_more": has_more,
+            "results": [change.to_dict() for change in changes],
+        })
+
+
+def with_compact_choices(questions):
+    """Prefetch the choices and their vote counts for
+    QuestionCompactSerializer with a single query."""
+    return questions.prefetch_related(Prefetch(
+        "choices",
+        queryset=Choice.objects.annotate(
+            vote_count=Count("voted_users")).order_by("id"),
+    ))
+
+
+def get_batch_keys(request, name):
+    """
+    Read the lookup keys from a comma separated query parameter (GET) or
+    a JSON list (POST). Returns None if there are too many keys.
+    """
+    if request.method == "POST":
+        keys = request.data.get(name) or []
+        if not isinstance(keys, list):
+            keys = []
+    else:
+        keys = request.query_params.get(name, "").split(",")
+    keys = list(dict.fromkeys(str(k).strip() for k in keys if k))
+    if len(keys) > settings.BATCH_LOOKUP_MAX_KEYS:
+        return None
+    return keys
+
+
+def batch_response(keys, found):
+    return Response({
+        "results": found,
+        "missing": [key for key in keys if key not in found],
+    })
+
+
+class UserBatchView(APIView):
+    """
+    Look up many users at once: ?usernames=a,b or a POST with
+    {"usernames": [...]}. Answers with a single query.
+    """
+
+    def get(self, request, **kwargs):
+        usernames = get_batch_keys(request, "usernames")
+        if usernames is None:
+            return Response(
+                {"detail": f"At most {settings.BATCH_LOOKUP_MAX_KEYS} "
+                           f"usernames are allowed."}, status=400)
+
+        users = User.objects.in_bulk(usernames, field_name="username")
+        return batch_response(usernames, {
+            username: UserCompactSerializer(user).data
+            for username, user in users.items()})
+
+    def post(self, request, **kwargs):
+        return self.get(request, **kwargs)
+
+
+class QuestionBatchView(APIView):
+    """
+    Look up many polls at once: ?polls=author/permlink,... or a POST with
+    {"polls": ["author/permlink", ...]}. Answers with two queries, one for
+    the polls and one for their choices.
+    """
+
+    def get(self, request, **kwargs):
+        keys = get_batch_keys(request, "polls")
+        if keys is None:
+            return Response(
+                {"detail": f"At most {settings.BATCH_LOOKUP_MAX_KEYS} "
+                           f"polls are allowed."}, status=400)
+
+        pairs = [key.split("/", 1) for key in keys if "/" in key]
+        questions = with_compact_choices(Question.objects.filter(
+            username__in={author for author, _ in pairs},
+            permlink__in={permlink for _, permlink in pairs},
+        )) if pairs else []
+
+        # author__in and permlink__in may match more polls than asked.
+        keys_set = set(keys)
+        return batch_response(keys, {
+            f"{question.username}/{question.permlink}":
+                QuestionCompactSerializer(question).data
+            for question in questions
+            if f"{question.username}/{question.permlink}" in keys_set})
+
+    def post(self, request, **kwargs):
+        return self.get(request, **kwargs)
+
+
+class SearchView(APIView):
+    """
+    Full-text search over the poll questions, descriptions and choices:
+    ?q=<terms>&limit=&offset=. Results are ordered by relevance.
+    """
+
+    def get(self, request, **kwargs):
+        try:
+            limit = min(
+                int(request.query_params.get(
+                    "limit", settings.SEARCH_PAGE_SIZE)),
+                settings.SEARCH_MAX_PAGE_SIZE)
+            offset = int(request.query_params.get("offset", 0))
+        except ValueError:
+            return Response({"detail": "Invalid limit or offset."},
+                            status=400)
+        if limit < 1 or offset < 0:
+            return Response({"detail": "Invalid limit or offset."},
+                            status=400)
+
+        query = request.query_params.get("q", "")
+        ids = get_search_backend().search(query, limit, offset)
+        questions = with_compact_choices(
+            Question.objects.filter(pk__in=ids)).in_bulk()
+        return Response({
+            "query": query,
+            "results": [QuestionCompactSerializer(questions[pk]).data
+                        for pk in ids if pk in questions],
+        })
+
+
+class TagViewSet(ListModelMixin, GenericViewSet):
+    """
+    Tags ordered by popularity, and the polls of a tag, newest first:
+    /api/v1/tags/ and /api/v1/tags/<tag>/questions/.
+    """
+    serializer_class = TagPopularitySerializer
+    queryset = TagPopularity.objects.all()
+    lookup_field = "tag"
+    lookup_value_regex = "[^/]+"
+
+    def get_keyset_ordering(self, request):
+        if self.action == "questions":
+            return ("id",)
+        return ("poll_count", "id")
+
+    @action(detail=True)
+    def questions(self, request, *args, **kwargs):
+        questions = with_compact_choices(Question.objects.filter(
+            poll_tags__tag=kwargs["tag"].lower(), is_deleted=False))
+        page = self.paginate_queryset(questions)
+        return self.get_paginated_response(
+            QuestionCompactSerializer(page, many=True).data)
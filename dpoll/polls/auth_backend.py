@@ -1,4 +1,5 @@
-from steemconnect.client import Client
+from django.conf import settings
+from .clients import HivesignerClient
 from django.contrib.auth import get_user_model
 
 
@@ -10,7 +11,7 @@ class SteemConnectBackend:
             return None
 
         # validate the access token with /me endpoint and get user information
-        client = Client(access_token=kwargs.get("access_token"), oauth_base_url="https://hivesigner.com/oauth2/", sc2_api_base_url="https://hivesigner.com/api/")
+        client = HivesignerClient(access_token=kwargs.get("access_token"), oauth_base_url=settings.HIVESIGNER_OAUTH_BASE_URL, sc2_api_base_url=settings.HIVESIGNER_API_BASE_URL)
 
         user = client.me()
         if 'name' not in user:
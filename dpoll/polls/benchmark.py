@@ -0,0 +1,199 @@
+"""
+Synthetic data generator and benchmarks of the poll tally and list paths.
+
+Used by the `benchmark` management command. Results are plain dicts, so
+they can be stored as JSON and compared across commits.
+"""
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from communities.models import Community
+from sponsors.models import Sponsor
+from .models import Question, Choice, User, VoteAudit
+
+# votes_summary() keyword arguments of every filter/stake mode
+SUMMARY_MODES = {
+    "summary_plain": {},
+    "summary_stake": {"stake_based": True},
+    "summary_sa_stake": {"sa_stake_based": True},
+    "summary_filtered": {"rep": 50, "sp": 100, "age": 30, "post_count": 10},
+    "summary_filtered_stake": {"rep": 50, "sp": 100, "stake_based": True},
+    "summary_community": {"community": "community-0"},
+}
+
+
+def generate_data(polls=20, choices=5, voters=200, seed=1):
+    """
+    Create `polls` polls with `choices` choices each and `voters` voters
+    with realistic account stats, and vote on every poll with a random
+    subset of the voters. Uses bulk inserts, so it's fast enough for
+    large datasets.
+    """
+    rnd = random.Random(seed)
+    created_at = now()
+
+    users = []
+    for i in range(voters):
+        # SP is heavy tailed: most accounts are small, a few are whales.
+        sp = round(rnd.lognormvariate(4.5, 2), 3)
+        users.append(User(
+            username=f"voter{i}",
+            reputation=round(min(max(rnd.gauss(50, 10), 25), 80), 4),
+            sp=sp,
+            vests=round(sp * 1800, 6),
+            post_count=int(rnd.lognormvariate(4, 1.5)),
+            account_age=rnd.randint(1, 2500),
+        ))
+    User.objects.bulk_create(users, batch_size=400)
+    users = list(User.objects.filter(username__startswith="voter"))
+
+    for i in range(3):
+        members = rnd.sample(users, len(users) // (i + 2))
+        Community.objects.create(
+            name=f"community-{i}",
+            members="\n".join(u.username for u in members))
+
+    Question.objects.bulk_create([
+        Question(
+            text=f"Benchmark poll {i}",
+            username=users[i % len(users)].username,
+            permlink=f"benchmark-poll-{i}",
+            expire_at=created_at + timedelta(days=7),
+            allow_multiple_choices=i % 3 == 0,
+            promotion_amount=rnd.choice([None, None, 1, 5]),
+        ) for i in range(polls)
+    ], batch_size=400)
+    questions = list(Question.objects.filter(
+        permlink__startswith="benchmark-poll-"))
+
+    Choice.objects.bulk_create([
+        Choice(question=question, text=f"Choice {j}")
+        for question in questions for j in range(choices)
+    ], batch_size=400)
+
+    votes = []
+    audits = []
+    for question in questions:
+        question_choices = list(question.choices.all())
+        poll_voters = rnd.sample(
+            users, rnd.randint(max(len(users) // 4, 1), len(users)))
+        for user in poll_voters:
+            picked = [rnd.choice(question_choices)]
+            if question.allow_multiple_choices and rnd.random() < 0.3:
+                picked = rnd.sample(
+                    question_choices, min(2, len(question_choices)))
+            for choice in picked:
+                votes.append(Choice.voted_users.through(
+                    choice_id=choice.id, user_id=user.id))
+            audits.append(VoteAudit(
+                question=question, voter=user,
+                block_id=rnd.randint(1, 10 ** 8), trx_id=f"{rnd.getrandbits(64):x}"))
+        question.voter_count = len(poll_voters)
+    Choice.voted_users.through.objects.bulk_create(votes, batch_size=400)
+    VoteAudit.objects.bulk_create(audits, batch_size=400)
+    Question.objects.bulk_update(questions, ["voter_count"], batch_size=400)
+
+    Sponsor.objects.bulk_create([
+        Sponsor(
+            username=users[i].username,
+            delegation_amount=rnd.lognormvariate(12, 2),
+            created_at=created_at,
+            modified_at=created_at,
+        ) for i in range(min(len(users), 50))
+    ])
+
+    return {"polls": len(questions), "voters": len(users), "votes": len(votes)}
+
+
+def measure(fn, repeat=3):
+    """Run fn `repeat` times with a cold cache. Returns timing stats and
+    the query count of the last run."""
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = len(ctx.captured_queries)
+    return {
+        "wall_ms_min": round(min(timings), 3),
+        "wall_ms_median": round(statistics.median(timings), 3),
+        "queries": queries,
+    }
+
+
+def get_cases():
+    """Return the benchmark cases as {name: callable}."""
+    question = Question.objects.order_by("-voter_count").first()
+    voter = User.objects.annotate(
+        votes=Count("choice")).order_by("-votes").first()
+    client = Client()
+
+    def get(url):
+        def fn():
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return fn
+
+    def summary(kwargs):
+        def fn():
+            # a fresh instance, so nothing is cached on the model
+            Question.objects.get(pk=question.pk).votes_summary(**kwargs)
+        return fn
+
+    cases = {name: summary(kwargs) for name, kwargs in SUMMARY_MODES.items()}
+    detail_url = f"/detail/@{question.username}/{question.permlink}/"
+    cases.update({
+        "view_detail": get(detail_url),
+        "view_detail_stake": get(detail_url + "?stake_based=1"),
+        "view_detail_filtered": get(detail_url + "?rep=50&sp=100"),
+        "view_index": get("/"),
+        "view_index_trending": get("/?order=trending"),
+        "view_profile": get(f"/user/@{voter.username}/"),
+        "view_profile_votes": get(f"/user/@{voter.username}/?tab=votes"),
+        "view_polls_by_vote_count": get("/polls_by_vote/"),
+        "api_questions": get("/api/v1/questions/"),
+        "api_users": get("/api/v1/users/"),
+        "api_sponsors": get("/api/v1/sponsors/"),
+    })
+    return cases
+
+
+def run_benchmarks(repeat=3, only=None):
+    results = {}
+    for name, fn in get_cases().items():
+        if only and name not in only:
+            continue
+        results[name] = measure(fn, repeat=repeat)
+    return results
+
+
+def compare_results(old, new, threshold=20):
+    """
+    Compare two benchmark results. Returns a list of
+    (case, old median, new median, change in percent, regressed) tuples.
+    A case regresses if it's slower by more than `threshold` percent or
+    issues more queries.
+    """
+    rows = []
+    for name, result in new.items():
+        if name not in old:
+            continue
+        old_ms = old[name]["wall_ms_median"]
+        new_ms = result["wall_ms_median"]
+        change = round(100 * (new_ms - old_ms) / old_ms, 1) if old_ms else 0
+        regressed = change > threshold or \
+            result["queries"] > old[name]["queries"]
+        rows.append((name, old_ms, new_ms, change, regressed))
+    return rows
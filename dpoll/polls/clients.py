@@ -0,0 +1,116 @@
+"""
+Hive RPC and hivesigner clients of the app.
+
+lightsteem and steemconnect call requests.post directly. These subclasses
+send the calls through an instrumented session instead, which reports
+the latency of every call to RPC_LATENCY and to the stats of the current
+request (see middlewares.RequestStatsMiddleware). Sessions are kept per
+thread, so the connections to the nodes are reused between the calls.
+"""
+import json
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import backoff
+import requests
+from lightsteem.client import Client as LightsteemClient
+from steemconnect.client import Client as SteemconnectClient
+from steemconnect.utils import requires_access_token
+
+from .metrics import RPC_LATENCY
+
+_local = threading.local()
+
+
+def rpc_method(request):
+    """Return the JSON-RPC method of a prepared request, or the URL path
+    for the REST calls (hivesigner)."""
+    try:
+        body = json.loads(request.body or "")
+    except (TypeError, ValueError):
+        return urlparse(request.url).path
+    if isinstance(body, list):
+        return "batch"
+    if not isinstance(body, dict) or "method" not in body:
+        return urlparse(request.url).path
+    if body["method"] == "call" and len(body.get("params") or []) > 1:
+        return f"{body['params'][0]}.{body['params'][1]}"
+    return str(body["method"])
+
+
+@contextmanager
+def record_calls(stats):
+    """Add the calls of this thread to stats.add_rpc() in the block."""
+    _local.stats = stats
+    try:
+        yield stats
+    finally:
+        _local.stats = None
+
+
+class InstrumentedSession(requests.Session):
+
+    def send(self, request, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            duration = time.perf_counter() - started
+            RPC_LATENCY.observe(
+                duration,
+                node=urlparse(request.url).netloc,
+                method=rpc_method(request),
+            )
+            stats = getattr(_local, "stats", None)
+            if stats is not None:
+                stats.add_rpc(duration)
+
+
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = InstrumentedSession()
+    return session
+
+
+class HiveClient(LightsteemClient):
+    """lightsteem Client sending the RPC calls with get_session()."""
+
+    @backoff.on_exception(backoff.expo,
+                          (requests.exceptions.Timeout,
+                           requests.exceptions.RequestException),
+                          max_tries=5)
+    def _send_request(self, url, request_data, timeout):
+        self.logger.info("Sending request: %s", request_data)
+        r = get_session().post(url, json=request_data, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+
+class HivesignerClient(SteemconnectClient):
+    """steemconnect Client sending the API calls of the app (me and
+    broadcast) with get_session()."""
+
+    @requires_access_token
+    def me(self):
+        url = urllib.parse.urljoin(self.sc2_api_base_url, "me/")
+        r = get_session().post(url, headers=self.headers)
+        return r.json()
+
+    @requires_access_token
+    def broadcast(self, operations):
+        url = urllib.parse.urljoin(self.sc2_api_base_url, "broadcast/")
+        headers = self.headers.copy()
+        headers.update({
+            "Content-Type": "application/json; charset=utf-8",
+        })
+        r = get_session().post(url, headers=headers, data=json.dumps({
+            "operations": operations,
+        }))
+        try:
+            return r.json()
+        except ValueError:
+            return r.content
@@ -0,0 +1,141 @@
+"""
+Streaming export of the polls, choices, votes and vote audits.
+
+Rows are read in keyset-paginated chunks (id > last id), so memory stays
+constant regardless of the dataset size. Used by the export view and the
+`export_data` management command.
+"""
+import csv
+import json
+
+from dateutil.parser import parse
+
+from base.utils import add_tz_info
+from .models import Question, Choice, VoteAudit
+
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_CHUNK_SIZE = 1000
+
+
+def iterate_chunks(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of value dicts ordered by id, one query per chunk."""
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by(
+            "id").values(*fields)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]["id"]
+
+
+def export_polls(questions, chunk_size):
+    for chunk in iterate_chunks(questions, [
+        "id", "username", "permlink", "text", "created_at", "expire_at",
+        "allow_multiple_choices", "voter_count", "promotion_amount",
+        "is_deleted",
+    ], chunk_size):
+        yield from chunk
+
+
+def export_choices(questions, chunk_size):
+    choices = Choice.objects.filter(question__in=questions)
+    for chunk in iterate_chunks(
+            choices, ["id", "question_id", "text"], chunk_size):
+        yield from chunk
+
+
+def export_votes(questions, chunk_size):
+    votes = Choice.voted_users.through.objects.filter(
+        choice__question__in=questions)
+    for chunk in iterate_chunks(votes, [
+        "id", "choice_id", "choice__question_id", "user_id",
+        "user__username",
+    ], chunk_size):
+        for row in chunk:
+            yield {
+                "id": row["id"],
+                "question_id": row["choice__question_id"],
+                "choice_id": row["choice_id"],
+                "user_id": row["user_id"],
+                "username": row["user__username"],
+            }
+
+
+def export_audits(questions, chunk_size):
+    audits = VoteAudit.objects.filter(question__in=questions)
+    for chunk in iterate_chunks(audits, [
+        "id", "question_id", "voter__username", "block_id", "trx_id",
+    ], chunk_size):
+        # choices of the whole chunk with a single query
+        choices = {}
+        for audit_id, choice_id in VoteAudit.choices.through.objects.filter(
+                voteaudit_id__in=[row["id"] for row in chunk]).order_by(
+                "id").values_list("voteaudit_id", "choice_id"):
+            choices.setdefault(audit_id, []).append(choice_id)
+        for row in chunk:
+            yield {
+                "id": row["id"],
+                "question_id": row["question_id"],
+                "voter": row["voter__username"],
+                "block_id": row["block_id"],
+                "trx_id": row["trx_id"],
+                "choice_ids": choices.get(row["id"], []),
+            }
+
+
+EXPORTS = {
+    "polls": export_polls,
+    "choices": export_choices,
+    "votes": export_votes,
+    "audits": export_audits,
+}
+
+
+def parse_filters(params):
+    """
+    Build the Question filters from min_id, max_id, created_after and
+    created_before parameters. Raises ValueError for the invalid values.
+    """
+    filters = {}
+    if params.get("min_id"):
+        filters["id__gte"] = int(params["min_id"])
+    if params.get("max_id"):
+        filters["id__lte"] = int(params["max_id"])
+    if params.get("created_after"):
+        filters["created_at__gte"] = add_tz_info(
+            parse(params["created_after"]))
+    if params.get("created_before"):
+        filters["created_at__lt"] = add_tz_info(
+            parse(params["created_before"]))
+    return filters
+
+
+def export_rows(kind, filters=None, chunk_size=EXPORT_CHUNK_SIZE):
+    questions = Question.objects.filter(**(filters or {})).values("id")
+    return EXPORTS[kind](questions, chunk_size)
+
+
+class Echo:
+    """File-like object returning the written value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def serialize_rows(rows, output_format):
+    """Yield the rows as NDJSON lines or CSV lines with a header."""
+    if output_format == "ndjson":
+        for row in rows:
+            yield json.dumps(row, default=str) + "\n"
+        return
+
+    writer = csv.writer(Echo())
+    header = None
+    for row in rows:
+        if header is None:
+            header = list(row.keys())
+            yield writer.writerow(header)
+        yield writer.writerow([
+            " ".join(map(str, value)) if isinstance(value, list) else value
+            for value in row.values()])
@@ -0,0 +1,231 @@
+"""
+Live poll results over Server-Sent Events.
+
+Every process has one ResultHub. A single background thread follows the
+change log (so the votes registered by the other worker processes are
+seen, too), recounts each changed poll once with a grouped query, and
+fans the per choice deltas out to all the subscribers of that poll.
+Votes registered in the same process wake the thread up immediately.
+
+Every stream holds a worker thread, so a process serves at most
+LIVE_RESULTS_MAX_STREAMS of them. The clients over the limit poll the
+results API instead.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.models import Count
+
+from .models import Question, Choice, ChangeLogEntry
+
+LIVE_KINDS = (ChangeLogEntry.KIND_VOTE, ChangeLogEntry.KIND_VOTE_REVERTED)
+
+logger = logging.getLogger("dpoll.live")
+
+
+class StreamLimitReached(Exception):
+    """The process serves LIVE_RESULTS_MAX_STREAMS streams already."""
+
+
+def get_tally(question_id):
+    """Return ({choice_id: vote count}, voter count) of a poll."""
+    counts = {choice_id: 0 for choice_id in Choice.objects.filter(
+        question_id=question_id).values_list("id", flat=True)}
+    counts.update(Choice.voted_users.through.objects.filter(
+        choice__question_id=question_id).order_by().values(
+        "choice_id").annotate(votes=Count("id")).values_list(
+        "choice_id", "votes"))
+    total = Question.objects.filter(pk=question_id).values_list(
+        "voter_count", flat=True).first() or 0
+    return counts, total
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class ResultHub:
+    """Broadcasts the result deltas of the polls to their subscribers."""
+
+    def __init__(self, poll_interval=None, queue_size=100):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.subscribers = {}
+        self.tallies = {}
+        self.last_seq = None
+        self.thread = None
+
+    def stream_count(self):
+        return sum(len(subscribers)
+                   for subscribers in self.subscribers.values())
+
+    def subscribe(self, question_id, max_streams=None):
+        """Return a queue receiving the deltas of the poll, and the
+        current tally as the first event. Raises StreamLimitReached if
+        there are max_streams subscribers already."""
+        with self.lock:
+            self.check_stream_limit(max_streams)
+            idle = not self.subscribers
+            tally = self.tallies.get(question_id)
+        if idle:
+            # the change log isn't followed without subscribers, the
+            # entries written in the meantime are already in the tallies.
+            last_seq = ChangeLogEntry.objects.order_by(
+                "-id").values_list("id", flat=True).first() or 0
+        if tally is None:
+            tally = get_tally(question_id)
+
+        subscriber = queue.Queue(self.queue_size)
+        with self.lock:
+            self.check_stream_limit(max_streams)
+            if idle and not self.subscribers:
+                self.last_seq = max(self.last_seq or 0, last_seq)
+            counts, total = self.tallies.setdefault(question_id, tally)
+            self.subscribers.setdefault(question_id, set()).add(subscriber)
+        subscriber.put(format_event("results", {
+            "choices": {str(pk): count for pk, count in counts.items()},
+            "total": total,
+        }))
+        return subscriber
+
+    def check_stream_limit(self, max_streams):
+        """Raise StreamLimitReached if there are max_streams subscribers.
+        Called with the lock held."""
+        if max_streams is not None and self.stream_count() >= max_streams:
+            raise StreamLimitReached()
+
+    def unsubscribe(self, question_id, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(question_id, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self.subscribers.pop(question_id, None)
+                self.tallies.pop(question_id, None)
+
+    def notify(self):
+        """Wake the hub up after a vote is registered in this process."""
+        self.wakeup.set()
+
+    def poll_once(self):
+        """Follow the change log and publish the deltas of the changed
+        polls with subscribers. Returns the number of events sent."""
+        entries = ChangeLogEntry.objects.filter(
+            id__gt=self.last_seq or 0).order_by("id").values_list(
+            "id", "kind", "question_id")
+        changed = set()
+        for seq, kind, question_id in entries:
+            self.last_seq = seq
+            if kind in LIVE_KINDS:
+                changed.add(question_id)
+
+        sent = 0
+        for question_id in changed:
+            with self.lock:
+                if question_id not in self.subscribers:
+                    continue
+                old_counts, _ = self.tallies[question_id]
+            # one tally per poll, regardless of the number of viewers.
+            counts, total = get_tally(question_id)
+            with self.lock:
+                self.tallies[question_id] = counts, total
+                subscribers = list(self.subscribers.get(question_id, ()))
+            events = [
+                format_event("delta", {
+                    "choice_id": pk, "count": count, "total": total})
+                for pk, count in counts.items()
+                if old_counts.get(pk) != count
+            ]
+            for subscriber in subscribers:
+                for event in events:
+                    try:
+                        subscriber.put_nowait(event)
+                    except queue.Full:
+                        # slow client, it gets the next deltas.
+                        break
+                    sent += 1
+        return sent
+
+    def run(self):
+        while True:
+            self.wakeup.wait(
+                self.poll_interval or settings.LIVE_RESULTS_POLL_INTERVAL)
+            self.wakeup.clear()
+            if not self.subscribers:
+                continue
+            close_old_connections()
+            self.run_once()
+
+    def run_once(self):
+        """Poll once, logging the database errors. Returns the number of
+        events sent."""
+        try:
+            return self.poll_once()
+        except DatabaseError:
+            # a failed round is retried with the next one.
+            logger.warning("Live results round failed.", exc_info=True)
+            return 0
+
+    def start(self):
+        """Start the thread, or restart it if it died on an error."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return self
+
+
+hub = ResultHub()
+
+
+class ResultStream:
+    """
+    The server-sent events of a poll: the current results, then the
+    deltas. Comments are sent while idle, so the proxies keep the
+    connection open. The stream ends after `max_duration` seconds, and
+    EventSource reconnects by itself.
+
+    The poll is subscribed to when the stream is created, so
+    StreamLimitReached is raised before the response starts. close()
+    unsubscribes, even if the stream was never iterated.
+    """
+
+    def __init__(self, question_id, keepalive=None, max_duration=None,
+                 hub=hub):
+        self.question_id = question_id
+        self.keepalive = keepalive or settings.LIVE_RESULTS_KEEPALIVE
+        self.max_duration = max_duration or \
+            settings.LIVE_RESULTS_MAX_DURATION
+        self.hub = hub
+        self.subscriber = hub.start().subscribe(
+            question_id, max_streams=settings.LIVE_RESULTS_MAX_STREAMS)
+        self.events = self.generate()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.events)
+
+    def generate(self):
+        # the stream doesn't use the database after subscribing, don't
+        # hold a connection per viewer.
+        if not connection.in_atomic_block:
+            connection.close()
+        yield f"retry: {settings.LIVE_RESULTS_RETRY_MS}\n\n"
+        deadline = time.monotonic() + self.max_duration
+        while time.monotonic() < deadline:
+            try:
+                yield self.subscriber.get(timeout=self.keepalive)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+
+    def close(self):
+        self.events.close()
+        self.hub.unsubscribe(self.question_id, self.subscriber)
@@ -0,0 +1,367 @@
+"""
+Offline load test harness for the login, vote and detail paths.
+
+Hivesigner and the Hive RPC node are replaced with a local stub server
+with configurable latency and error rate, the app is served by a
+threaded WSGI server, and virtual users drive it concurrently with
+requests. Used by the `loadtest` management command.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.servers.basehttp import ThreadedWSGIServer, \
+    WSGIRequestHandler, get_internal_wsgi_application
+from django.db import OperationalError
+from django.db.backends.signals import connection_created
+from django.utils.timezone import now
+
+from .models import Question, Choice
+from .utils import LOCK_ERRORS
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[int(round(p / 100 * (len(values) - 1)))]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Emulates hivesigner (/api/me/, /api/broadcast/) and the condenser API
+    of a Hive node (get_block, get_accounts, get_content,
+    get_dynamic_global_properties).
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        node = self.server.node
+        node.delay()
+        if node.fail():
+            return self.respond(
+                503, {"error": "unavailable",
+                      "error_description": "stub error"})
+
+        if self.path.startswith("/api/me"):
+            token = self.headers.get("Authorization", "")
+            if not token.startswith("loadtest-"):
+                return self.respond(401, {"error": "invalid_grant"})
+            return self.respond(200, {"name": token[len("loadtest-"):]})
+
+        if self.path.startswith("/api/broadcast"):
+            return self.respond(200, {"result": {
+                "block_num": node.next_block_num(),
+                "id": uuid.uuid4().hex}})
+
+        request = json.loads(body)
+        method = request["method"].split(".")[-1]
+        params = request.get("params") or []
+        result = getattr(node, f"rpc_{method}")(*params)
+        return self.respond(
+            200, {"jsonrpc": "2.0", "id": request.get("id"),
+                  "result": result})
+
+    def respond(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubNode:
+    """Local stand-in of hivesigner and a Hive node."""
+
+    def __init__(self, latency=0.05, error_rate=0, seed=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.blocks = {}
+        self.block_num = 1000
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.node = self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def delay(self):
+        if self.latency:
+            # +-50% jitter around the configured latency
+            with self.lock:
+                jitter = self.random.uniform(0.5, 1.5)
+            time.sleep(self.latency * jitter)
+
+    def fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def next_block_num(self):
+        with self.lock:
+            self.block_num += 1
+            return self.block_num
+
+    def add_transaction(self, operations):
+        """Put a transaction to a new block.
+        Returns (block_num, trx_id)."""
+        block_num = self.next_block_num()
+        trx_id = uuid.uuid4().hex
+        self.blocks[block_num] = {
+            "timestamp": now().strftime("%Y-%m-%dT%H:%M:%S"),
+            "transactions": [{
+                "transaction_id": trx_id,
+                "operations": operations,
+            }],
+        }
+        return block_num, trx_id
+
+    def rpc_get_block(self, block_num):
+        return self.blocks.get(block_num)
+
+    def rpc_get_accounts(self, usernames):
+        return [{
+            "name": username,
+            "vesting_shares": "2000000.000000 VESTS",
+            "created": "2018-01-01T00:00:00",
+            "post_count": 100,
+            "reputation": "27000000000",
+        } for username in usernames]
+
+    def rpc_get_dynamic_global_properties(self):
+        return {
+            "total_vesting_fund_steem": "150000000.000 STEEM",
+            "total_vesting_shares": "300000000000.000000 VESTS",
+        }
+
+    def rpc_get_content(self, author, permlink):
+        question = Question.objects.filter(
+            username=author, permlink=permlink).first()
+        if question is None:
+            return {"id": 0}
+        return {"id": question.pk, "json_metadata": question.json_metadata}
+
+
+class LockMonitor:
+    """
+    Database execute wrapper installed to every new connection. Counts the
+    queries, the write latency and the lock errors of all the threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.lock_errors = 0
+        self.write_times = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if any(error in str(e).lower() for error in LOCK_ERRORS):
+                with self.lock:
+                    self.lock_errors += 1
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            with self.lock:
+                self.queries += 1
+                if sql.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+                    self.write_times.append(duration)
+
+    def install(self, sender, connection, **kwargs):
+        connection.execute_wrappers.append(self)
+
+    def report(self):
+        return {
+            "queries": self.queries,
+            "writes": len(self.write_times),
+            "lock_errors": self.lock_errors,
+            "write_ms_p50": round(percentile(self.write_times, 50) * 1000, 2),
+            "write_ms_p99": round(percentile(self.write_times, 99) * 1000, 2),
+            "write_ms_max": round(max(self.write_times, default=0) * 1000, 2),
+        }
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class AppServer:
+    """Serves the Django app with the threaded WSGI server of runserver."""
+
+    def __init__(self):
+        self.server = ThreadedWSGIServer(
+            ("127.0.0.1", 0), QuietWSGIRequestHandler)
+        self.server.daemon_threads = True
+        self.server.set_app(get_internal_wsgi_application())
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def create_polls(count, choices=4):
+    polls = []
+    for i in range(count):
+        question = Question.objects.create(
+            text=f"Load test poll {i}",
+            username="loadtest-author",
+            permlink=f"load-test-poll-{i}",
+            expire_at=now() + timedelta(days=7),
+        )
+        for j in range(choices):
+            Choice.objects.create(question=question, text=f"Choice {j}")
+        polls.append((question, list(question.choices.all())))
+    return polls
+
+
+class VirtualUser:
+    """Logs in, views a poll, votes on it through the web form or the
+    sync endpoint, then views it again."""
+
+    def __init__(self, index, base_url, node, poll, sync, seed=1):
+        self.username = f"loaduser{index}"
+        self.base_url = base_url
+        self.node = node
+        self.question, self.choices = poll
+        self.sync = sync
+        self.random = random.Random(seed + index)
+        self.session = requests.Session()
+        self.timings = []
+
+    def step(self, name, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, self.base_url + path, allow_redirects=False,
+                timeout=60, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.timings.append((name, time.perf_counter() - started, ok))
+        return response
+
+    def run(self):
+        detail_path = f"/detail/@{self.question.username}/" \
+                      f"{self.question.permlink}/"
+        choice = self.random.choice(self.choices)
+
+        self.step("login", "GET",
+                  f"/login/?access_token=loadtest-{self.username}")
+        self.step("detail", "GET", detail_path)
+        if self.sync:
+            block_num, trx_id = self.node.add_transaction([["comment", {
+                "author": self.username,
+                "permlink": uuid.uuid4().hex,
+                "parent_author": self.question.username,
+                "parent_permlink": self.question.permlink,
+                "json_metadata": json.dumps({
+                    "content_type": "poll_vote",
+                    "votes": [choice.text],
+                }),
+            }]])
+            self.step("sync_vote", "GET", f"/web-api/sync/?block_num="
+                                          f"{block_num}&trx_id={trx_id}")
+        else:
+            self.step(
+                "vote", "POST",
+                f"/vote/@{self.question.username}/{self.question.permlink}/",
+                data={
+                    "choice-id": choice.pk,
+                    "csrfmiddlewaretoken": self.session.cookies.get(
+                        "csrftoken", ""),
+                })
+        self.step("detail", "GET", detail_path)
+        return self.timings
+
+
+def summarize(timings, elapsed):
+    steps = {}
+    for name, duration, ok in timings:
+        steps.setdefault(name, []).append((duration, ok))
+    report = {}
+    for name, rows in sorted(steps.items()):
+        durations = [d for d, _ in rows]
+        report[name] = {
+            "requests": len(rows),
+            "errors": sum(1 for _, ok in rows if not ok),
+            "rps": round(len(rows) / elapsed, 2) if elapsed else 0,
+            "p50_ms": round(percentile(durations, 50) * 1000, 2),
+            "p99_ms": round(percentile(durations, 99) * 1000, 2),
+        }
+    return report
+
+
+def run_load_test(app_url, node, users=50, concurrency=10, polls=5,
+                  sync_ratio=0.5, seed=1):
+    """
+    Drive `users` virtual users against the app at `app_url` with
+    `concurrency` parallel workers. Returns the report as a dict.
+    """
+    poll_list = create_polls(polls)
+    rnd = random.Random(seed)
+    virtual_users = [
+        VirtualUser(i, app_url, node, poll_list[i % len(poll_list)],
+                    sync=rnd.random() < sync_ratio, seed=seed)
+        for i in range(users)
+    ]
+
+    monitor = LockMonitor()
+    connection_created.connect(monitor.install)
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(VirtualUser.run, virtual_users))
+    finally:
+        connection_created.disconnect(monitor.install)
+    elapsed = time.perf_counter() - started
+
+    timings = [row for result in results for row in result]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "requests": len(timings),
+        "rps": round(len(timings) / elapsed, 2),
+        "errors": sum(1 for _, _, ok in timings if not ok),
+        "p50_ms": round(percentile([t[1] for t in timings], 50) * 1000, 2),
+        "p99_ms": round(percentile([t[1] for t in timings], 99) * 1000, 2),
+        "steps": summarize(timings, elapsed),
+        "db": monitor.report(),
+        "votes_registered": sum(
+            poll.voter_count for poll in Question.objects.filter(
+                pk__in=[question.pk for question, _ in poll_list])),
+    }
@@ -0,0 +1,109 @@
+import json
+import logging
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, \
+    teardown_test_environment
+from django.utils.timezone import now
+from polls.benchmark import generate_data, run_benchmarks, compare_results
+
+
+class Command(BaseCommand):
+    """A management command to benchmark the poll tally and list paths.
+
+    Creates a throwaway test database, fills it with synthetic polls,
+    choices and voters, then records the wall time and the query count
+    of votes_summary() in every mode, the views and the API list
+    endpoints. Results are written to a JSON file and can be compared
+    with the results of another commit.
+
+        python manage.py benchmark --output bench.json
+        python manage.py benchmark --compare bench.json
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=50)
+        parser.add_argument('--choices', type=int, default=5)
+        parser.add_argument('--voters', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--case', action='append', dest='cases',
+            help='Only run the given case. Can be used multiple times.')
+        parser.add_argument(
+            '--output', default='bench_output.json',
+            help='Path of the JSON file to write the results.')
+        parser.add_argument(
+            '--compare',
+            help='Path of a previous result file to compare with.')
+        parser.add_argument(
+            '--threshold', type=float, default=20,
+            help='Slowdown in percent reported as a regression.')
+
+    def handle(self, *args, **options):
+        # per request log lines would drown the report
+        logging.getLogger("dpoll.requests").setLevel(logging.WARNING)
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            dataset = generate_data(
+                polls=options["polls"],
+                choices=options["choices"],
+                voters=options["voters"],
+                seed=options["seed"],
+            )
+            print(f"Generated {dataset['polls']} polls, "
+                  f"{dataset['voters']} voters, {dataset['votes']} votes.")
+            results = run_benchmarks(
+                repeat=options["repeat"], only=options["cases"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in results.items():
+            print(f"{name:<28} {result['wall_ms_median']:>10.2f} ms "
+                  f"{result['queries']:>6} queries")
+
+        report = {
+            "meta": {
+                "commit": self.get_commit(),
+                "created_at": str(now()),
+                "dataset": dataset,
+                "options": {
+                    k: options[k] for k in
+                    ["polls", "choices", "voters", "repeat", "seed"]},
+            },
+            "results": results,
+        }
+        with open(options["output"], "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results are written to {options['output']}.")
+
+        if options["compare"]:
+            self.compare(options["compare"], results, options["threshold"])
+
+    def compare(self, path, results, threshold):
+        """Print the changes since the results in `path`. Raises
+        CommandError (non-zero exit) if any case regressed."""
+        with open(path) as f:
+            old_results = json.load(f)["results"]
+        regressions = 0
+        for name, old_ms, new_ms, change, regressed in compare_results(
+                old_results, results, threshold=threshold):
+            flag = "REGRESSION" if regressed else ""
+            regressions += regressed
+            print(f"{name:<28} {old_ms:>10.2f} -> {new_ms:>10.2f} ms "
+                  f"({change:+.1f}%) {flag}")
+        if regressions:
+            raise CommandError(f"{regressions} regressions found.")
+
+    def get_commit(self):
+        try:
+            return subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,95 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+from polls.models import OutboxOperation
+from polls.utils import get_user_sc_client
+
+
+class Command(BaseCommand):
+    """A management command to broadcast the queued operations.
+
+    Web requests queue their hivesigner broadcasts to the OutboxOperation
+    table. This worker sends them, retries the failures with exponential
+    backoff and confirms (or reverts) the related votes and polls.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the due operations once and exit.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help='Seconds to sleep when there is nothing to send.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.process_batch(options["batch_size"])
+            if options["once"]:
+                break
+            if not processed:
+                time.sleep(options["interval"])
+
+    def process_batch(self, batch_size):
+        operations = OutboxOperation.objects.filter(
+            status__in=[
+                OutboxOperation.STATUS_PENDING,
+                OutboxOperation.STATUS_SENDING,
+            ],
+            next_attempt_at__lte=now(),
+        ).order_by("id")[0:batch_size]
+
+        processed = 0
+        for operation in operations:
+            if not operation.claim():
+                continue
+            self.send(operation)
+            processed += 1
+        return processed
+
+    def send(self, operation):
+        retry_options = {
+            "max_attempts": settings.OUTBOX_MAX_ATTEMPTS,
+            "backoff_base": settings.OUTBOX_BACKOFF_BASE,
+            "backoff_max": settings.OUTBOX_BACKOFF_MAX,
+        }
+        sc_client = get_user_sc_client(operation.access_token)
+        try:
+            resp = sc_client.broadcast(json.loads(operation.operations))
+        except Exception as e:
+            print(f"{operation} failed: {e}")
+            operation.mark_retry(str(e), **retry_options)
+            return
+
+        # Steemconnect sometimes returns 503.
+        # https://github.com/steemscript/steemconnect/issues/356
+        if not isinstance(resp, dict):
+            print(f"{operation} failed: unexpected response.")
+            operation.mark_retry(
+                "Unexpected response from hivesigner.", **retry_options)
+            return
+
+        if 'error' in resp:
+            error = resp.get("error_description") or resp.get("error")
+            print(f"{operation} failed: {error}")
+            if 'The token has invalid role' in str(error):
+                # expired token, retrying doesn't help.
+                operation.mark_failed(error)
+            else:
+                operation.mark_retry(error, **retry_options)
+            return
+
+        operation.mark_sent(resp)
+        print(f"{operation} is broadcasted.")
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from polls.export import EXPORTS, EXPORT_FORMATS, EXPORT_CHUNK_SIZE, \
+    export_rows, parse_filters, serialize_rows
+
+
+class Command(BaseCommand):
+    """A management command to export the polls, choices, votes or vote
+    audits as NDJSON or CSV.
+
+    Rows are streamed in chunks, so the memory usage is constant.
+
+        python manage.py export_data votes --format csv --output votes.csv
+        python manage.py export_data polls --created-after 2020-01-01
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument(
+            '--format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument(
+            '--output', help='Path of the output file. Default: stdout.')
+        parser.add_argument('--min-id', help='Minimum poll id.')
+        parser.add_argument('--max-id', help='Maximum poll id.')
+        parser.add_argument(
+            '--created-after', help='Polls created at or after this time.')
+        parser.add_argument(
+            '--created-before', help='Polls created before this time.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_filters(options)
+        except (ValueError, OverflowError) as e:
+            raise CommandError(f"Invalid filter: {e}")
+
+        rows = serialize_rows(
+            export_rows(options["kind"], filters, options["chunk_size"]),
+            options["format"])
+        if not options["output"]:
+            sys.stdout.writelines(rows)
+            return
+        with open(options["output"], "w", newline="") as f:
+            f.writelines(rows)
@@ -0,0 +1,35 @@
+from base.profiling import ProfiledCommand
+from django.utils.timezone import now
+from polls.models import Question
+
+
+class Command(ProfiledCommand):
+    """A management command to freeze the final results of expired polls.
+
+    Expired polls can't receive new votes, so their results are computed
+    once and served from the PollResultSnapshot table afterwards.
+    Use --recompute to refresh the existing snapshots after the voter
+    stats (sp, vests, etc.) are updated.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recompute',
+            action='store_true',
+            help='Recompute the already frozen polls, too.',
+        )
+
+    def handle(self, *args, **options):
+        questions = Question.objects.filter(expire_at__lte=now())
+        if not options["recompute"]:
+            questions = questions.filter(result_snapshot__isnull=True)
+
+        for question in questions.order_by("id").iterator():
+            try:
+                question.freeze_results()
+            except Exception as e:
+                # voters without account info can't be tallied.
+                # skip the poll, it will be served live.
+                print(f"Couldn't freeze {question}: {e}")
+                continue
+            print(f"{question} is frozen.")
@@ -0,0 +1,37 @@
+from base.profiling import ProfiledCommand
+from polls.models import Question
+from polls.utils import set_poll_tags, fetch_poll_data_cached
+
+
+class Command(ProfiledCommand):
+    """A management command to import the tags of the existing polls.
+
+    Tags are read from the stored json_metadata. The polls created before
+    the metadata is stored locally are skipped, unless --fetch-missing is
+    given, which reads their tags from the chain.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fetch-missing',
+            action='store_true',
+            help='Fetch the tags of the polls without json_metadata from '
+                 'the chain.',
+        )
+
+    def handle(self, *args, **options):
+        imported = skipped = 0
+        for question in Question.objects.order_by("id").iterator():
+            tags = question.tags
+            if tags is None and options["fetch_missing"]:
+                try:
+                    tags = fetch_poll_data_cached(
+                        question.username, question.permlink).get("tags")
+                except Exception as e:
+                    print(f"{question.username}/{question.permlink}: {e}")
+            if tags is None:
+                skipped += 1
+                continue
+            set_poll_tags(question, tags)
+            imported += 1
+        print(f"Tags of {imported} polls are imported, {skipped} skipped.")
@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, \
+    teardown_test_environment, override_settings
+from polls.loadtest import StubNode, AppServer, run_load_test
+from polls.models import OutboxOperation
+
+
+class Command(BaseCommand):
+    """A management command to load test the login, vote and detail paths
+    offline.
+
+    Starts a stub hivesigner/Hive node with the given latency and error
+    rate, serves the app from a throwaway database with a threaded WSGI
+    server, and drives concurrent virtual users against it. Reports the
+    throughput, p50/p99 latency per step and the database lock contention.
+
+        python manage.py loadtest --users 200 --concurrency 20
+        python manage.py loadtest --latency 0.3 --error-rate 0.05
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--polls', type=int, default=5)
+        parser.add_argument(
+            '--sync-ratio', type=float, default=0.5,
+            help='Ratio of the users voting through the sync endpoint.')
+        parser.add_argument(
+            '--latency', type=float, default=0.05,
+            help='Latency of the stub hivesigner/RPC node in seconds.')
+        parser.add_argument(
+            '--error-rate', type=float, default=0,
+            help='Ratio of the stub calls failing with 503.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--output', help='Path of the JSON file to write the report.')
+
+    def handle(self, *args, **options):
+        node = StubNode(
+            latency=options["latency"],
+            error_rate=options["error_rate"],
+            seed=options["seed"],
+        ).start()
+
+        setup_test_environment()
+        directory = tempfile.mkdtemp()
+        if connection.vendor == "sqlite":
+            # in-memory databases can't be shared with the server threads
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                directory, "loadtest.sqlite3")
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        overrides = override_settings(
+            ALLOWED_HOSTS=["127.0.0.1"],
+            HIVE_NODES=[node.url],
+            HIVESIGNER_OAUTH_BASE_URL=node.url + "oauth2/",
+            HIVESIGNER_API_BASE_URL=node.url + "api/",
+        )
+        overrides.enable()
+        server = AppServer().start()
+        # loading the WSGI app configures the logging again.
+        # per request log lines would drown the report.
+        logging.getLogger("dpoll.requests").setLevel(logging.WARNING)
+        try:
+            report = run_load_test(
+                server.url, node,
+                users=options["users"],
+                concurrency=options["concurrency"],
+                polls=options["polls"],
+                sync_ratio=options["sync_ratio"],
+                seed=options["seed"],
+            )
+            # send the queued broadcasts through the stub, too.
+            call_command("broadcast_outbox", "--once", "--batch-size",
+                         str(options["users"]))
+            report["outbox"] = {
+                status: OutboxOperation.objects.filter(status=status).count()
+                for status, _ in OutboxOperation.STATUS_CHOICES}
+        finally:
+            server.stop()
+            node.stop()
+            overrides.disable()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.print_report(report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Report is written to {options['output']}.")
+
+    def print_report(self, report):
+        print(f"{report['requests']} requests in {report['elapsed_s']}s: "
+              f"{report['rps']} req/s, p50 {report['p50_ms']} ms, "
+              f"p99 {report['p99_ms']} ms, {report['errors']} errors")
+        for name, step in report["steps"].items():
+            print(f"  {name:<10} {step['requests']:>6} requests "
+                  f"{step['rps']:>8} req/s  p50 {step['p50_ms']:>8} ms  "
+                  f"p99 {step['p99_ms']:>8} ms  {step['errors']} errors")
+        db = report["db"]
+        print(f"DB: {db['queries']} queries, {db['writes']} writes, "
+              f"write p50 {db['write_ms_p50']} ms, "
+              f"p99 {db['write_ms_p99']} ms, max {db['write_ms_max']} ms, "
+              f"{db['lock_errors']} lock errors")
+        print(f"Votes registered: {report['votes_registered']}, "
+              f"outbox: {report['outbox']}")
@@ -0,0 +1,15 @@
+from base.profiling import ProfiledCommand
+from polls.search import get_backend
+
+
+class Command(ProfiledCommand):
+    """A management command to rebuild the full-text search index.
+
+    The index is kept in sync on the poll and choice changes. Run this
+    once after the migration to backfill the existing polls, and after
+    the bulk imports bypassing the model signals.
+    """
+
+    def handle(self, *args, **options):
+        count = get_backend().rebuild()
+        print(f"{count} polls are indexed.")
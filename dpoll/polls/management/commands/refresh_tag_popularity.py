@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from base.profiling import ProfiledCommand
+from polls.models import PollTag, TagPopularity, TagPopularityRefresh
+
+
+class Command(ProfiledCommand):
+    """A management command to refresh the tag popularity rollup.
+
+    Tag changes refresh the rollup on the fly, votes don't. This recounts
+    the tags of the polls modified since the last run of the command
+    (TagPopularityRefresh), so it's cheap to run frequently. Use --full to
+    recount every tag.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recount all the tags.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of tags recounted per query.',
+        )
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        tags = PollTag.objects.order_by()
+        last_refresh = TagPopularityRefresh.get_watermark()
+        if last_refresh and not options["full"]:
+            # a small overlap for the transactions running during the
+            # last refresh
+            tags = tags.filter(
+                question__modified_at__gte=last_refresh - timedelta(
+                    minutes=1))
+        tags = list(tags.values_list("tag", flat=True).distinct())
+
+        batch_size = options["batch_size"]
+        for i in range(0, len(tags), batch_size):
+            TagPopularity.refresh(tags[i:i + batch_size])
+        TagPopularityRefresh.set_watermark(started_at)
+        print(f"{len(tags)} tags are refreshed.")
@@ -0,0 +1,47 @@
+from base.profiling import ProfiledCommand
+from polls.models import Question
+
+
+class Command(ProfiledCommand):
+    """A management command to backfill the rendered poll descriptions.
+
+    Renders the descriptions with a missing or stale description_html and
+    writes them back in batches.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-render every description, even the fresh ones.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+        )
+
+    def handle(self, *args, **options):
+        questions = Question.objects.only(
+            "id", "description", "description_html", "description_hash",
+        ).order_by("id")
+
+        batch = []
+        updated = 0
+        for question in questions.iterator(chunk_size=options["batch_size"]):
+            if not options["force"] and \
+                    question.description_hash == \
+                    question.get_description_hash():
+                continue
+            batch.append(question.render_description())
+            if len(batch) >= options["batch_size"]:
+                updated += self.flush(batch)
+                batch = []
+        updated += self.flush(batch)
+
+        print(f"{updated} descriptions rendered.")
+
+    def flush(self, batch):
+        Question.objects.bulk_update(
+            batch, ["description_html", "description_hash"])
+        return len(batch)
@@ -1,5 +1,5 @@
 from dateutil.parser import parse
-from django.core.management.base import BaseCommand
+from base.profiling import ProfiledCommand
 from django.utils.timezone import now
 from lightsteem.client import Client as LightsteemClient
 from lightsteem.helpers.account import Account
@@ -14,7 +14,7 @@ def chunks(l, n):
         yield l[i:i + n]
 
 
-class Command(BaseCommand):
+class Command(ProfiledCommand):
     """A management command to update account data from the blockchain.
 
     Currently we update
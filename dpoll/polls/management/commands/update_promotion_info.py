@@ -1,4 +1,6 @@
-from django.core.management.base import BaseCommand
+from base.profiling import ProfiledCommand
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from polls.models import Question, PromotionTransaction
 from datetime import datetime
@@ -8,7 +10,7 @@ from lightsteem.datastructures import Operation
 
 from django.conf import settings
 
-class Command(BaseCommand):
+class Command(ProfiledCommand):
     """A management command to process promotion transaction.
     It only accepts SBD transfers. Refunds STEEM transfers automatically.
     """
@@ -113,11 +115,12 @@ class Command(BaseCommand):
                 promotion_transaction.save()
 
                 # update the related poll's promotion amount
-                if not question.promotion_amount:
-                    question.promotion_amount = float(amount.amount)
-                else:
-                    question.promotion_amount += float(amount.amount)
-                question.save()
+                Question.objects.filter(pk=question.pk).update(
+                    promotion_amount=Coalesce(
+                        F("promotion_amount"), 0.0) + float(amount.amount),
+                    version=F("version") + 1,
+                    modified_at=timezone.now(),
+                )
 
                 print(f"{author}/{permlink} promoted with "
                       f"{promotion_amount} STEEM.")
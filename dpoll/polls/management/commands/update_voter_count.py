@@ -1,11 +1,63 @@
 from django.core.management.base import BaseCommand
-from polls.models import Question
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils.timezone import now
+from polls.models import Question, Choice
 
 
 class Command(BaseCommand):
+    """A management command to recount the voter counts of the polls.
+
+    The unique voters of every poll are counted with a single grouped
+    query, and only the drifted polls are written back with chunked
+    bulk updates. Use --dry-run to list the drifted polls without
+    updating them.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the polls with a wrong voter count.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of polls updated per query.',
+        )
+
     def handle(self, *args, **options):
-        questions = Question.objects.all()
-        for question in Question.objects.all():
-            question.update_voter_count()
-            question.save()
-            print(f"{question} updated.")
\ No newline at end of file
+        counts = dict(
+            Choice.voted_users.through.objects.order_by().values(
+                'choice__question_id').annotate(
+                voters=Count('user_id', distinct=True)).values_list(
+                'choice__question_id', 'voters'))
+
+        drifted = []
+        total = 0
+        for pk, username, permlink, voter_count in \
+                Question.objects.order_by('id').values_list(
+                    'id', 'username', 'permlink', 'voter_count').iterator():
+            total += 1
+            actual = counts.get(pk, 0)
+            if voter_count != actual:
+                print(f"{username}/{permlink}: {voter_count} -> {actual}")
+                drifted.append((pk, actual))
+
+        print(f"{len(drifted)} of {total} polls have a wrong voter count.")
+        if options["dry_run"] or not drifted:
+            return
+
+        batch_size = options["batch_size"]
+        modified_at = now()
+        with transaction.atomic():
+            for i in range(0, len(drifted), batch_size):
+                Question.objects.bulk_update([
+                    # bump the version, so the cached pages are invalidated.
+                    Question(pk=pk, voter_count=actual,
+                             version=F('version') + 1,
+                             modified_at=modified_at)
+                    for pk, actual in drifted[i:i + batch_size]
+                ], ['voter_count', 'version', 'modified_at'])
+        print(f"{len(drifted)} polls updated.")
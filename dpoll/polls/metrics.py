@@ -0,0 +1,276 @@
+"""
+In-process metric collectors rendered in the Prometheus text format.
+
+Every process keeps its own values. When METRICS_MULTIPROC_DIR is set,
+processes dump their values to a file in that directory, and the
+/metrics endpoint sums the files of all the workers.
+"""
+import atexit
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+        self.flusher = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def register_collector(self, fn):
+        """Register a function returning (metric, {labels: value}) tuples
+        computed at scrape time. Used for the gauges read from the db.
+        """
+        self.collectors.append(fn)
+        return fn
+
+    def dump(self):
+        with self.lock:
+            return {
+                name: [[list(k), v] for k, v in metric.values.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def values_path(self, directory):
+        return os.path.join(directory, f"metrics_{os.getpid()}.json")
+
+    def flush(self):
+        """Write the values of this process to the multiprocess dir."""
+        directory = settings.METRICS_MULTIPROC_DIR
+        if not directory:
+            return
+        path = self.values_path(directory)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.dump(), f)
+        os.replace(path + ".tmp", path)
+
+    def start_flusher(self):
+        """Flush the values every METRICS_FLUSH_INTERVAL seconds from a
+        background thread, and once more at exit, so the requests don't
+        write the files."""
+        if not settings.METRICS_MULTIPROC_DIR:
+            return
+        with self.lock:
+            if self.flusher is not None:
+                return
+            self.flusher = threading.Thread(
+                target=self.run_flusher, daemon=True)
+        self.flusher.start()
+        atexit.register(self.flush)
+
+    def run_flusher(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                # the directory may be gone while shutting down.
+                continue
+
+    def collect(self):
+        """Return {metric name: {label values: value}} of all workers."""
+        directory = settings.METRICS_MULTIPROC_DIR
+        if not directory:
+            dumps = [self.dump()]
+        else:
+            self.flush()
+            dumps = []
+            for path in glob.glob(os.path.join(directory, "metrics_*.json")):
+                try:
+                    with open(path) as f:
+                        dumps.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        merged = {name: {} for name in self.metrics}
+        for dump in dumps:
+            for name, values in dump.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for labels, value in values:
+                    labels = tuple(labels)
+                    merged[name][labels] = metric.merge(
+                        merged[name].get(labels), value)
+        return merged
+
+    def render(self):
+        lines = []
+        merged = self.collect()
+        for name, metric in self.metrics.items():
+            lines.extend(metric.render(merged[name]))
+        for collector in self.collectors:
+            for metric, values in collector():
+                lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def format_labels(labelnames, labels, extra=None):
+    pairs = list(zip(labelnames, labels))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        '{}="{}"'.format(k, str(v).replace("\\", r"\\").replace(
+            "\n", r"\n").replace('"', r'\"'))
+        for k, v in pairs]
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), register=True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        if register:
+            registry.register(self)
+
+    def label_values(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.label_values(labels)
+        with registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, current, value):
+        return (current or 0) + value
+
+    def render(self, values):
+        lines = self.header()
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}"
+                         f"{format_labels(self.labelnames, labels)} "
+                         f"{format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """A gauge set at scrape time by a registered collector."""
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames, register=False)
+
+
+class Histogram(Metric):
+    """
+    Keeps the cumulative bucket counts, the sum and the count as a list:
+    [bucket_0, ..., bucket_n, sum, count].
+    """
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self.label_values(labels)
+        with registry.lock:
+            values = self.values.get(key)
+            if values is None:
+                values = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def merge(self, current, value):
+        if current is None:
+            return list(value)
+        return [a + b for a, b in zip(current, value)]
+
+    def render(self, values):
+        lines = self.header()
+        for labels, value in sorted(values.items()):
+            for bound, count in zip(self.buckets, value):
+                bucket_labels = format_labels(
+                    self.labelnames, labels, ("le", format_value(bound)))
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            label_str = format_labels(self.labelnames, labels)
+            lines.append(
+                f"{self.name}_sum{label_str} {format_value(value[-2])}")
+            lines.append(f"{self.name}_count{label_str} {value[-1]}")
+        return lines
+
+
+VIEW_LATENCY = Histogram(
+    "dpoll_view_latency_seconds",
+    "Request latency per view.",
+    ["view"],
+)
+VIEW_DB_QUERIES = Counter(
+    "dpoll_view_db_queries_total",
+    "Database queries issued per view.",
+    ["view"],
+)
+VOTES_REGISTERED = Counter(
+    "dpoll_votes_registered_total",
+    "Votes registered to the database.",
+)
+RPC_LATENCY = Histogram(
+    "dpoll_rpc_latency_seconds",
+    "Latency of the calls to the Hive nodes and hivesigner.",
+    ["node", "method"],
+)
+CACHE_REQUESTS = Counter(
+    "dpoll_cache_requests_total",
+    "Cache lookups of the summary and chain data caches.",
+    ["cache", "result"],
+)
+OUTBOX_OPERATIONS = Gauge(
+    "dpoll_outbox_operations",
+    "Broadcast outbox operations per status.",
+    ["status"],
+)
+
+
+@registry.register_collector
+def collect_outbox():
+    from django.db.models import Count
+    from .models import OutboxOperation
+
+    rows = OutboxOperation.objects.values("status").annotate(
+        count=Count("id")).order_by()
+    values = {(status, ): 0 for status, _ in OutboxOperation.STATUS_CHOICES}
+    for row in rows:
+        values[(row["status"], )] = row["count"]
+    return [(OUTBOX_OPERATIONS, values)]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0018_user_vests'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollResultSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('results', models.TextField(help_text='Final results in JSON')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='result_snapshot', to='polls.Question')),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0019_pollresultsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['voter_count', 'id'], name='question_voter_count_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['promotion_amount', 'id'], name='question_promotion_id_idx'),
+        ),
+    ]
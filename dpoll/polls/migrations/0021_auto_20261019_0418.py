@@ -0,0 +1,29 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0020_auto_20261019_0418'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(is_deleted=False), fields=['expire_at'], name='question_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(promotion_amount__gt=0), fields=['promotion_amount', 'expire_at'], name='question_promoted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['username', 'id'], name='question_username_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['created_at'], name='question_created_at_idx'),
+        ),
+    ]
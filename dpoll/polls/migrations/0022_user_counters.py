@@ -0,0 +1,43 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+
+
+def fill_user_counters(apps, schema_editor):
+    User = apps.get_model('polls', 'User')
+    Question = apps.get_model('polls', 'Question')
+    Choice = apps.get_model('polls', 'Choice')
+
+    polls = Question.objects.filter(
+        username=OuterRef('username')).order_by().values(
+        'username').annotate(c=Count('id')).values('c')
+    votes = Choice.voted_users.through.objects.filter(
+        user_id=OuterRef('pk')).order_by().values(
+        'user_id').annotate(c=Count('id')).values('c')
+    User.objects.update(
+        poll_count=Coalesce(Subquery(polls, output_field=IntegerField()), 0),
+        vote_count=Coalesce(Subquery(votes, output_field=IntegerField()), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0021_auto_20261019_0418'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='poll_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='vote_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_user_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0022_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='description_hash',
+            field=models.CharField(blank=True, editable=False, help_text='sha256 of the description rendered to description_html', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='description_html',
+            field=models.TextField(blank=True, editable=False, help_text='Rendered markdown of the description', null=True),
+        ),
+    ]
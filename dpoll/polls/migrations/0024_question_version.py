@@ -0,0 +1,23 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0023_question_description_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
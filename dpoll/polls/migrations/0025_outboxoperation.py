@@ -0,0 +1,39 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0024_question_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxOperation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('poll', 'Poll'), ('edit', 'Poll edit'), ('vote', 'Vote')], max_length=10)),
+                ('username', models.CharField(max_length=255)),
+                ('access_token', models.TextField()),
+                ('permlink', models.CharField(max_length=255)),
+                ('operations', models.TextField(help_text='Operations in JSON')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('result', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('question', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='polls.Question')),
+                ('vote_audit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='polls.VoteAudit')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outboxoperation',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0025_outboxoperation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='json_metadata',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
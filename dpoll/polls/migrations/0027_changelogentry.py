@@ -0,0 +1,25 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0026_question_json_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('poll_created', 'Poll created'), ('poll_edited', 'Poll edited'), ('poll_deleted', 'Poll deleted'), ('vote', 'Vote'), ('vote_reverted', 'Vote reverted'), ('user_updated', 'User updated')], max_length=20)),
+                ('username', models.CharField(blank=True, max_length=255, null=True)),
+                ('data', models.TextField(blank=True, help_text='Details of the change in JSON', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('question', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='polls.Question')),
+            ],
+        ),
+    ]
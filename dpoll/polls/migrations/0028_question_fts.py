@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    # the other databases don't need an index table, see polls.search.
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE polls_question_fts "
+        "USING fts5(text, description, choices)")
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE polls_question_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0027_changelogentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0028_question_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagPopularity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=100, unique=True)),
+                ('poll_count', models.PositiveIntegerField(default=0)),
+                ('voter_count', models.PositiveIntegerField(default=0)),
+                ('last_poll_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tagpopularity',
+            index=models.Index(fields=['poll_count', 'id'], name='tagpopularity_poll_count_idx'),
+        ),
+        migrations.AddField(
+            model_name='polltag',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='poll_tags', to='polls.Question'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='polltag',
+            unique_together={('tag', 'question')},
+        ),
+    ]
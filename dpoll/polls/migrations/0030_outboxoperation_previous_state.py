@@ -0,0 +1,18 @@
+# Generated by Django 2.2.13 on 2026-10-19 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0029_polltag_tagpopularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxoperation',
+            name='previous_state',
+            field=models.TextField(blank=True, help_text='Poll state in JSON', null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.13 on 2026-10-19 05:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0030_outboxoperation_previous_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagPopularityRefresh',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+            ],
+        ),
+    ]
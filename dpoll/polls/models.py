@@ -1,22 +1,37 @@
 import threading
-import copy
+import hashlib
+import json
 import pytz
 import math
+from datetime import timedelta
+
 from dateutil.parser import parse
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.http import HttpResponse
 from django.urls import reverse
 from django.utils import timezone
-from lightsteem.client import Client
 from lightsteem.helpers.account import Account
 from lightsteem.helpers.amount import Amount
 from prettytable import PrettyTable
 from communities.models import Community
+from .clients import HiveClient
+from .templatetags.markdown_extras import render_description
 
 
 SA_STAKE_LIMIT = 500000000
 
+# number of voters kept per choice in the frozen results of expired polls.
+SNAPSHOT_TOP_VOTERS = 25
+
+# stake_based query parameter -> votes_summary() keyword arguments
+STAKE_MODES = {
+    "0": {},
+    "1": {"stake_based": True},
+    "2": {"sa_stake_based": True},
+}
+
 
 def sa_stake_based_voting_point(vests):
     point = vests
@@ -36,6 +51,9 @@ class User(AbstractUser):
                              null=True)
     vests = models.DecimalField(max_digits=64, decimal_places=6, blank=True, null=True)
     account_age = models.IntegerField(blank=True, null=True)
+    # denormalized counters, maintained by the signals in polls.signals
+    poll_count = models.IntegerField(default=0)
+    vote_count = models.IntegerField(default=0)
 
     @property
     def polls_created(self):
@@ -49,19 +67,19 @@ class User(AbstractUser):
     @property
     def votes_casted(self):
         return Choice.objects.filter(
-            voted_users__username=self.username).order_by('-id')
+            voted_users=self).select_related('question').order_by('-id')
 
     @property
     def recent_choices(self):
-        return self.votes_casted[0:10]
+        return self.votes_casted.prefetch_related("voted_users")[0:10]
 
     @property
     def total_polls_created(self):
-        return self.polls_created.count()
+        return self.poll_count
 
     @property
     def total_votes_casted(self):
-        return self.votes_casted.count()
+        return self.vote_count
 
     @property
     def profile_url(self):
@@ -71,8 +89,18 @@ class User(AbstractUser):
     def sa_effective_vests(self):
         return sa_stake_based_voting_point(self.vests)
 
+    def voter_stats(self):
+        """The stats the results depend on, rounded to the stored
+        precision. account_age is left out, it grows every day."""
+        return (
+            round(float(self.reputation or 0), 4),
+            round(float(self.sp or 0), 4),
+            round(float(self.vests or 0), 6),
+            self.post_count,
+        )
+
     def update_info(self, steem_per_mvest=None, account_detail=None):
-        c = Client(nodes=["https://api.hivekings.com"])
+        c = HiveClient(nodes=settings.HIVE_NODES)
 
         if not steem_per_mvest:
             # get chain properties
@@ -96,12 +124,35 @@ class User(AbstractUser):
         acc = Account(c)
         acc.raw_data = account_detail
 
+        old_stats = self.voter_stats()
         self.reputation = acc.reputation(precision=4)
         self.sp = vests / 1e6 * steem_per_mvest
         self.vests = vests
         self.account_age = (timezone.now() - t).total_seconds() / 86400
         self.post_count = account_detail["post_count"]
         self.save()
+        if self.voter_stats() == old_stats:
+            # nothing to log. the account age grows with the time, it's
+            # not compared.
+            return self
+
+        # the cached results and the ETags of the polls depend on the
+        # voter stats.
+        Question.objects.filter(choices__voted_users=self).update(
+            version=models.F("version") + 1,
+            modified_at=timezone.now(),
+        )
+        ChangeLogEntry.log(
+            ChangeLogEntry.KIND_USER_UPDATED,
+            username=self.username,
+            data={
+                "reputation": float(self.reputation),
+                "sp": float(self.sp),
+                "vests": float(self.vests),
+                "post_count": self.post_count,
+                "account_age": float(self.account_age),
+            },
+        )
 
         return self
 
@@ -134,10 +185,101 @@ class Question(models.Model):
         null=True,
         help_text="Promotion amount in SBD")
     is_deleted = models.BooleanField(default=False)
+    description_html = models.TextField(
+        null=True, blank=True, editable=False,
+        help_text="Rendered markdown of the description")
+    description_hash = models.CharField(
+        max_length=64, null=True, blank=True, editable=False,
+        help_text="sha256 of the description rendered to description_html")
+    # increased on every change (edits, votes, promotions). Used for
+    # the ETag and Last-Modified headers.
+    version = models.PositiveIntegerField(default=0)
+    modified_at = models.DateTimeField(auto_now=True)
+    # json_metadata of the broadcasted comment. Missing for the polls
+    # created before it's stored.
+    json_metadata = models.TextField(blank=True, null=True)
 
     def __str__(self):
         return self.text
 
+    # updated with UPDATE queries only (signals.update_voter_count and the
+    # update_promotion_info command). save() doesn't write them, so an
+    # outdated instance can't overwrite the counts.
+    COUNTER_FIELDS = ("voter_count", "promotion_amount")
+
+    def save(self, *args, **kwargs):
+        if self.description_hash != self.get_description_hash():
+            self.render_description()
+        if self._state.adding:
+            self.version += 1
+            return super(Question, self).save(*args, **kwargs)
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS]
+        else:
+            update_fields = set(update_fields) | {"version", "modified_at"}
+        kwargs["update_fields"] = update_fields
+        # the other bumps are F() updates too, none of them is lost.
+        self.version = models.F("version") + 1
+        super(Question, self).save(*args, **kwargs)
+        self.refresh_from_db(fields=("version",) + self.COUNTER_FIELDS)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Question, cls).from_db(db, field_names, values)
+        # the search index is updated only when these fields change.
+        if "text" in instance.__dict__ and "description" in instance.__dict__:
+            instance._indexed_document = instance.get_search_document()
+        return instance
+
+    def get_search_document(self):
+        """The fields of the poll in the search index."""
+        return self.text, self.description or ""
+
+    def get_description_hash(self):
+        return hashlib.sha256(
+            (self.description or "").encode("utf-8")).hexdigest()
+
+    def render_description(self):
+        """Render the description to description_html. Doesn't save."""
+        self.description_html = render_description(self.description)
+        self.description_hash = self.get_description_hash()
+        return self
+
+    @property
+    def rendered_description(self):
+        """
+        The rendered description. Falls back to rendering on the fly
+        if the stored HTML is missing or stale.
+        """
+        if self.description_hash != self.get_description_hash():
+            return render_description(self.description)
+        return self.description_html
+
+    def get_state(self):
+        """The editable fields and the choice texts of the poll, as stored
+        before an edit. Restored by utils.restore_poll."""
+        return {
+            "text": self.text,
+            "description": self.description,
+            "expire_at": self.expire_at.isoformat(),
+            "allow_multiple_choices": self.allow_multiple_choices,
+            "json_metadata": self.json_metadata,
+            "choices": list(self.choices.order_by("id").values_list(
+                "text", flat=True)),
+        }
+
+    @property
+    def tags(self):
+        """Tags of the poll. None if the metadata is not stored locally."""
+        if not self.json_metadata:
+            return None
+        return json.loads(self.json_metadata).get("tags", [])
+
     @property
     def expire_at_humanized(self):
         diff_in_days = (self.expire_at - self.created_at).days
@@ -148,6 +290,27 @@ class Question(models.Model):
 
     class Meta:
         unique_together = ('username', 'permlink')
+        indexes = [
+            # keyset pagination of trending and promoted polls
+            models.Index(fields=['voter_count', 'id'],
+                         name='question_voter_count_id_idx'),
+            models.Index(fields=['promotion_amount', 'id'],
+                         name='question_promotion_id_idx'),
+            # open polls on the homepage
+            models.Index(fields=['expire_at'],
+                         name='question_open_idx',
+                         condition=models.Q(is_deleted=False)),
+            # promoted poll of the homepage
+            models.Index(fields=['promotion_amount', 'expire_at'],
+                         name='question_promoted_idx',
+                         condition=models.Q(promotion_amount__gt=0)),
+            # polls of a user on the profile page
+            models.Index(fields=['username', 'id'],
+                         name='question_username_id_idx'),
+            # polls_by_vote_count date ranges
+            models.Index(fields=['created_at'],
+                         name='question_created_at_idx'),
+        ]
 
     def is_votable(self):
         return self.expire_at > timezone.now()
@@ -158,11 +321,15 @@ class Question(models.Model):
             - Poll must be open.
             - Poll must not have any votes casted from other users.
         """
-        if not self.is_votable:
+        if not self.is_votable():
             return False
-        votes = Choice.objects.filter(
-            question=self).aggregate(votes=models.Count('voted_users'))
-        return votes["votes"] == 0
+        prefetched = getattr(self, "_prefetched_objects_cache", {})
+        if "choices" in prefetched and all(
+                "voted_users" in getattr(c, "_prefetched_objects_cache", {})
+                for c in self.choices.all()):
+            return not any(c.voted_users.all() for c in self.choices.all())
+        return not Choice.voted_users.through.objects.filter(
+            choice__question=self).exists()
 
     def update_voter_count(self):
         """
@@ -170,16 +337,16 @@ class Question(models.Model):
         Discards multiple votes from the same vote caster.
         :return (Question): self
         """
-        voters = []
-        for choice in self.choices.all():
-            voters += choice.voted_users.values_list('username', flat=True)
-        self.voter_count = len(list(set(voters)))
+        self.voter_count = Choice.voted_users.through.objects.filter(
+            choice__question=self).values('user_id').distinct().count()
         return self
 
     def votes_summary(self, age=None, rep=None, post_count=None, sp=None,
                       stake_based=False, sa_stake_based=False, community=None):
         filter_exists = bool(rep or sp or age or post_count or community)
-        choices = list(self.choices.all())
+        # fetch the voters of all choices with a single query
+        choices = list(self.choices.prefetch_related(models.Prefetch(
+            "voted_users", queryset=User.objects.order_by("-sp"))))
 
         community_members = []
         community_filter_active = community or False
@@ -210,7 +377,7 @@ class Question(models.Model):
                 all_votes = 0
                 for c in choices:
                     for u in c.voted_users.all():
-                        all_votes += sa_stake_based_voting_point(u.vests)
+                        all_votes += u.sp
             elif sa_stake_based:
                 all_votes = 0
                 for c in choices:
@@ -233,52 +400,106 @@ class Question(models.Model):
             else:
                 choice_data.percent = 0
             choice_list.append(choice_data)
-        choice_list_ordered = copy.deepcopy(choice_list)
+        # the choices aren't modified after this point, a shallow copy is
+        # enough. deepcopy drops the prefetched voters.
+        choice_list_ordered = list(choice_list)
         choice_list.sort(key=lambda x: x.percent, reverse=True)
         return choice_list, choice_list_ordered, choices_selected,\
                filter_exists, all_votes
 
+    def freeze_results(self, top_n=SNAPSHOT_TOP_VOTERS):
+        """
+        Compute the final (unfiltered) results of the poll for every stake
+        mode and store them in a PollResultSnapshot.
+        :param top_n (int): Number of voters kept for each choice
+        :return (PollResultSnapshot): The created or refreshed snapshot
+        """
+        results = {"voter_count": self.voter_count, "modes": {}}
+        for stake_mode, kwargs in STAKE_MODES.items():
+            _, choice_list_ordered, choices_selected, _, all_votes = \
+                self.votes_summary(**kwargs)
+            choices = [choice.summary_data(top_n)
+                       for choice in choice_list_ordered]
+            results["modes"][stake_mode] = {
+                "all_votes": float(all_votes),
+                "choices_selected": choices_selected,
+                "choices": choices,
+            }
+
+        snapshot, _ = PollResultSnapshot.objects.update_or_create(
+            question=self,
+            defaults={"results": json.dumps(results)},
+        )
+        Question.objects.filter(pk=self.pk).update(
+            version=models.F("version") + 1,
+            modified_at=timezone.now(),
+        )
+        return snapshot
+
+    def frozen_votes_summary(self, stake_based=False, sa_stake_based=False):
+        """
+        Return the votes_summary() compatible results of an expired poll
+        from its snapshot. Returns None if the poll is not frozen, yet.
+        """
+        if self.is_votable():
+            return None
+        try:
+            snapshot = self.result_snapshot
+        except PollResultSnapshot.DoesNotExist:
+            return None
+
+        stake_mode = "0"
+        if stake_based:
+            stake_mode = "1"
+        elif sa_stake_based:
+            stake_mode = "2"
+        return snapshot.summary(stake_mode)
+
     def audit_response(self, choice_list):
+        """
+        :param choice_list (list): Choices in the Choice.summary_data()
+            format
+        """
         data = PrettyTable()
         data.field_names = [
             "Choice", "Voter", "Transaction ID", "Block num",
             "Rep", "SP", "Post Count", "Account Age"]
+        # the audit entries of all voters with a single query
+        audits = {}
+        for audit in VoteAudit.objects.filter(question=self).order_by("id"):
+            audits.setdefault(audit.voter_id, audit)
         for choice in choice_list:
-            if hasattr(choice, 'voters'):
-                for user in choice.voters:
-                    rep = round(user.reputation, 2)
-                    sp = int(user.sp)
-
-                    try:
-                        audit = VoteAudit.objects.get(
-                            question=self,
-                            voter=user,
-                        )
-                        data.add_row(
-                            [
-                                choice.text,
-                                user.username,
-                                audit.trx_id,
-                                audit.block_id,
-                                rep,
-                                sp,
-                                user.post_count,
-                                user.account_age
-                            ]
-                        )
-                    except VoteAudit.DoesNotExist:
-                        data.add_row(
-                            [
-                                choice.text,
-                                user.username,
-                                'missing',
-                                'missing',
-                                rep,
-                                sp,
-                                user.post_count,
-                                user.account_age
-                            ]
-                        )
+            for user in choice["voters"]:
+                rep = round(user["reputation"], 2)
+                sp = int(user["sp"])
+
+                audit = audits.get(user["id"])
+                if audit:
+                    data.add_row(
+                        [
+                            choice["text"],
+                            user["username"],
+                            audit.trx_id,
+                            audit.block_id,
+                            rep,
+                            sp,
+                            user["post_count"],
+                            user["account_age"]
+                        ]
+                    )
+                else:
+                    data.add_row(
+                        [
+                            choice["text"],
+                            user["username"],
+                            'missing',
+                            'missing',
+                            rep,
+                            sp,
+                            user["post_count"],
+                            user["account_age"]
+                        ]
+                    )
 
         return HttpResponse(f"<pre>{data}</pre>")
 
@@ -293,6 +514,13 @@ class Choice(models.Model):
     def votes(self):
         return self.voted_users.all().count()
 
+    def get_voters(self):
+        """Return the voters ordered by SP. Uses the prefetched voters
+        if there are any."""
+        if "voted_users" in getattr(self, "_prefetched_objects_cache", {}):
+            return self.voted_users.all()
+        return self.voted_users.all().order_by("-sp")
+
     def filtered_vote_count(self, rep, account_age, post_count, sp,
                             return_users=False, stake_based=False, sa_stake_based=False,
                             community=None, community_filter_active=False):
@@ -301,7 +529,7 @@ class Choice(models.Model):
         filtered_users = []
         total_stake_in_sp = 0
         total_sa_stake_in_vests = 0
-        for user in self.voted_users.all().order_by("-sp"):
+        for user in self.get_voters():
             if community_filter_active:
                 if user.username not in community:
                     continue
@@ -374,10 +602,38 @@ class Choice(models.Model):
                 self.vote_count = self.votes
             self.percent = round(
                 100 * self.vote_count / all_votes, 2)
-            self.voters = self.voted_users.all().order_by("-sp")
+            self.voters = list(self.get_voters())
 
         return self
 
+    def summary_data(self, top_n=None):
+        """
+        The choice's stats injected by Question.votes_summary() as plain
+        values, so they can be cached and stored in the snapshots.
+        :param top_n (int): Number of voters kept. Keeps all if None.
+        """
+        voters = getattr(self, 'voters', [])
+        if top_n is not None:
+            voters = voters[0:top_n]
+        return {
+            "id": self.id,
+            "text": self.text,
+            "percent": float(getattr(self, 'percent', 0)),
+            "vote_count": float(getattr(self, 'vote_count', 0)),
+            "voter_count": getattr(self, 'voter_count', 0),
+            "voters": [{
+                "id": user.pk,
+                "username": user.username,
+                "sp": float(user.sp or 0),
+                "vests": float(user.vests or 0),
+                "sa_effective_vests": sa_stake_based_voting_point(
+                    user.vests or 0),
+                "reputation": float(user.reputation or 0),
+                "post_count": user.post_count,
+                "account_age": user.account_age,
+            } for user in voters],
+        }
+
     def __str__(self):
         return self.text
 
@@ -400,3 +656,311 @@ class VoteAudit(models.Model):
     voter = models.ForeignKey(User, on_delete=models.DO_NOTHING)
     block_id = models.BigIntegerField(blank=True, null=True)
     trx_id = models.TextField(blank=True, null=True)
+
+
+class PollResultSnapshot(models.Model):
+    """Stores the final results of an expired poll, so closed polls don't
+    need to be tallied on every request.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE,
+                                    related_name="result_snapshot")
+    results = models.TextField(help_text="Final results in JSON")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Results of {self.question}"
+
+    @property
+    def data(self):
+        return json.loads(self.results)
+
+    def summary(self, stake_mode="0"):
+        """
+        Return the snapshot in the same shape with Question.votes_summary().
+        :param stake_mode (str): One of the STAKE_MODES keys
+        """
+        mode = self.data["modes"][stake_mode]
+        choice_list_ordered = mode["choices"]
+        choice_list = sorted(
+            choice_list_ordered, key=lambda x: x["percent"], reverse=True)
+        return choice_list, choice_list_ordered, mode["choices_selected"],\
+            False, mode["all_votes"]
+
+
+class OutboxOperation(models.Model):
+    """A blockchain broadcast queued by the web process. Sent by the
+    broadcast_outbox command, so the requests don't wait for hivesigner.
+    """
+    KIND_POLL = "poll"
+    KIND_EDIT = "edit"
+    KIND_VOTE = "vote"
+    KIND_CHOICES = (
+        (KIND_POLL, "Poll"),
+        (KIND_EDIT, "Poll edit"),
+        (KIND_VOTE, "Vote"),
+    )
+
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENDING, "Sending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    username = models.CharField(max_length=255)
+    access_token = models.TextField()
+    # permlink of the broadcasted comment. retries use the same permlink,
+    # so a broadcast is never duplicated on the chain.
+    permlink = models.CharField(max_length=255)
+    operations = models.TextField(help_text="Operations in JSON")
+    question = models.ForeignKey(Question, on_delete=models.SET_NULL,
+                                 blank=True, null=True)
+    vote_audit = models.ForeignKey(VoteAudit, on_delete=models.SET_NULL,
+                                   blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    result = models.TextField(blank=True, null=True)
+    # state of the poll before an edit, restored if the edit isn't sent.
+    previous_state = models.TextField(blank=True, null=True,
+                                      help_text="Poll state in JSON")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'],
+                         name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} of {self.username}/{self.permlink}"
+
+    def claim(self, lease=60):
+        """
+        Mark the operation as being sent. Returns False if another worker
+        claimed it first. Operations of the crashed workers are picked up
+        again after the lease (seconds) expires.
+        """
+        claimed = OutboxOperation.objects.filter(
+            pk=self.pk,
+            status=self.status,
+            next_attempt_at=self.next_attempt_at,
+        ).update(
+            status=self.STATUS_SENDING,
+            next_attempt_at=timezone.now() + timedelta(seconds=lease),
+        )
+        return claimed == 1
+
+    @transaction.atomic
+    def mark_sent(self, result):
+        self.status = self.STATUS_SENT
+        self.result = json.dumps(result)
+        self.sent_at = timezone.now()
+        self.attempts += 1
+        # the token isn't needed anymore, don't keep it around.
+        self.access_token = ""
+        self.save()
+
+        if self.vote_audit_id:
+            # the vote is confirmed. add block and trx ids to the audit log.
+            VoteAudit.objects.filter(pk=self.vote_audit_id).update(
+                block_id=result.get("result", {}).get("block_num"),
+                trx_id=result.get("result", {}).get("id"),
+            )
+            # the audit responses of the poll changed.
+            Question.objects.filter(
+                voteaudit__pk=self.vote_audit_id).update(
+                version=models.F("version") + 1,
+                modified_at=timezone.now(),
+            )
+
+    def mark_retry(self, error, max_attempts, backoff_base, backoff_max):
+        """Schedule a retry with exponential backoff, or give up."""
+        self.attempts += 1
+        if self.attempts >= max_attempts:
+            return self.mark_failed(error)
+        delay = min(backoff_base * 2 ** (self.attempts - 1), backoff_max)
+        self.status = self.STATUS_PENDING
+        self.last_error = error
+        self.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        self.save()
+
+    @transaction.atomic
+    def mark_failed(self, error):
+        """Give up the broadcast and revert the local state."""
+        self.status = self.STATUS_FAILED
+        self.last_error = error
+        self.access_token = ""
+        self.save()
+
+        if self.kind == self.KIND_VOTE and self.vote_audit_id:
+            revert_vote(self.vote_audit)
+        elif self.kind == self.KIND_POLL and self.question_id:
+            # the audit log doesn't cascade, revert the votes of the poll
+            # before deleting it.
+            for vote_audit in VoteAudit.objects.filter(
+                    question_id=self.question_id).select_related(
+                    "question", "voter"):
+                revert_vote(vote_audit)
+            ChangeLogEntry.log_poll(
+                ChangeLogEntry.KIND_POLL_DELETED, self.question)
+            self.question.delete()
+        elif self.kind == self.KIND_EDIT and self.question_id and \
+                self.previous_state:
+            from .utils import restore_poll
+            restore_poll(self.question, json.loads(self.previous_state))
+            ChangeLogEntry.log_poll(
+                ChangeLogEntry.KIND_POLL_EDITED, self.question)
+
+
+def revert_vote(vote_audit):
+    """Remove the vote of an audit entry and log the reversal."""
+    vote_audit.voter.choice_set.remove(*vote_audit.choices.all())
+    vote_audit.delete()
+    ChangeLogEntry.log(
+        ChangeLogEntry.KIND_VOTE_REVERTED,
+        question=vote_audit.question,
+        username=vote_audit.voter.username,
+    )
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Append-only log of the changes mirrors need to follow. The id is the
+    monotonic sequence number of the change feed.
+    """
+    KIND_POLL_CREATED = "poll_created"
+    KIND_POLL_EDITED = "poll_edited"
+    KIND_POLL_DELETED = "poll_deleted"
+    KIND_VOTE = "vote"
+    KIND_VOTE_REVERTED = "vote_reverted"
+    KIND_USER_UPDATED = "user_updated"
+    KIND_CHOICES = (
+        (KIND_POLL_CREATED, "Poll created"),
+        (KIND_POLL_EDITED, "Poll edited"),
+        (KIND_POLL_DELETED, "Poll deleted"),
+        (KIND_VOTE, "Vote"),
+        (KIND_VOTE_REVERTED, "Vote reverted"),
+        (KIND_USER_UPDATED, "User updated"),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    question = models.ForeignKey(
+        Question, on_delete=models.SET_NULL, blank=True, null=True,
+        related_name="+")
+    username = models.CharField(max_length=255, blank=True, null=True)
+    data = models.TextField(blank=True, null=True,
+                            help_text="Details of the change in JSON")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.id}: {self.kind} {self.username}"
+
+    @classmethod
+    def log(cls, kind, question=None, username=None, data=None):
+        return cls.objects.create(
+            kind=kind,
+            question=question,
+            username=username,
+            data=json.dumps(data) if data is not None else None,
+        )
+
+    @classmethod
+    def log_poll(cls, kind, question):
+        return cls.log(kind, question=question, username=question.username,
+                       data={"permlink": question.permlink})
+
+    def to_dict(self):
+        return {
+            "seq": self.id,
+            "kind": self.kind,
+            "created_at": self.created_at,
+            "question_id": self.question_id,
+            "username": self.username,
+            "data": json.loads(self.data) if self.data else None,
+        }
+
+
+class PollTag(models.Model):
+    """Tags of a poll, mirrored from its json_metadata, so the polls can
+    be listed by tag without querying the chain."""
+    question = models.ForeignKey(Question, on_delete=models.CASCADE,
+                                 related_name="poll_tags")
+    tag = models.CharField(max_length=100)
+
+    class Meta:
+        # (tag, question) also serves the tag pages, newest poll first.
+        unique_together = ('tag', 'question')
+
+    def __str__(self):
+        return f"{self.tag}: {self.question_id}"
+
+
+class TagPopularity(models.Model):
+    """Rollup of the number of polls and voters per tag. Refreshed for
+    the changed tags only, see TagPopularity.refresh()."""
+    tag = models.CharField(max_length=100, unique=True)
+    poll_count = models.PositiveIntegerField(default=0)
+    voter_count = models.PositiveIntegerField(default=0)
+    last_poll_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['poll_count', 'id'],
+                         name='tagpopularity_poll_count_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tag} ({self.poll_count})"
+
+    @classmethod
+    def refresh(cls, tags):
+        """Recount the given tags with a single grouped query. The tags
+        without any polls left are removed."""
+        tags = set(tags)
+        if not tags:
+            return
+        stats = {row["tag"]: row for row in PollTag.objects.filter(
+            tag__in=tags, question__is_deleted=False).values(
+            "tag").annotate(
+            poll_count=models.Count("question_id"),
+            voter_count=models.Sum("question__voter_count"),
+            last_poll_at=models.Max("question__created_at"))}
+        for tag in tags:
+            if tag not in stats:
+                cls.objects.filter(tag=tag).delete()
+                continue
+            cls.objects.update_or_create(tag=tag, defaults={
+                "poll_count": stats[tag]["poll_count"],
+                "voter_count": stats[tag]["voter_count"] or 0,
+                "last_poll_at": stats[tag]["last_poll_at"],
+            })
+
+
+class TagPopularityRefresh(models.Model):
+    """Single row holding the start time of the last refresh_tag_popularity
+    run. The polls modified since then are recounted by the next run."""
+    started_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Tag popularity refreshed at {self.started_at}"
+
+    @classmethod
+    def get_watermark(cls):
+        return cls.objects.values_list("started_at", flat=True).first()
+
+    @classmethod
+    def set_watermark(cls, started_at):
+        cls.objects.update_or_create(pk=1, defaults={
+            "started_at": started_at,
+        })
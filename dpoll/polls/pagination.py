@@ -0,0 +1,204 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+# index/API orderings. every ordering ends with a unique column (id)
+# and is backed by a composite index.
+QUESTION_ORDERINGS = {
+    "new": ("id",),
+    "trending": ("voter_count", "id"),
+    "promoted": ("promotion_amount", "id"),
+}
+
+
+def encode_cursor(values, reverse=False):
+    data = json.dumps({"v": list(values), "r": int(reverse)})
+    return urlsafe_b64encode(data.encode()).decode()
+
+
+class InvalidCursor(ValueError):
+    """Raised for the cursors which can't be decoded, or whose values
+    don't match the ordering fields."""
+
+
+def decode_cursor(cursor):
+    """
+    Decode an opaque cursor. Returns (None, False) for the first page.
+    Raises InvalidCursor for the malformed cursors.
+    """
+    if not cursor:
+        return None, False
+    try:
+        data = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+        values = data["v"]
+        reverse = bool(data.get("r"))
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, reverse
+
+
+class KeysetPage:
+    """A page of the keyset paginator. Mimics the parts of Django's Page
+    the templates use.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Cursor based paginator for descending orderings.
+
+    Unlike Paginator, it doesn't run COUNT(*) and doesn't use OFFSET.
+    Pages are fetched with a "(a, id) < (last_a, last_id)" filter, so
+    deep pages cost the same with the first page.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+
+    def keyset_filter(self, values, reverse=False):
+        lookup = "gt" if reverse else "lt"
+        query = Q()
+        for i, field in enumerate(self.ordering):
+            condition = Q(**{f"{field}__{lookup}": values[i]})
+            for previous_field, value in zip(self.ordering[:i], values):
+                condition &= Q(**{previous_field: value})
+            query |= condition
+        return query
+
+    def cursor_values(self, obj):
+        return [getattr(obj, field) for field in self.ordering]
+
+    def clean_values(self, values):
+        """Convert the cursor values to the types of the ordering fields.
+        Raises InvalidCursor for the tampered cursors."""
+        if len(values) != len(self.ordering):
+            raise InvalidCursor(values)
+        cleaned = []
+        for field_name, value in zip(self.ordering, values):
+            field = self.queryset.model._meta.get_field(field_name)
+            if value is None or isinstance(value, (bool, list, dict)):
+                raise InvalidCursor(values)
+            try:
+                cleaned.append(field.to_python(value))
+            except ValidationError:
+                raise InvalidCursor(values)
+        return cleaned
+
+    def get_page(self, cursor=None):
+        """Return the page after (or before) the cursor. Raises
+        InvalidCursor for the invalid cursors."""
+        values, reverse = decode_cursor(cursor)
+        if values is not None:
+            values = self.clean_values(values)
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, reverse))
+        prefix = "" if reverse else "-"
+        queryset = queryset.order_by(
+            *[f"{prefix}{field}" for field in self.ordering])
+
+        object_list = list(queryset[0:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[0:self.per_page]
+        if reverse:
+            object_list.reverse()
+
+        if not object_list:
+            return KeysetPage(object_list)
+
+        next_cursor = previous_cursor = None
+        if reverse:
+            # we came from the next page, it exists.
+            next_cursor = encode_cursor(self.cursor_values(object_list[-1]))
+            if has_more:
+                previous_cursor = encode_cursor(
+                    self.cursor_values(object_list[0]), reverse=True)
+        else:
+            if has_more:
+                next_cursor = encode_cursor(
+                    self.cursor_values(object_list[-1]))
+            if values is not None:
+                previous_cursor = encode_cursor(
+                    self.cursor_values(object_list[0]), reverse=True)
+
+        return KeysetPage(object_list, next_cursor, previous_cursor)
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination class backed by KeysetPaginator.
+
+    Views define the ordering with a `keyset_ordering` attribute or a
+    `get_keyset_ordering(request)` method. Defaults to ("id", ).
+    Invalid cursors are answered with 404, like DRF's CursorPagination.
+    The total count costs a COUNT(*) query, it's included only when asked
+    for with ?with_count=1.
+    """
+    cursor_query_param = "cursor"
+    count_query_param = "with_count"
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_ordering(self, request, view):
+        if hasattr(view, "get_keyset_ordering"):
+            return view.get_keyset_ordering(request)
+        return getattr(view, "keyset_ordering", ("id",))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(
+            queryset, self.get_ordering(request, view), self.page_size)
+        try:
+            self.page = paginator.get_page(
+                request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound(self.invalid_cursor_message)
+        self.count = None
+        if request.query_params.get(self.count_query_param) == "1":
+            self.count = queryset.count()
+        return list(self.page)
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_link(self.page.next_cursor)
+        response['previous'] = self.get_link(self.page.previous_cursor)
+        response['results'] = data
+        return Response(response)
@@ -0,0 +1,167 @@
+"""
+Full-text search over the polls.
+
+The SQLite backend keeps an FTS5 table (polls_question_fts) with the
+question text, description and choice texts of every poll, keyed by the
+question id, and ranks the matches with bm25. The table is kept in sync
+by the signals in polls.signals (and by utils.add_choices, bulk inserts
+send no signals) and rebuilt by the `rebuild_search_index` command. The
+PostgreSQL backend ranks a tsvector built from the same fields instead.
+Other databases get the NullSearchBackend, search finds nothing there.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .models import Question
+
+# bm25 weights of the text, description and choices columns
+SQLITE_FTS_WEIGHTS = (10.0, 1.0, 5.0)
+
+
+def get_terms(query):
+    return re.findall(r"\w+", query or "")
+
+
+class SearchBackend:
+    """Interface of the search backends."""
+
+    def update_question(self, question):
+        """Index the text and the description of a poll."""
+
+    def update_choices(self, question_id):
+        """Index the choice texts of a poll."""
+
+    def remove(self, question_id):
+        """Remove a poll from the index."""
+
+    def rebuild(self):
+        """Index all the polls. Returns the number of the indexed polls."""
+        return 0
+
+    def search(self, query, limit, offset=0):
+        """Return the ids of the matching polls, best match first."""
+        raise NotImplementedError
+
+
+class NullSearchBackend(SearchBackend):
+    """Nothing is indexed and nothing is found."""
+
+    def search(self, query, limit, offset=0):
+        return []
+
+
+class SQLiteFTSBackend(SearchBackend):
+    table = "polls_question_fts"
+
+    def get_choices_text(self, cursor, question_id):
+        cursor.execute(
+            "SELECT text FROM polls_choice WHERE question_id = %s "
+            "ORDER BY id", [question_id])
+        return " ".join(row[0] for row in cursor.fetchall())
+
+    def update_question(self, question):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT text, description FROM {self.table} "
+                f"WHERE rowid = %s", [question.pk])
+            row = cursor.fetchone()
+            document = (question.text, question.description or "")
+            if row is None:
+                cursor.execute(
+                    f"INSERT INTO {self.table} "
+                    f"(rowid, text, description, choices) "
+                    f"VALUES (%s, %s, %s, %s)",
+                    [question.pk, *document,
+                     self.get_choices_text(cursor, question.pk)])
+            elif tuple(row) != document:
+                # polls are saved on every vote, re-index the changes only.
+                cursor.execute(
+                    f"UPDATE {self.table} SET text = %s, description = %s "
+                    f"WHERE rowid = %s", [*document, question.pk])
+
+    def update_choices(self, question_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET choices = %s WHERE rowid = %s",
+                [self.get_choices_text(cursor, question_id), question_id])
+
+    def remove(self, question_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid = %s", [question_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            cursor.execute(
+                f"INSERT INTO {self.table} "
+                f"(rowid, text, description, choices) "
+                f"SELECT q.id, q.text, COALESCE(q.description, ''), "
+                f"COALESCE((SELECT group_concat(c.text, ' ') "
+                f"FROM polls_choice c WHERE c.question_id = q.id), '') "
+                f"FROM polls_question q")
+            cursor.execute(f"SELECT count(*) FROM {self.table}")
+            return cursor.fetchone()[0]
+
+    def search(self, query, limit, offset=0):
+        terms = get_terms(query)
+        if not terms:
+            return []
+        # quoted prefix queries, so the user input can't break the
+        # FTS5 query syntax.
+        match = " ".join('"{}"*'.format(term) for term in terms)
+        weights = ", ".join(map(str, SQLITE_FTS_WEIGHTS))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {self.table}.rowid FROM {self.table} "
+                f"JOIN polls_question q ON q.id = {self.table}.rowid "
+                f"WHERE {self.table} MATCH %s AND NOT q.is_deleted "
+                f"ORDER BY bm25({self.table}, {weights}) "
+                f"LIMIT %s OFFSET %s", [match, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Ranks a tsvector of the polls, no index table to maintain."""
+
+    def search(self, query, limit, offset=0):
+        from django.contrib.postgres.aggregates import StringAgg
+        from django.contrib.postgres.search import SearchQuery, \
+            SearchRank, SearchVector
+
+        terms = get_terms(query)
+        if not terms:
+            return []
+        search_query = SearchQuery(" & ".join(
+            f"{term}:*" for term in terms), search_type="raw")
+        vector = SearchVector("text", weight="A") + \
+            SearchVector(StringAgg("choices__text", " "), weight="B") + \
+            SearchVector("description", weight="C")
+        return list(Question.objects.filter(is_deleted=False).annotate(
+            search=vector).filter(search=search_query).annotate(
+            rank=SearchRank(vector, search_query)).order_by(
+            "-rank", "-id").values_list("id", flat=True)[
+            offset:offset + limit])
+
+
+BACKENDS = {
+    "sqlite": "polls.search.SQLiteFTSBackend",
+    "postgresql": "polls.search.PostgresSearchBackend",
+}
+
+
+def get_backend():
+    """The SEARCH_BACKEND setting, or the backend of the database."""
+    path = settings.SEARCH_BACKEND or BACKENDS.get(
+        connection.vendor, "polls.search.NullSearchBackend")
+    return import_string(path)()
+
+
+def search_questions(query, limit, offset=0):
+    """Return the matching polls, best match first."""
+    ids = get_backend().search(query, limit, offset)
+    questions = Question.objects.in_bulk(ids)
+    return [questions[pk] for pk in ids if pk in questions]
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
-from .models import Question, Choice, User
+from .models import Question, Choice, User, PollResultSnapshot, \
+    TagPopularity
 from sponsors.models import Sponsor
 
 
@@ -22,11 +23,21 @@ class QuestionSerializer(serializers.ModelSerializer):
     choices = ChoiceSerializer(many=True)
     is_editable = serializers.BooleanField()
     is_votable = serializers.BooleanField()
+    final_results = serializers.SerializerMethodField()
 
     class Meta:
         model = Question
         fields = '__all__'
 
+    def get_final_results(self, obj):
+        """Frozen results of the closed polls. None for the open polls."""
+        if obj.is_votable():
+            return None
+        try:
+            return obj.result_snapshot.data
+        except PollResultSnapshot.DoesNotExist:
+            return None
+
 
 class SponsorSerializer(serializers.ModelSerializer):
     class Meta:
@@ -58,8 +69,8 @@ class ChoiceSerializerWithQuestion(serializers.ModelSerializer):
 class UserDetailSerializer(UserSerializer):
     recent_questions = LightQuestionSerializer(many=True, read_only=True)
     recent_choices = ChoiceSerializerWithQuestion(many=True, read_only=True)
-    question_count = serializers.IntegerField(source="total_polls_created")
-    choice_count = serializers.IntegerField(source="total_votes_casted")
+    question_count = serializers.IntegerField(source="poll_count")
+    choice_count = serializers.IntegerField(source="vote_count")
 
     class Meta:
         model = User
@@ -70,3 +81,37 @@ class UserDetailSerializer(UserSerializer):
             'question_count',
             'choice_count',
         ]
+
+
+class UserCompactSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = [
+            'username', 'reputation', 'sp', 'post_count', 'account_age',
+            'poll_count', 'vote_count',
+        ]
+
+
+class ChoiceCompactSerializer(serializers.ModelSerializer):
+    vote_count = serializers.IntegerField()
+
+    class Meta:
+        model = Choice
+        fields = ['id', 'text', 'vote_count']
+
+
+class QuestionCompactSerializer(serializers.ModelSerializer):
+    choices = ChoiceCompactSerializer(many=True)
+
+    class Meta:
+        model = Question
+        fields = [
+            'id', 'username', 'permlink', 'text', 'created_at', 'expire_at',
+            'allow_multiple_choices', 'voter_count', 'is_deleted', 'choices',
+        ]
+
+
+class TagPopularitySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TagPopularity
+        fields = ['tag', 'poll_count', 'voter_count', 'last_poll_at']
@@ -1,15 +1,119 @@
-from django.db.models.signals import m2m_changed
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.utils import timezone
 
-from .models import Choice
+from .models import Choice, Question, User, PollTag, TagPopularity
+from .search import get_backend
 
-def update_voter_count(sender, instance, **kwargs):
+def remember_cleared_votes(sender, instance, action, reverse, **kwargs):
+    """pk_set is None on clear(), keep the cleared ids for the post_clear
+    receivers."""
+    if action != "pre_clear":
+        return
+    if reverse:
+        instance._cleared_vote_ids = set(
+            instance.choice_set.values_list("pk", flat=True))
+    else:
+        instance._cleared_vote_ids = set(
+            instance.voted_users.values_list("pk", flat=True))
+
+
+def update_voter_count(sender, instance, action, reverse, pk_set,
+                       **kwargs):
     """Whenever a new vote is added, recalculate the Question.voter_count
     and update the total.
 
     :param sender: Signal sendera
-    :param instance: Choice instance
+    :param instance: Choice instance (User instance if reverse)
     """
-    instance.question.update_voter_count()
-    instance.question.save()
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_cleared_vote_ids", None)
+    if reverse:
+        # user.choice_set.add(*choices) registers a whole vote at once.
+        if not pk_set:
+            return
+        questions = Question.objects.filter(choices__pk__in=pk_set).distinct()
+    else:
+        questions = [instance.question]
+    # a single UPDATE instead of Question.save(), no read-modify-write of
+    # the whole row while the vote transaction holds the write lock.
+    for question in questions:
+        Question.objects.filter(pk=question.pk).update(
+            voter_count=question.update_voter_count().voter_count,
+            version=F("version") + 1,
+            modified_at=timezone.now(),
+        )
+
+
+def update_user_vote_count(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Keep User.vote_count in sync with the Choice.voted_users relation.
+
+    :param sender: Signal sender
+    :param instance: Choice instance (User instance if reverse)
+    """
+    if action == "post_clear":
+        action, pk_set = "post_remove", getattr(
+            instance, "_cleared_vote_ids", None)
+    if action not in ["post_add", "post_remove"] or not pk_set:
+        return
+    if reverse:
+        user_ids, delta = [instance.pk], len(pk_set)
+    else:
+        user_ids, delta = pk_set, 1
+    if action == "post_remove":
+        delta = -delta
+    User.objects.filter(pk__in=user_ids).update(
+        vote_count=F("vote_count") + delta)
+
+
+def increase_user_poll_count(sender, instance, created, **kwargs):
+    """Increase the User.poll_count of the author on the new polls."""
+    if not created:
+        return
+    User.objects.filter(username=instance.username).update(
+        poll_count=F("poll_count") + 1)
+
+
+def decrease_user_poll_count(sender, instance, **kwargs):
+    """Decrease the User.poll_count of the author on the deleted polls."""
+    User.objects.filter(username=instance.username).update(
+        poll_count=F("poll_count") - 1)
+
+def index_question(sender, instance, created, **kwargs):
+    """Update the search index when the indexed fields of a poll change."""
+    document = instance.get_search_document()
+    if not created and getattr(instance, "_indexed_document", None) == \
+            document:
+        return
+    get_backend().update_question(instance)
+    instance._indexed_document = document
+
+
+def index_choices(sender, instance, **kwargs):
+    """Update the choice texts of the poll in the search index."""
+    get_backend().update_choices(instance.question_id)
+
+
+def remove_question_from_index(sender, instance, **kwargs):
+    get_backend().remove(instance.pk)
+
+
+def refresh_removed_tag(sender, instance, **kwargs):
+    """Recount the tag popularity when a tag is removed from a poll, or
+    the poll is deleted."""
+    TagPopularity.refresh([instance.tag])
 
-m2m_changed.connect(update_voter_count, sender=Choice.voted_users.through)
\ No newline at end of file
+m2m_changed.connect(remember_cleared_votes,
+                    sender=Choice.voted_users.through)
+m2m_changed.connect(update_voter_count, sender=Choice.voted_users.through)
+m2m_changed.connect(update_user_vote_count, sender=Choice.voted_users.through)
+post_save.connect(increase_user_poll_count, sender=Question)
+post_delete.connect(decrease_user_poll_count, sender=Question)
+post_save.connect(index_question, sender=Question)
+post_delete.connect(remove_question_from_index, sender=Question)
+post_save.connect(index_choices, sender=Choice)
+post_delete.connect(index_choices, sender=Choice)
+post_delete.connect(refresh_removed_tag, sender=PollTag)
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+
+from .metrics import CACHE_REQUESTS
+
+
+class _Call:
+    """An in-flight computation shared by the concurrent callers."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical computations.
+
+    Within a process, callers of the same key share one in-flight call.
+    Across processes, the cache backend is used as a lock and as the
+    result store, so only one worker computes a key at a time. Callers
+    waiting longer than `wait_budget` seconds get the last good result
+    of the `stale_key` instead, if there is one.
+
+    The cross-process part needs a shared cache backend (memcached,
+    redis or the database cache). With the default LocMemCache every
+    process has its own cache, so the computations are coalesced per
+    process only. Results are pickled by the cache backends; return
+    plain values from the computations, not model instances.
+    """
+
+    def __init__(self, namespace, result_ttl=60, stale_ttl=86400,
+                 wait_budget=2, poll_interval=0.05):
+        self.namespace = namespace
+        self.result_ttl = result_ttl
+        self.stale_ttl = stale_ttl
+        self.wait_budget = wait_budget
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def cache_key(self, kind, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{kind}:{digest}"
+
+    def do(self, key, fn, stale_key=None):
+        """
+        Return fn()'s result for the key, computing it at most once
+        across the concurrent callers.
+
+        :param key (str): Identifies the computation and its inputs
+        :param fn (callable): Computes the result
+        :param stale_key (str): Identifies the last good result to serve
+            when the wait budget is exceeded
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if call.event.wait(self.wait_budget) and call.error is None:
+                return call.result
+            return self._fallback(fn, stale_key)
+
+        try:
+            call.result = self._do_shared(key, fn, stale_key)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+        return call.result
+
+    def _do_shared(self, key, fn, stale_key):
+        result_key = self.cache_key("result", key)
+        result = cache.get(result_key)
+        if result is not None:
+            CACHE_REQUESTS.inc(cache=self.namespace, result="hit")
+            return result
+        CACHE_REQUESTS.inc(cache=self.namespace, result="miss")
+
+        lock_key = self.cache_key("lock", key)
+        if cache.add(lock_key, 1, self.wait_budget * 5):
+            try:
+                return self._compute(key, fn, stale_key)
+            finally:
+                cache.delete(lock_key)
+
+        # another worker is computing it. wait for its result.
+        deadline = time.monotonic() + self.wait_budget
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            result = cache.get(result_key)
+            if result is not None:
+                return result
+
+        return self._fallback(fn, stale_key)
+
+    def _compute(self, key, fn, stale_key):
+        result = fn()
+        cache.set(self.cache_key("result", key), result, self.result_ttl)
+        if stale_key:
+            cache.set(self.cache_key("stale", stale_key), result,
+                      self.stale_ttl)
+        return result
+
+    def _fallback(self, fn, stale_key):
+        """Serve the last good result, or compute it if there is none."""
+        if stale_key:
+            result = cache.get(self.cache_key("stale", stale_key))
+            if result is not None:
+                return result
+        return fn()
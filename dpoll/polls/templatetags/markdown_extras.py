@@ -1,12 +1,30 @@
 from django import template
 from django.template.defaultfilters import stringfilter
+from django.utils.html import escape, strip_tags
 
 import markdown as md
 
 register = template.Library()
 
+MARKDOWN_EXTENSIONS = [
+    'markdown.extensions.fenced_code',
+    'markdown.extensions.tables',
+]
+
+
+def render_markdown(value):
+    return md.markdown(value, extensions=MARKDOWN_EXTENSIONS)
+
+
+def render_description(value):
+    """
+    Render a poll description to HTML. Same with the
+    `striptags|force_escape|markdown` filter chain of the templates.
+    """
+    return render_markdown(escape(strip_tags(value or "")))
+
 
 @register.filter()
 @stringfilter
 def markdown(value):
-    return md.markdown(value, extensions=['markdown.extensions.fenced_code', 'markdown.extensions.tables'])
+    return render_markdown(value)
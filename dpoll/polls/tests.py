@@ -1,3 +1,1620 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.contrib.messages import constants
+from django.contrib.messages.storage.base import Message
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, OperationalError, connection, \
+    transaction
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from lightsteem.client import Client as LightsteemClient
+
+from middlewares import RequestStatsMiddleware
+from polls.benchmark import SUMMARY_MODES, generate_data, run_benchmarks, \
+    compare_results
+from polls.live import ResultHub, get_tally
+from polls.loadtest import StubNode
+from polls.management.commands.benchmark import Command as BenchmarkCommand
+from polls.search import search_questions
+from polls.singleflight import SingleFlight
+from polls.metrics import VOTES_REGISTERED, Registry
+from polls.pagination import encode_cursor
+from polls.models import Question, Choice, User, VoteAudit, \
+    OutboxOperation, ChangeLogEntry, PollTag, TagPopularity, \
+    TagPopularityRefresh
+from polls.utils import get_user_sc_client, register_vote, set_poll_tags, \
+    get_votes_summary, run_in_transaction, add_choices
+
+
+class QuestionIndexTests(TestCase):
+    """Checks the hot Question queries are served by the indexes with
+    EXPLAIN QUERY PLAN.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(50):
+            Question.objects.create(
+                text=f"Question {i}",
+                username=f"user{i % 5}",
+                permlink=f"question-{i}",
+                expire_at=now() + timedelta(days=i - 25),
+                voter_count=i % 7,
+                promotion_amount=i % 3 or None,
+                is_deleted=i % 10 == 0,
+            )
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_homepage_uses_open_polls_index(self):
+        questions = Question.objects.filter(
+            expire_at__gt=now(), is_deleted=False)
+        for ordering in ["-id", "-voter_count", "-promotion_amount"]:
+            self.assertUsesIndex(
+                questions.order_by(ordering)[0:11], "question_open_idx")
+
+    def test_promoted_poll_uses_promoted_index(self):
+        queryset = Question.objects.filter(
+            expire_at__gt=now(),
+            promotion_amount__gt=float(0.000),
+        ).order_by("-promotion_amount")[0:1]
+        self.assertUsesIndex(queryset, "question_promoted_idx")
+
+    def test_profile_uses_username_index(self):
+        queryset = Question.objects.filter(
+            username="user1").order_by("-id")[0:10]
+        self.assertUsesIndex(queryset, "question_username_id_idx")
+
+    def test_polls_by_vote_count_uses_created_at_index(self):
+        queryset = Question.objects.filter(
+            created_at__gt=now() - timedelta(days=7),
+            created_at__lt=now(),
+        )
+        self.assertUsesIndex(queryset, "question_created_at_idx")
+
+
+class HivesignerStubHandler(BaseHTTPRequestHandler):
+    """Answers /api/broadcast/ with the queued responses of the server."""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.requests.append(
+            json.loads(self.rfile.read(length) or "null"))
+        status, body = self.server.responses.pop(0)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def login_with_token(client, username):
+    """Log in as a hivesigner user, with a token in the session."""
+    client.force_login(User.objects.create(username=username))
+    session = client.session
+    session["sc_token"] = "token"
+    session.save()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+
+class ResultSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        self.choices = [
+            Choice.objects.create(question=self.question, text=text)
+            for text in ("a", "b")]
+        for i in range(30):
+            voter = User.objects.create(
+                username=f"voter{i}", sp=i, vests=i * 2, reputation=25)
+            self.choices[i % 3 == 0].voted_users.add(voter)
+        Question.objects.filter(pk=self.question.pk).update(
+            expire_at=now() - timedelta(days=1))
+        self.question.refresh_from_db()
+        self.url = "/detail/@author/question/"
+
+    def test_frozen_results_match_the_live_results(self):
+        live = self.client.get(self.url)
+        call_command("freeze_expired_polls")
+        self.question.refresh_from_db()
+        self.assertIsNotNone(self.question.result_snapshot)
+
+        frozen = self.client.get(self.url)
+        self.assertEqual(
+            [(c["text"], c["percent"]) for c in live.context["choices"]],
+            [(c["text"], c["percent"]) for c in frozen.context["choices"]])
+        self.assertEqual(live.context["total_votes"],
+                         frozen.context["total_votes"])
+
+    def test_snapshot_voters_are_truncated(self):
+        self.question.freeze_results(top_n=5)
+        response = self.client.get(self.url)
+        choice = response.context["choices"][0]
+        self.assertEqual(len(choice["voters"]), 5)
+        self.assertEqual(choice["voter_count"], 20)
+        # top voters by SP
+        self.assertEqual(choice["voters"][0]["username"], "voter29")
+        self.assertContains(response, "only the top")
+
+    def test_filters_and_audit_skip_the_snapshot(self):
+        self.question.freeze_results(top_n=5)
+        response = self.client.get(self.url + "?sp=10")
+        self.assertTrue(response.context["filters_applied"])
+        self.assertNotContains(response, "only the top")
+
+        response = self.client.get(self.url + "?audit=1")
+        self.assertContains(response, "voter0")
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(25):
+            Question.objects.create(
+                text=f"Question {i}", username="author",
+                permlink=f"question-{i}", voter_count=i % 4,
+                expire_at=now() + timedelta(days=7))
+
+    def get_pages(self, order):
+        """Follow the next links of the index, return the permlinks."""
+        pages, url = [], f"/?order={order}"
+        while url:
+            polls = self.client.get(url).context["polls"]
+            pages.append([poll.permlink for poll in polls])
+            url = f"/?order={order}&cursor={polls.next_cursor}" \
+                if polls.has_next() else None
+        return pages
+
+    def test_next_pages(self):
+        for order, ordering in [("new", ["-id"]),
+                                ("trending", ["-voter_count", "-id"])]:
+            with self.subTest(order=order):
+                pages = self.get_pages(order)
+                self.assertEqual([len(page) for page in pages], [10, 10, 5])
+                self.assertEqual(
+                    sum(pages, []),
+                    list(Question.objects.order_by(*ordering).values_list(
+                        "permlink", flat=True)))
+
+    def test_previous_page(self):
+        first = self.client.get("/").context["polls"]
+        second = self.client.get(
+            f"/?cursor={first.next_cursor}").context["polls"]
+        self.assertTrue(second.has_previous())
+        previous = self.client.get(
+            f"/?cursor={second.previous_cursor}").context["polls"]
+        self.assertEqual(list(previous), list(first))
+        self.assertFalse(previous.has_previous())
+
+    def test_api_pages(self):
+        response = self.client.get("/api/v1/questions/")
+        self.assertNotIn("count", response.data)
+        self.assertEqual(len(response.data["results"]), 20)
+        response = self.client.get(response.data["next"] + "&with_count=1")
+        self.assertEqual(response.data["count"], 25)
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertIsNone(response.data["next"])
+        self.assertIsNotNone(response.data["previous"])
+
+    def test_invalid_cursors(self):
+        for cursor in ["garbage", encode_cursor(["x"]),
+                       encode_cursor([1, 2]), encode_cursor([None]),
+                       encode_cursor([[1]])]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(
+                    self.client.get(f"/?cursor={cursor}").status_code, 404)
+                self.assertEqual(self.client.get(
+                    f"/api/v1/questions/?cursor={cursor}").status_code, 404)
+
+
+class DenormalizedCounterTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(username="author")
+        self.voter = User.objects.create(username="voter")
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        self.choices = [
+            Choice.objects.create(question=self.question, text=text)
+            for text in ("a", "b", "c")]
+
+    def assertCounters(self, poll_count, vote_count, voter_count):
+        self.author.refresh_from_db()
+        self.voter.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(self.author.poll_count, poll_count)
+        self.assertEqual(self.voter.vote_count, vote_count)
+        self.assertEqual(self.question.voter_count, voter_count)
+
+    def test_votes_and_unvotes(self):
+        self.assertCounters(poll_count=1, vote_count=0, voter_count=0)
+
+        # one vote for multiple choices, the voter is counted once
+        register_vote(self.question, self.voter, self.choices[:2])
+        self.assertCounters(poll_count=1, vote_count=2, voter_count=1)
+
+        # both sides of the relation
+        self.choices[0].voted_users.remove(self.voter)
+        self.assertCounters(poll_count=1, vote_count=1, voter_count=1)
+        self.voter.choice_set.remove(self.choices[1])
+        self.assertCounters(poll_count=1, vote_count=0, voter_count=0)
+
+        self.choices[2].voted_users.add(self.voter)
+        self.assertCounters(poll_count=1, vote_count=1, voter_count=1)
+
+        self.choices[2].voted_users.clear()
+        self.assertCounters(poll_count=1, vote_count=0, voter_count=0)
+        self.voter.choice_set.add(*self.choices)
+        self.voter.choice_set.clear()
+        self.assertCounters(poll_count=1, vote_count=0, voter_count=0)
+
+    def test_poll_deletion(self):
+        Question.objects.create(
+            text="Other", username="author", permlink="other",
+            expire_at=now() + timedelta(days=7))
+        self.assertCounters(poll_count=2, vote_count=0, voter_count=0)
+        Question.objects.get(permlink="other").delete()
+        self.assertCounters(poll_count=1, vote_count=0, voter_count=0)
+
+
+class RenderedDescriptionTests(TestCase):
+
+    def setUp(self):
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            description="**bold**", expire_at=now() + timedelta(days=7))
+
+    def test_description_is_rendered_on_save(self):
+        self.assertIn("<strong>bold</strong>", self.question.description_html)
+
+        self.question.description = "*italic*"
+        self.question.save()
+        self.question.refresh_from_db()
+        self.assertIn("<em>italic</em>", self.question.description_html)
+        self.assertNotIn("bold", self.question.description_html)
+        self.assertEqual(self.question.rendered_description,
+                         self.question.description_html)
+
+    def test_unchanged_description_is_not_rendered_again(self):
+        # a marker shows if the stored HTML is rendered again
+        Question.objects.filter(pk=self.question.pk).update(
+            description_html="stored")
+        self.question.refresh_from_db()
+        self.question.text = "Edited"
+        self.question.save()
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.description_html, "stored")
+
+    def test_stale_descriptions_are_rendered_on_the_fly_and_backfilled(self):
+        # e.g. updated with a queryset update
+        Question.objects.filter(pk=self.question.pk).update(
+            description="`code`")
+        self.question.refresh_from_db()
+        self.assertIn("<code>code</code>",
+                      self.question.rendered_description)
+
+        call_command("render_descriptions")
+        self.question.refresh_from_db()
+        self.assertIn("<code>code</code>", self.question.description_html)
+        self.assertEqual(self.question.description_hash,
+                         self.question.get_description_hash())
+
+
+class ConditionalResponseTests(TestCase):
+
+    def setUp(self):
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        self.choice = Choice.objects.create(
+            question=self.question, text="a")
+        self.detail = "/detail/@author/question/"
+        self.audit = "/api/v1/audit/?username=author&permlink=question"
+        # the detail page sets the CSRF cookie a browser sends back
+        self.client.get(self.detail)
+
+    def vote(self):
+        register_vote(self.question,
+                      User.objects.create(username="voter", reputation=25,
+                                          sp=1, vests=2),
+                      [self.choice])
+
+    def test_not_modified_until_a_vote(self):
+        for url in (self.detail, self.audit):
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b"")
+
+        etags = {url: self.client.get(url)["ETag"]
+                 for url in (self.detail, self.audit)}
+        self.vote()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+
+    def test_filters_have_their_own_etag(self):
+        etag = self.client.get(self.detail)["ETag"]
+        response = self.client.get(
+            self.detail + "?stake_based=1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_closing_the_poll_is_a_modification(self):
+        url = "/api/v1/questions/%s/" % self.question.pk
+        etags = {u: self.client.get(u)["ETag"] for u in (self.detail, url)}
+        last_modified = self.client.get(url)["Last-Modified"]
+
+        later = self.question.expire_at + timedelta(minutes=1)
+        with mock.patch("polls.utils.now", return_value=later):
+            for u, etag in etags.items():
+                with self.subTest(url=u):
+                    response = self.client.get(u, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200)
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["Last-Modified"], last_modified)
+
+    def test_detail_etag_varies_on_the_csrf_cookie(self):
+        etag = self.client.get(self.detail)["ETag"]
+        self.assertFalse(self.client.get(self.detail).has_header(
+            "Last-Modified"))
+
+        # login rotates the CSRF cookie
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "x" * 64
+        response = self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_one_time_messages_are_not_dropped(self):
+        etag = self.client.get(self.detail)["ETag"]
+
+        response = self.client.get(
+            self.detail + "?after_promotion=1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+        self.assertContains(response, "Thanks for the promotion")
+
+        # a message queued by the previous request
+        request = RequestFactory().get("/")
+        self.client.cookies["messages"] = CookieStorage(request)._encode(
+            [Message(constants.INFO, "Pending message")])
+        response = self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Pending message")
+
+
+class SingleFlightTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight("test", wait_budget=0.5,
+                                   poll_interval=0.01)
+        self.calls = 0
+
+    def slow(self, result="result", delay=0.2):
+        def compute():
+            self.calls += 1
+            time.sleep(delay)
+            return result
+        return compute
+
+    def test_concurrent_callers_share_one_computation(self):
+        results = []
+        compute = self.slow()
+        threads = [threading.Thread(target=lambda: results.append(
+            self.flight.do("key", compute))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["result"] * 5)
+        self.assertEqual(self.calls, 1)
+
+        # served from the cache afterwards
+        self.assertEqual(self.flight.do("key", self.slow()), "result")
+        self.assertEqual(self.calls, 1)
+
+    def test_waiters_get_the_stale_result_after_the_budget(self):
+        self.flight.do("v1", self.slow("old", delay=0), stale_key="poll")
+        results = []
+        leader = threading.Thread(target=lambda: self.flight.do(
+            "v2", self.slow("new", delay=1), stale_key="poll"))
+        leader.start()
+        time.sleep(0.05)
+        results.append(self.flight.do("v2", self.slow("new"),
+                                      stale_key="poll"))
+        leader.join()
+        self.assertEqual(results, ["old"])
+        self.assertEqual(self.flight.do("v2", self.slow()), "new")
+
+    def test_errors_are_not_cached(self):
+        def fail():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            self.flight.do("key", fail)
+        self.assertEqual(self.flight.do("key", self.slow(delay=0)), "result")
+
+    def test_summaries_are_plain_values(self):
+        question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        choice = Choice.objects.create(question=question, text="a")
+        voter = User.objects.create(username="voter", sp=10, vests=20,
+                                    reputation=25)
+        register_vote(question, voter, [choice])
+        question.refresh_from_db()
+
+        choice_list, _, _, _, all_votes = get_votes_summary(question)
+        self.assertIsInstance(choice_list[0], dict)
+        self.assertEqual(choice_list[0]["voters"][0]["username"], "voter")
+        self.assertEqual(all_votes, 1)
+
+    def test_voter_stat_changes_bump_the_poll_versions(self):
+        question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        voter = User.objects.create(username="voter")
+        register_vote(question, voter,
+                      [Choice.objects.create(question=question, text="a")])
+        account = {
+            "name": "voter", "vesting_shares": "2000000.000000 VESTS",
+            "created": "2018-01-01T00:00:00", "post_count": 100,
+            "reputation": "27000000000",
+        }
+
+        versions = []
+        for post_count in (100, 100, 101):
+            account["post_count"] = post_count
+            voter.update_info(steem_per_mvest=500, account_detail=account)
+            question.refresh_from_db()
+            versions.append(question.version)
+        self.assertEqual(versions[0], versions[1])
+        self.assertEqual(versions[2], versions[1] + 1)
+
+
+@override_settings(DB_LOCK_RETRIES=10)
+class ConcurrentVoteTests(TransactionTestCase):
+
+    def setUp(self):
+        self.questions = [Question.objects.create(
+            text=f"Question {i}", username="author", permlink=f"question-{i}",
+            expire_at=now() + timedelta(days=7)) for i in range(2)]
+        self.choices = [
+            [Choice.objects.create(question=question, text=text)
+             for text in ("a", "b")]
+            for question in self.questions]
+        self.voters = [User.objects.create(username=f"voter{i}")
+                       for i in range(6)]
+
+    def test_concurrent_votes_are_all_registered(self):
+        barrier = threading.Barrier(len(self.voters))
+        errors = []
+
+        def vote(voter):
+            try:
+                barrier.wait()
+                for question, choices in zip(self.questions, self.choices):
+                    register_vote(question, voter, choices[:1])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=vote, args=(voter,))
+                   for voter in self.voters]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for question in self.questions:
+            question.refresh_from_db()
+            self.assertEqual(question.voter_count, len(self.voters))
+            self.assertEqual(VoteAudit.objects.filter(
+                question=question).count(), len(self.voters))
+        for voter in self.voters:
+            voter.refresh_from_db()
+            self.assertEqual(voter.vote_count, len(self.questions))
+
+    def test_vote_updates_the_counters_without_saving_the_poll(self):
+        question = self.questions[0]
+        version = question.version
+        with mock.patch.object(Question, "save") as save:
+            register_vote(question, self.voters[0], self.choices[0])
+        save.assert_not_called()
+        question.refresh_from_db()
+        self.assertEqual(question.voter_count, 1)
+        self.assertEqual(question.version, version + 1)
+
+    def test_locked_transactions_are_retried(self):
+        calls = []
+
+        def write():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError("database is locked")
+            return "written"
+
+        self.assertEqual(run_in_transaction(write), "written")
+        self.assertEqual(len(calls), 2)
+
+    def test_other_errors_and_nested_transactions_are_not_retried(self):
+        def write(message):
+            calls.append(1)
+            raise OperationalError(message)
+
+        calls = []
+        with self.assertRaises(OperationalError):
+            run_in_transaction(write, "no such table: polls_question")
+        self.assertEqual(len(calls), 1)
+
+        calls = []
+        with self.assertRaises(OperationalError):
+            with transaction.atomic():
+                run_in_transaction(write, "database is locked")
+        self.assertEqual(len(calls), 1)
+
+
+class AddChoicesTests(TestCase):
+
+    def setUp(self):
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        add_choices(self.question, ["a", "b", "c"])
+        self.ids = self.choice_ids()
+
+    def choice_ids(self):
+        return dict(self.question.choices.values_list("text", "id"))
+
+    def texts(self):
+        return list(self.question.choices.order_by("id").values_list(
+            "text", flat=True))
+
+    def test_unchanged_choices_keep_their_ids(self):
+        with self.assertNumQueries(1):
+            add_choices(self.question, ["a", "b", "c"], flush=True)
+        self.assertEqual(self.choice_ids(), self.ids)
+
+    def test_added_choices_are_appended(self):
+        add_choices(self.question, ["a", "b", "c", "d"], flush=True)
+        self.assertEqual(self.texts(), ["a", "b", "c", "d"])
+        self.assertEqual(self.choice_ids()["a"], self.ids["a"])
+
+    def test_removed_choices_are_deleted(self):
+        add_choices(self.question, ["a", "c"], flush=True)
+        self.assertEqual(self.texts(), ["a", "c"])
+        self.assertEqual(self.choice_ids()["c"], self.ids["c"])
+
+    def test_reordered_and_inserted_choices_keep_the_submitted_order(self):
+        add_choices(self.question, ["c", "a", "b"], flush=True)
+        self.assertEqual(self.texts(), ["c", "a", "b"])
+
+        add_choices(self.question, ["c", "x", "a", "b"], flush=True)
+        self.assertEqual(self.texts(), ["c", "x", "a", "b"])
+
+    def test_votes_of_the_deleted_choices_are_uncounted(self):
+        voter = User.objects.create(username="voter")
+        register_vote(self.question, voter,
+                      [self.question.choices.get(text="b")])
+        add_choices(self.question, ["a", "c"], flush=True)
+        voter.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(voter.vote_count, 0)
+        self.assertEqual(self.question.voter_count, 0)
+
+
+class SyncVoteTests(TestCase):
+
+    def setUp(self):
+        self.node = StubNode(latency=0).start()
+        self.addCleanup(self.node.stop)
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        Choice.objects.create(question=self.question, text="a")
+
+    def sync(self):
+        block_num, trx_id = self.node.add_transaction([["comment", {
+            "author": "voter",
+            "parent_author": "author",
+            "parent_permlink": "question",
+            "json_metadata": json.dumps({
+                "content_type": "poll_vote", "votes": ["a"]}),
+        }]])
+        with self.settings(HIVE_NODES=[self.node.url]):
+            return self.client.get(
+                f"/web-api/sync/?block_num={block_num}&trx_id={trx_id}")
+
+    def test_vote_is_registered(self):
+        response = self.sync()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(VoteAudit.objects.filter(
+            question=self.question, voter__username="voter").exists())
+
+    def test_votes_after_the_expiration_are_rejected(self):
+        Question.objects.filter(pk=self.question.pk).update(
+            expire_at=now() - timedelta(minutes=1))
+        response = self.sync()
+        self.assertContains(response, "expired", status_code=400)
+        self.assertFalse(VoteAudit.objects.exists())
+
+
+class RequestStatsMiddlewareTests(TestCase):
+
+    def test_sql_and_rpc_calls_are_reported(self):
+        server = HTTPServer(("127.0.0.1", 0), HivesignerStubHandler)
+        server.requests = []
+        server.responses = [(200, "{}"), (200, "{}")]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        def view(request):
+            list(User.objects.all())
+            list(User.objects.all())
+            get_user_sc_client("token").me()
+            # calls of the other libraries aren't counted
+            requests.post(f"http://127.0.0.1:{server.server_port}/",
+                          data="{}")
+            return HttpResponse()
+
+        middleware = RequestStatsMiddleware(view)
+        with self.settings(SLOW_REQUEST_THRESHOLD_MS=0,
+                           HIVESIGNER_API_BASE_URL=f"http://127.0.0.1:"
+                           f"{server.server_port}/api/"), \
+                self.assertLogs("dpoll.requests", "WARNING") as logs:
+            response = middleware(RequestFactory().get("/"))
+
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+        self.assertIn('desc="1 calls"', response["Server-Timing"])
+        line = json.loads(logs.records[0].getMessage())
+        self.assertTrue(line["slow"])
+        self.assertEqual(line["sql_count"], 2)
+        self.assertEqual(line["rpc_count"], 1)
+        self.assertEqual(line["top_queries"][0]["count"], 2)
+        self.assertFalse(hasattr(requests.Session.send, "instrumented"))
+
+    def test_fast_requests_are_logged_as_info(self):
+        with self.assertLogs("dpoll.requests", "INFO") as logs:
+            response = self.client.get("/api/v1/users/")
+
+        self.assertIn("Server-Timing", response)
+        self.assertEqual(logs.records[0].levelname, "INFO")
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["path"], "/api/v1/users/")
+        self.assertNotIn("top_queries", line)
+
+
+class ProfilerTests(TestCase):
+
+    def test_staff_users_get_a_profile_report(self):
+        Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        staff = User.objects.create(username="staff", is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get("/?profile")
+
+        self.assertEqual(response["Content-Type"],
+                         "text/plain; charset=utf-8")
+        body = response.content.decode()
+        self.assertIn("Response status: 200", body)
+        self.assertIn("cumulative", body)
+        self.assertIn('FROM "polls_question"', body)
+
+    def test_profile_parameter_is_ignored_for_other_users(self):
+        response = self.client.get("/api/v1/users/?profile")
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_commands_write_the_report_to_disk(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "report.txt")
+
+        call_command("freeze_expired_polls", profile=path)
+
+        with open(path) as f:
+            report = f.read()
+        self.assertIn("Command: freeze_expired_polls", report)
+        self.assertIn("SQL queries:", report)
+
+
+class StubNodeTests(TestCase):
+
+    def setUp(self):
+        self.node = StubNode(latency=0).start()
+        self.addCleanup(self.node.stop)
+
+    def test_stub_answers_hivesigner_and_condenser_calls(self):
+        with self.settings(HIVESIGNER_API_BASE_URL=self.node.url + "api/"):
+            user = get_user_sc_client("loadtest-voter").me()
+        self.assertEqual(user["name"], "voter")
+
+        block_num, trx_id = self.node.add_transaction([["comment", {}]])
+        client = LightsteemClient(nodes=[self.node.url])
+        block = client.get_block(block_num)
+        self.assertEqual(block["transactions"][0]["transaction_id"], trx_id)
+        self.assertEqual(client.get_accounts(["voter"])[0]["name"], "voter")
+
+    def test_stub_fails_with_the_error_rate(self):
+        self.node.error_rate = 1
+        response = requests.post(self.node.url + "api/me/")
+        self.assertEqual(response.status_code, 503)
+
+
+class MetricsTests(TransactionTestCase):
+    """TransactionTestCase, the votes are counted on commit."""
+
+    def create_poll(self):
+        question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        return question, Choice.objects.create(question=question, text="a")
+
+    def test_rolled_back_votes_are_not_counted(self):
+        question, choice = self.create_poll()
+        before = VOTES_REGISTERED.values.get((), 0)
+        with mock.patch("polls.utils.live_results_hub") as hub:
+            with transaction.atomic():
+                register_vote(question, User.objects.create(username="voter"),
+                              [choice])
+                transaction.set_rollback(True)
+        self.assertEqual(VOTES_REGISTERED.values.get((), 0), before)
+        hub.notify.assert_not_called()
+
+    def test_metrics_of_all_workers_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # values dumped by another worker
+        with open(os.path.join(directory, "metrics_1.json"), "w") as f:
+            json.dump({"dpoll_votes_registered_total": [[[], 5]]}, f)
+
+        question, choice = self.create_poll()
+        before = VOTES_REGISTERED.values.get((), 0)
+        register_vote(question, User.objects.create(username="voter"),
+                      [choice])
+
+        with self.settings(METRICS_MULTIPROC_DIR=directory,
+                           METRICS_TOKEN="secret"):
+            self.client.get("/api/v1/users/")
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            response = self.client.get(
+                "/metrics", HTTP_AUTHORIZATION="Bearer secret")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(
+            f"dpoll_votes_registered_total {float(before + 6)}", body)
+        self.assertIn(
+            'dpoll_view_latency_seconds_count{view="user_view_set-list"}',
+            body)
+        self.assertIn('dpoll_outbox_operations{status="pending"} 0', body)
+        self.assertTrue(os.path.exists(
+            os.path.join(directory, f"metrics_{os.getpid()}.json")))
+
+    def test_values_are_flushed_in_the_background(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, f"metrics_{os.getpid()}.json")
+        registry = Registry()
+
+        with self.settings(METRICS_MULTIPROC_DIR=directory,
+                           METRICS_FLUSH_INTERVAL=0.01):
+            # requests don't write the values
+            self.client.get("/api/v1/users/")
+            self.assertFalse(os.path.exists(path))
+
+            registry.start_flusher()
+            deadline = time.monotonic() + 2
+            while not os.path.exists(path) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertTrue(os.path.exists(path))
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_BACKOFF_BASE=0)
+class BroadcastOutboxTests(TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), HivesignerStubHandler)
+        self.server.requests = []
+        self.server.responses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.settings_override = override_settings(
+            HIVESIGNER_API_BASE_URL=f"http://127.0.0.1:"
+                                    f"{self.server.server_port}/api/")
+        self.settings_override.enable()
+
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        self.choice = Choice.objects.create(question=self.question, text="a")
+        self.voter = User.objects.create(username="voter")
+        self.vote_audit = VoteAudit.objects.create(
+            question=self.question, voter=self.voter)
+        self.vote_audit.choices.add(self.choice)
+        self.voter.choice_set.add(self.choice)
+        self.operation = OutboxOperation.objects.create(
+            kind=OutboxOperation.KIND_VOTE,
+            username="voter",
+            access_token="token",
+            permlink="vote-permlink",
+            operations=json.dumps([["comment", {"permlink": "vote-permlink"}]]),
+            question=self.question,
+            vote_audit=self.vote_audit,
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_vote_is_confirmed_after_a_retry(self):
+        self.server.responses = [
+            (503, "Service Unavailable"),
+            (200, json.dumps({"result": {"block_num": 10, "id": "trx"}})),
+        ]
+        self.question.refresh_from_db()
+        version = self.question.version
+        call_command("broadcast_outbox", "--once")
+        call_command("broadcast_outbox", "--once")
+
+        self.operation.refresh_from_db()
+        self.vote_audit.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(self.operation.status, OutboxOperation.STATUS_SENT)
+        self.assertEqual(self.operation.attempts, 2)
+        self.assertEqual(self.operation.access_token, "")
+        self.assertEqual(self.vote_audit.block_id, 10)
+        self.assertEqual(self.vote_audit.trx_id, "trx")
+        # the cached audit responses are invalidated
+        self.assertEqual(self.question.version, version + 1)
+        # retries send the same permlink
+        self.assertEqual(self.server.requests[0], self.server.requests[1])
+
+    def test_vote_is_reverted_when_broadcast_fails(self):
+        error = json.dumps({"error": "invalid", "error_description": "err"})
+        self.server.responses = [(400, error), (400, error)]
+        call_command("broadcast_outbox", "--once")
+        call_command("broadcast_outbox", "--once")
+
+        self.operation.refresh_from_db()
+        self.assertEqual(self.operation.status, OutboxOperation.STATUS_FAILED)
+        self.assertEqual(self.operation.access_token, "")
+        self.assertFalse(VoteAudit.objects.exists())
+        self.assertFalse(self.choice.voted_users.exists())
+
+    def test_failed_poll_is_deleted_with_its_votes(self):
+        operation = OutboxOperation.objects.create(
+            kind=OutboxOperation.KIND_POLL, username="author",
+            access_token="token", permlink="question", operations="[]",
+            question=self.question)
+        operation.mark_failed("error")
+
+        operation.refresh_from_db()
+        self.voter.refresh_from_db()
+        self.assertEqual(operation.status, OutboxOperation.STATUS_FAILED)
+        self.assertEqual(operation.access_token, "")
+        self.assertFalse(Question.objects.filter(pk=self.question.pk).exists())
+        self.assertFalse(VoteAudit.objects.exists())
+        self.assertEqual(self.voter.vote_count, 0)
+
+    def test_failed_edit_is_reverted(self):
+        self.question.json_metadata = json.dumps({"tags": ["old"]})
+        self.question.save()
+        set_poll_tags(self.question, ["old"])
+        previous_state = self.question.get_state()
+
+        self.question.text = "Edited"
+        self.question.json_metadata = json.dumps({"tags": ["new"]})
+        self.question.save()
+        set_poll_tags(self.question, ["new"])
+        Choice.objects.create(question=self.question, text="b")
+        operation = OutboxOperation.objects.create(
+            kind=OutboxOperation.KIND_EDIT, username="author",
+            access_token="token", permlink="question", operations="[]",
+            question=self.question, previous_state=json.dumps(previous_state))
+        operation.mark_failed("error")
+
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.text, "Question")
+        self.assertEqual(list(self.question.choices.values_list(
+            "text", flat=True)), ["a"])
+        self.assertEqual(list(PollTag.objects.filter(
+            question=self.question).values_list("tag", flat=True)), ["old"])
+        self.assertEqual(ChangeLogEntry.objects.last().kind,
+                         ChangeLogEntry.KIND_POLL_EDITED)
+
+
+class QueryCountScalingTests(TestCase):
+    """
+    Every endpoint issues the same number of queries for small and large
+    datasets, within its budget. A failure here is most likely an N+1.
+    """
+
+    # endpoint -> maximum number of queries
+    BUDGETS = {
+        "detail": 7,
+        "detail_stake": 7,
+        "detail_filtered": 7,
+        "detail_audit": 6,
+        "index": 12,
+        "profile": 2,
+        "profile_votes": 2,
+        "polls_by_vote_count": 1,
+        "vote_check": 2,
+        "api_audit": 4,
+        "api_questions": 3,
+        "api_question": 4,
+        "api_results": 6,
+        "api_results_filtered": 6,
+        "api_users": 1,
+        "api_user": 4,
+        "api_sponsors": 1,
+    }
+
+    def get_urls(self):
+        poll = Question.objects.order_by("-voter_count").first()
+        voter = User.objects.annotate(
+            votes=Count("choice")).order_by("-votes").first()
+        detail = f"/detail/@{poll.username}/{poll.permlink}/"
+        return {
+            "detail": detail,
+            "detail_stake": detail + "?stake_based=1",
+            "detail_filtered": detail + "?rep=50&sp=100",
+            "detail_audit": detail + "?audit=1",
+            "index": "/",
+            "profile": f"/user/@{poll.username}/",
+            "profile_votes": f"/user/@{voter.username}/?tab=votes",
+            "polls_by_vote_count": "/polls_by_vote/",
+            "vote_check": f"/web-api/vote_check/?question_id={poll.pk}"
+                          f"&voter_username={voter.username}",
+            "api_audit": f"/api/v1/audit/?username={poll.username}"
+                         f"&permlink={poll.permlink}",
+            "api_questions": "/api/v1/questions/",
+            "api_question": f"/api/v1/questions/{poll.pk}/",
+            "api_results": f"/api/v1/questions/{poll.pk}/results/",
+            "api_results_filtered": f"/api/v1/questions/{poll.pk}/results/"
+                                    f"?rep=50&stake_based=1",
+            "api_users": "/api/v1/users/",
+            "api_user": f"/api/v1/users/{voter.username}/",
+            "api_sponsors": "/api/v1/sponsors/",
+        }
+
+    def count_queries(self, **dataset):
+        """Return {endpoint: query count} for a generated dataset. The
+        dataset is rolled back afterwards."""
+        counts = {}
+        with transaction.atomic():
+            generate_data(**dataset)
+            for name, url in self.get_urls().items():
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200, url)
+                counts[name] = len(queries)
+            transaction.set_rollback(True)
+        return counts
+
+    def test_query_counts_do_not_grow_with_data(self):
+        small = self.count_queries(polls=3, choices=2, voters=10)
+        large = self.count_queries(polls=30, choices=8, voters=150)
+
+        self.assertEqual(set(small), set(self.BUDGETS))
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(endpoint=name):
+                self.assertLessEqual(small[name], budget)
+                self.assertEqual(small[name], large[name])
+
+
+class UpdateVoterCountTests(TestCase):
+
+    def setUp(self):
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        choices = [Choice.objects.create(question=self.question, text=text)
+                   for text in ("a", "b")]
+        voter = User.objects.create(username="voter")
+        # voters of multiple choices are counted once
+        voter.choice_set.add(*choices)
+        choices[0].voted_users.add(User.objects.create(username="voter2"))
+        Question.objects.filter(pk=self.question.pk).update(voter_count=7)
+        self.question.refresh_from_db()
+
+    def test_dry_run_does_not_update(self):
+        call_command("update_voter_count", "--dry-run")
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.voter_count, 7)
+
+    def test_drifted_counts_are_fixed(self):
+        version = self.question.version
+        call_command("update_voter_count", "--batch-size", "1")
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.voter_count, 2)
+        self.assertEqual(self.question.version, version + 1)
+
+    def test_outdated_instances_do_not_overwrite_the_count(self):
+        version = self.question.version
+        outdated = Question.objects.get(pk=self.question.pk)
+        call_command("update_voter_count")
+
+        outdated.text = "Edited"
+        outdated.save()
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.text, "Edited")
+        self.assertEqual(self.question.voter_count, 2)
+        self.assertEqual(self.question.version, version + 2)
+        self.assertEqual(outdated.version, self.question.version)
+        self.assertEqual(outdated.voter_count, 2)
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_data(polls=4, choices=3, voters=10)
+        audit = VoteAudit.objects.order_by("id").first()
+        audit.choices.add(audit.question.choices.first())
+
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create(username="staff", is_staff=True))
+
+    def get_rows(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_ndjson_export_with_filters(self):
+        polls = self.get_rows("/export/polls/")
+        self.assertEqual(len(polls), Question.objects.count())
+
+        min_id = polls[1]["id"]
+        choices = self.get_rows(f"/export/choices/?min_id={min_id}")
+        self.assertEqual(
+            len(choices),
+            Choice.objects.filter(question_id__gte=min_id).count())
+
+        audits = self.get_rows("/export/audits/")
+        self.assertEqual(len(audits), VoteAudit.objects.count())
+        self.assertEqual(len(audits[0]["choice_ids"]), 1)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(
+            self.client.get("/export/polls/?format=xml").status_code, 400)
+        self.assertEqual(
+            self.client.get("/export/polls/?min_id=a").status_code, 400)
+        self.assertEqual(self.client.get("/export/users/").status_code, 404)
+
+    @override_settings(EXPORT_TOKEN="secret")
+    def test_export_needs_staff_or_token(self):
+        self.client.logout()
+        self.assertEqual(self.client.get("/export/polls/").status_code, 403)
+        self.assertEqual(self.client.get(
+            "/export/polls/", HTTP_AUTHORIZATION="Bearer wrong").status_code,
+            403)
+        self.assertEqual(self.client.get(
+            "/export/polls/", HTTP_AUTHORIZATION="Bearer secret").status_code,
+            200)
+
+    def test_command_exports_csv_in_chunks(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "votes.csv")
+
+        call_command("export_data", "votes", "--format", "csv",
+                     "--chunk-size", "7", "--output", path)
+
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], [
+            "id", "question_id", "choice_id", "user_id", "username"])
+        self.assertEqual(
+            len(rows) - 1, Choice.voted_users.through.objects.count())
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class ChangeFeedTests(TestCase):
+
+    def setUp(self):
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        self.choice = Choice.objects.create(question=self.question, text="a")
+        ChangeLogEntry.log_poll(
+            ChangeLogEntry.KIND_POLL_CREATED, self.question)
+        for i in range(3):
+            register_vote(self.question,
+                          User.objects.create(username=f"voter{i}"),
+                          [self.choice])
+
+    def test_changes_are_paginated_by_sequence(self):
+        response = self.client.get("/api/v1/changes/?limit=3")
+        self.assertTrue(response.data["has_more"])
+        self.assertEqual(
+            [c["kind"] for c in response.data["results"]],
+            ["poll_created", "vote", "vote"])
+        self.assertEqual(response.data["results"][1]["data"],
+                         {"choice_ids": [self.choice.pk]})
+
+        response = self.client.get(
+            f"/api/v1/changes/?since={response.data['last_seq']}")
+        self.assertFalse(response.data["has_more"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["username"], "voter2")
+
+    def test_recent_changes_are_held_back(self):
+        with self.settings(CHANGE_FEED_SETTLE_SECONDS=60):
+            response = self.client.get("/api/v1/changes/")
+        self.assertEqual(response.data["results"], [])
+        self.assertEqual(response.data["last_seq"], 0)
+
+    def test_invalid_parameters(self):
+        for query in ("since=abc", "limit=0", "limit=-1"):
+            response = self.client.get(f"/api/v1/changes/?{query}")
+            self.assertEqual(response.status_code, 400)
+
+    def test_user_updates_are_logged_when_the_stats_change(self):
+        user = User.objects.get(username="voter0")
+        account = {
+            "name": "voter0", "vesting_shares": "2000000.000000 VESTS",
+            "created": "2018-01-01T00:00:00", "post_count": 100,
+            "reputation": "27000000000",
+        }
+        for post_count in (100, 100, 101):
+            account["post_count"] = post_count
+            user.update_info(steem_per_mvest=500, account_detail=account)
+
+        self.assertEqual(ChangeLogEntry.objects.filter(
+            kind=ChangeLogEntry.KIND_USER_UPDATED).count(), 2)
+
+
+class BatchLookupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_data(polls=5, choices=3, voters=10)
+
+    def test_users_are_looked_up_with_a_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                "/api/v1/batch/users/?usernames=voter1,voter2,nobody")
+        self.assertEqual(set(response.data["results"]), {"voter1", "voter2"})
+        self.assertEqual(response.data["missing"], ["nobody"])
+
+        response = self.client.post(
+            "/api/v1/batch/users/", {"usernames": ["voter3"]},
+            content_type="application/json")
+        self.assertEqual(
+            response.data["results"]["voter3"]["username"], "voter3")
+
+    def test_polls_are_looked_up_with_two_queries(self):
+        keys = [f"{q.username}/{q.permlink}"
+                for q in Question.objects.all()] + ["voter0/missing"]
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                f"/api/v1/batch/questions/?polls={','.join(keys)}")
+        self.assertEqual(len(response.data["results"]), len(keys) - 1)
+        self.assertEqual(response.data["missing"], ["voter0/missing"])
+
+        question = Question.objects.order_by("-voter_count").first()
+        data = response.data["results"][
+            f"{question.username}/{question.permlink}"]
+        self.assertEqual(
+            sum(c["vote_count"] for c in data["choices"]),
+            Choice.voted_users.through.objects.filter(
+                choice__question=question).count())
+
+    def test_too_many_keys(self):
+        with self.settings(BATCH_LOOKUP_MAX_KEYS=2):
+            response = self.client.get(
+                "/api/v1/batch/users/?usernames=a,b,c")
+        self.assertEqual(response.status_code, 400)
+
+
+class ResultsAPITests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        self.choices = [
+            Choice.objects.create(question=self.question, text=text)
+            for text in ("a", "b")]
+        whale = User.objects.create(username="whale", sp=900, vests=1800,
+                                    reputation=70)
+        minnow = User.objects.create(username="minnow", sp=100, vests=200,
+                                     reputation=30)
+        self.choices[0].voted_users.add(whale)
+        self.choices[1].voted_users.add(minnow)
+        self.url = f"/api/v1/questions/{self.question.pk}/results/"
+
+    def test_results(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["ETag"])
+        choices = response.data["choices"]
+        self.assertEqual([c["voter_count"] for c in choices], [1, 1])
+        self.assertEqual([c["sp"] for c in choices], [900, 100])
+        self.assertEqual([c["percent"] for c in choices], [50, 50])
+
+        response = self.client.get(self.url + "?stake_based=1")
+        self.assertEqual(
+            [c["percent"] for c in response.data["choices"]], [90, 10])
+
+        response = self.client.get(self.url + "?rep=50")
+        self.assertTrue(response.data["filters_applied"])
+        self.assertEqual(
+            [c["voter_count"] for c in response.data["choices"]], [1, 0])
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # the filters are a part of the ETag
+        response = self.client.get(
+            self.url + "?rep=50", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class LiveResultsTests(TestCase):
+
+    def setUp(self):
+        self.question = Question.objects.create(
+            text="Question", username="author", permlink="question",
+            expire_at=now() + timedelta(days=7))
+        self.choices = [
+            Choice.objects.create(question=self.question, text=text)
+            for text in ("a", "b")]
+        self.hub = ResultHub()
+
+    def vote(self, username, choice):
+        register_vote(self.question, User.objects.create(username=username),
+                      [choice])
+
+    def test_subscribers_get_the_results_then_the_deltas(self):
+        self.vote("voter1", self.choices[0])
+        subscribers = [self.hub.subscribe(self.question.pk) for _ in range(3)]
+        for subscriber in subscribers:
+            self.assertIn('"total": 1', subscriber.get_nowait())
+
+        self.vote("voter2", self.choices[1])
+        # one tally for all the subscribers
+        with self.assertNumQueries(4):
+            self.assertEqual(self.hub.poll_once(), 3)
+        for subscriber in subscribers:
+            event = subscriber.get_nowait()
+            self.assertTrue(event.startswith("event: delta\n"))
+            self.assertIn(f'"choice_id": {self.choices[1].pk}, "count": 1, '
+                          f'"total": 2', event)
+
+        self.assertEqual(self.hub.poll_once(), 0)
+
+    def test_polls_without_subscribers_are_not_counted(self):
+        self.hub.subscribe(self.question.pk)
+        other = Question.objects.create(
+            text="Other", username="author", permlink="other",
+            expire_at=now() + timedelta(days=7))
+        register_vote(other, User.objects.create(username="voter"),
+                      [Choice.objects.create(question=other, text="c")])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.hub.poll_once(), 0)
+
+    def test_first_subscriber_skips_the_idle_change_log(self):
+        subscriber = self.hub.subscribe(self.question.pk)
+        self.hub.unsubscribe(self.question.pk, subscriber)
+        self.vote("voter1", self.choices[0])
+        self.vote("voter2", self.choices[1])
+
+        subscriber = self.hub.subscribe(self.question.pk)
+        self.assertIn('"total": 2', subscriber.get_nowait())
+        self.assertEqual(self.hub.last_seq, ChangeLogEntry.objects.order_by(
+            "-id").values_list("id", flat=True).first())
+        with self.assertNumQueries(1):
+            self.assertEqual(self.hub.poll_once(), 0)
+
+    def test_tally_is_counted_outside_the_lock(self):
+        def unlocked_tally(question_id):
+            self.assertFalse(self.hub.lock.locked())
+            return get_tally(question_id)
+
+        with mock.patch("polls.live.get_tally",
+                        side_effect=unlocked_tally) as tally:
+            self.hub.subscribe(self.question.pk)
+        tally.assert_called_once_with(self.question.pk)
+
+    def test_stream(self):
+        response = self.client.get("/live/@author/question/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = iter(response.streaming_content)
+        self.assertTrue(next(stream).startswith(b"retry:"))
+        self.assertTrue(next(stream).startswith(b"event: results\n"))
+        response.close()
+
+        response = self.client.get("/live/@author/missing/")
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(LIVE_RESULTS_MAX_STREAMS=1)
+    def test_streams_over_the_limit_fall_back_to_polling(self):
+        response = self.client.get("/live/@author/question/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        fallback = self.client.get("/live/@author/question/")
+        self.assertEqual(fallback.status_code, 503)
+        self.assertEqual(fallback["Retry-After"], "5")
+        results_url = fallback.json()["results_url"]
+        self.assertEqual(results_url,
+                         f"/api/v1/questions/{self.question.pk}/results/")
+        self.assertEqual(self.client.get(results_url).status_code, 200)
+
+        # closing a stream frees its slot, even if it wasn't read
+        response.close()
+        response = self.client.get("/live/@author/question/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        response.close()
+
+    def test_database_errors_are_logged(self):
+        with mock.patch.object(self.hub, "poll_once",
+                               side_effect=DatabaseError("gone")), \
+                self.assertLogs("dpoll.live", "WARNING") as logs:
+            self.assertEqual(self.hub.run_once(), 0)
+        self.assertIn("gone", logs.output[0])
+
+
+class SearchTests(TestCase):
+
+    def create_poll(self, text, permlink, choices=(), description=""):
+        question = Question.objects.create(
+            text=text, username="author", permlink=permlink,
+            description=description, expire_at=now() + timedelta(days=7))
+        for choice in choices:
+            Choice.objects.create(question=question, text=choice)
+        return question
+
+    def setUp(self):
+        self.weather = self.create_poll(
+            "Best weather?", "weather", ["Sunny", "Rainy"])
+        self.coffee = self.create_poll(
+            "Favorite drink?", "coffee", ["Coffee", "Tea"],
+            description="Morning weather and a hot drink")
+
+    def test_search_is_ranked_and_synced(self):
+        # title matches rank higher than the description matches
+        self.assertEqual(search_questions("weather", 10),
+                         [self.weather, self.coffee])
+        self.assertEqual(search_questions("tea", 10), [self.coffee])
+        self.assertEqual(search_questions("rain", 10), [self.weather])
+
+        self.weather.text = "Best season?"
+        self.weather.save()
+        Choice.objects.filter(text="Tea").delete()
+        self.assertEqual(search_questions("weather", 10), [self.coffee])
+        self.assertEqual(search_questions("tea", 10), [])
+
+        self.coffee.is_deleted = True
+        self.coffee.save()
+        self.assertEqual(search_questions("drink", 10), [])
+        self.weather.delete()
+        self.assertEqual(search_questions("season", 10), [])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(search_questions('"weather* (', 10),
+                         [self.weather, self.coffee])
+        self.assertEqual(search_questions("*", 10), [])
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM polls_question_fts")
+        self.assertEqual(search_questions("coffee", 10), [])
+        call_command("rebuild_search_index")
+        self.assertEqual(search_questions("coffee", 10), [self.coffee])
+
+    def test_views(self):
+        response = self.client.get("/search/?q=coffee")
+        self.assertContains(response, "Favorite drink?")
+
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/v1/search/?q=weather&limit=1")
+        self.assertEqual(
+            [poll["permlink"] for poll in response.data["results"]],
+            ["weather"])
+        self.assertEqual(len(response.data["results"][0]["choices"]), 2)
+
+    def test_choices_of_the_created_and_edited_polls_are_indexed(self):
+        login_with_token(self.client, "author2")
+        form = {
+            "question": "Which instrument?",
+            "answers[]": ["guitar", "piano"],
+            "expire-at": "1_week",
+        }
+        self.client.post("/create/", form)
+        question = Question.objects.get(username="author2")
+        self.assertEqual(search_questions("piano", 10), [question])
+
+        form["answers[]"] = ["guitar", "violin"]
+        self.client.post(f"/edit/@author2/{question.permlink}/", form)
+        self.assertEqual(search_questions("piano", 10), [])
+        self.assertEqual(search_questions("violin", 10), [question])
+
+    def test_unchanged_polls_are_not_reindexed(self):
+        question = Question.objects.get(pk=self.weather.pk)
+        with CaptureQueriesContext(connection) as queries:
+            question.save()
+            register_vote(question, User.objects.create(username="voter"),
+                          [question.choices.first()])
+        self.assertFalse(any("polls_question_fts" in query["sql"]
+                             for query in queries.captured_queries))
+
+    def test_other_databases_fall_back_to_no_search(self):
+        with mock.patch("polls.search.connection", vendor="oracle"):
+            self.coffee.text = "Favorite tea?"
+            self.coffee.save()
+            self.assertEqual(search_questions("coffee", 10), [])
+
+
+class PollTagTests(TestCase):
+
+    def create_poll(self, permlink, tags):
+        question = Question.objects.create(
+            text=permlink, username="author", permlink=permlink,
+            expire_at=now() + timedelta(days=7),
+            json_metadata=json.dumps({"tags": tags}))
+        return question
+
+    def setUp(self):
+        self.music = self.create_poll("music", ["dpoll", "Music", "art"])
+        self.paint = self.create_poll("paint", ["art"])
+        for question in (self.music, self.paint):
+            set_poll_tags(question, question.tags)
+
+    def popularity(self):
+        return dict(TagPopularity.objects.values_list("tag", "poll_count"))
+
+    def test_tags_and_popularity(self):
+        # default tags are dropped, tags are lowercased
+        self.assertEqual(
+            set(self.music.poll_tags.values_list("tag", flat=True)),
+            {"music", "art"})
+        self.assertEqual(self.popularity(), {"music": 1, "art": 2})
+
+        set_poll_tags(self.music, ["music", "jazz"])
+        self.assertEqual(self.popularity(),
+                         {"music": 1, "art": 1, "jazz": 1})
+
+        self.paint.delete()
+        self.assertEqual(self.popularity(), {"music": 1, "jazz": 1})
+
+    def test_refresh_counts_the_voters(self):
+        choice = Choice.objects.create(question=self.paint, text="a")
+        choice.voted_users.add(User.objects.create(username="voter"))
+        call_command("refresh_tag_popularity")
+        self.assertEqual(
+            TagPopularity.objects.get(tag="art").voter_count, 1)
+
+    def test_refresh_after_a_tag_change(self):
+        call_command("refresh_tag_popularity")
+        started_at = TagPopularityRefresh.get_watermark()
+
+        choice = Choice.objects.create(question=self.paint, text="a")
+        choice.voted_users.add(User.objects.create(username="voter"))
+        # tag changes of the other polls don't move the watermark
+        TagPopularity.objects.update(updated_at=now() + timedelta(hours=1))
+        call_command("refresh_tag_popularity")
+        self.assertEqual(
+            TagPopularity.objects.get(tag="art").voter_count, 1)
+        self.assertGreater(TagPopularityRefresh.get_watermark(), started_at)
+        self.assertEqual(TagPopularityRefresh.objects.count(), 1)
+
+    def test_import(self):
+        PollTag.objects.all().delete()
+        # polls without the stored metadata are skipped
+        Question.objects.filter(pk=self.create_poll("legacy", ["art"]).pk) \
+            .update(json_metadata=None)
+        call_command("import_poll_tags")
+        self.assertEqual(self.popularity(), {"music": 1, "art": 2})
+
+    def test_tag_page_and_api(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/tag/art/")
+        self.assertContains(response, "2 polls")
+        self.assertEqual(
+            [poll.permlink for poll in response.context["polls"]],
+            ["paint", "music"])
+
+        response = self.client.get("/api/v1/tags/")
+        self.assertEqual(response.data["results"][0]["tag"], "art")
+
+        # the page and the choices
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/v1/tags/art/questions/")
+        self.assertEqual(
+            [poll["permlink"] for poll in response.data["results"]],
+            ["paint", "music"])
+
+    def test_tags_are_stored_locally_on_create_and_read_on_edit(self):
+        login_with_token(self.client, "author2")
+        self.client.post("/create/", {
+            "question": "Which instrument?",
+            "answers[]": ["guitar", "piano"],
+            "expire-at": "1_week",
+            "tags": "Jazz,music",
+        })
+        question = Question.objects.get(username="author2")
+        self.assertEqual(question.tags, settings.DEFAULT_TAGS + [
+            "Jazz", "music"])
+        self.assertEqual(
+            set(question.poll_tags.values_list("tag", flat=True)),
+            {"jazz", "music"})
+
+        # the edit form doesn't need the chain for the tags
+        with mock.patch("polls.views.fetch_poll_data_cached") as fetch:
+            response = self.client.get(
+                f"/edit/@author2/{question.permlink}/")
+        fetch.assert_not_called()
+        self.assertEqual(response.context["form_data"]["tags"], "Jazz,music")
+
+
+class BenchmarkTests(TestCase):
+    """Smoke test of the benchmark suite with a tiny dataset."""
+
+    def test_benchmarks_run_on_synthetic_data(self):
+        dataset = generate_data(polls=3, choices=3, voters=10)
+        self.assertEqual(dataset["polls"], 3)
+        self.assertEqual(Question.objects.count(), 3)
+
+        results = run_benchmarks(repeat=1)
+        self.assertEqual(set(SUMMARY_MODES) - set(results), set())
+        for result in results.values():
+            self.assertGreater(result["queries"], 0)
+
+        slower = {
+            name: dict(result, wall_ms_median=result["wall_ms_median"] * 2)
+            for name, result in results.items()}
+        regressions = [row for row in compare_results(results, slower)
+                       if row[4]]
+        self.assertTrue(regressions)
+
+        path = os.path.join(tempfile.mkdtemp(), "bench.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, "w") as f:
+            json.dump({"results": results}, f)
+        command = BenchmarkCommand()
+        with mock.patch("builtins.print"):
+            command.compare(path, results, threshold=20)
+            with self.assertRaisesMessage(CommandError, "regressions found"):
+                command.compare(path, slower, threshold=20)
@@ -10,7 +10,12 @@ from .api_views import (
     TeamView,
     AuditView,
     SponsorViewSet,
-    UserViewSet
+    UserViewSet,
+    ChangeFeedView,
+    UserBatchView,
+    QuestionBatchView,
+    SearchView,
+    TagViewSet,
 )
 
 
@@ -21,6 +26,7 @@ api_router.register(r'users', UserViewSet,
                 base_name='user_view_set')
 api_router.register(r'team', TeamView, base_name='team')
 api_router.register(r'sponsors', SponsorViewSet, base_name='sponsors')
+api_router.register(r'tags', TagViewSet, base_name='tags')
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -34,7 +40,19 @@ urlpatterns = [
     path('edit/@<str:author>/<str:permlink>/', views.edit_poll, name='edit'),
     path('polls_by_vote/', views.polls_by_vote_count, name='polls-by-vote'),
     path('api/v1/audit/', AuditView.as_view(), name="api-audit"),
+    path('api/v1/changes/', ChangeFeedView.as_view(), name="api-changes"),
+    path('api/v1/batch/users/', UserBatchView.as_view(),
+         name="api-batch-users"),
+    path('api/v1/search/', SearchView.as_view(), name="api-search"),
+    path('api/v1/batch/questions/', QuestionBatchView.as_view(),
+         name="api-batch-questions"),
     path('web-api/vote_tx/', views.vote_transaction_details, name="vote-tx"),
     path('web-api/sync/', views.sync_vote, name="sync-vote"),
     path('web-api/vote_check/', views.vote_check, name="check-vote"),
+    path('metrics', views.metrics, name="metrics"),
+    path('export/<str:kind>/', views.export, name="export"),
+    path('search/', views.search, name="search"),
+    path('tag/<str:tag>/', views.tag, name="tag"),
+    path('live/@<str:user>/<str:permlink>/', views.live_results,
+         name="live-results"),
 ]
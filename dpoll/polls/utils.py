@@ -1,49 +1,94 @@
 import uuid
 import copy
+import hashlib
 import json
+import time
 from datetime import timedelta
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
-from django.db import connection
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.utils.dateparse import parse_datetime
 from django.utils.text import slugify
-from steemconnect.client import Client
 from steemconnect.operations import CommentOptions, Comment
 from django.utils.timezone import now
 from .post_templates import get_body
-from lightsteem.client import Client as LightSteemClient
 
 
-from .models import Question, Choice
+from .models import Question, Choice, VoteAudit, OutboxOperation, \
+    ChangeLogEntry, PollTag, TagPopularity
+from .clients import HiveClient, HivesignerClient
+from .live import hub as live_results_hub
+from .search import get_backend as get_search_backend
+from .metrics import CACHE_REQUESTS, VOTES_REGISTERED
+from .singleflight import SingleFlight
+
+# OperationalError messages of the lock conflicts between the writers.
+LOCK_ERRORS = ("database is locked", "database table is locked", "deadlock",
+               "could not obtain lock", "lock timeout")
 
 _sc_client = None
 
+_summary_flight = SingleFlight(
+    "votes_summary",
+    result_ttl=settings.POLL_SUMMARY_CACHE_TTL,
+    wait_budget=settings.POLL_SUMMARY_WAIT_BUDGET,
+)
+
 
 def get_sc_client():
     global _sc_client
     if not _sc_client:
-        _sc_client = Client(
+        _sc_client = HivesignerClient(
             client_id=settings.SC_CLIENT_ID,
             client_secret=settings.SC_CLIENT_SECRET,
-            oauth_base_url="https://hivesigner.com/oauth2/",
-            sc2_api_base_url="https://hivesigner.com/api/",
+            oauth_base_url=settings.HIVESIGNER_OAUTH_BASE_URL,
+            sc2_api_base_url=settings.HIVESIGNER_API_BASE_URL,
         )
 
     return _sc_client
 
 
+def get_user_sc_client(access_token):
+    return HivesignerClient(
+        access_token=access_token,
+        oauth_base_url=settings.HIVESIGNER_OAUTH_BASE_URL,
+        sc2_api_base_url=settings.HIVESIGNER_API_BASE_URL,
+    )
+
+
+def queue_broadcast(request, kind, operations, permlink, question=None,
+                    vote_audit=None, previous_state=None):
+    """
+    Queue the operations to be broadcasted by the broadcast_outbox command
+    with the hivesigner token of the current user. Edits pass the
+    previous state of the poll, it's restored if the broadcast fails.
+    Returns None if broadcasting is disabled.
+    """
+    if not settings.BROADCAST_TO_BLOCKCHAIN:
+        return None
+    return OutboxOperation.objects.create(
+        kind=kind,
+        username=request.user.username,
+        access_token=request.session.get("sc_token"),
+        permlink=permlink,
+        operations=json.dumps(operations),
+        question=question,
+        vote_audit=vote_audit,
+        previous_state=json.dumps(previous_state) if previous_state else None,
+    )
+
+
 def remove_duplicates(_list):
     """
     A helper function to remove duplicate
     elements from a list and keeps the list order.
     list(set(list... usage loses the order.
+    dicts keep the insertion order, so it's O(n).
     """
-    new_list = []
-    for element in _list:
-        if element not in new_list:
-            new_list.append(element)
-    return new_list
+    return list(dict.fromkeys(_list))
 
 
 def get_comment(request, question, choices, permlink, tags=None):
@@ -206,6 +251,34 @@ def validate_input(request):
            allow_multiple_choices
 
 
+def normalize_tags(tags):
+    """Lowercase, deduplicate and drop the default tags every poll has."""
+    normalized = []
+    for tag in tags or []:
+        tag = str(tag).strip().lower()[:100]
+        if tag and tag not in settings.DEFAULT_TAGS \
+                and tag not in normalized:
+            normalized.append(tag)
+    return normalized
+
+
+def set_poll_tags(question, tags):
+    """
+    Store the tags of a poll in the PollTag relation. Only the
+    removed/added tags are written and their popularity is refreshed.
+    """
+    tags = normalize_tags(tags)
+    existing = set(PollTag.objects.filter(
+        question=question).values_list("tag", flat=True))
+    # the popularity of the removed tags is refreshed by the signals
+    PollTag.objects.filter(question=question).exclude(tag__in=tags).delete()
+    added = [tag for tag in tags if tag not in existing]
+    PollTag.objects.bulk_create(
+        [PollTag(question=question, tag=tag) for tag in added])
+    TagPopularity.refresh(added)
+    return tags
+
+
 def add_or_get_question(request, question_text, permlink, days,
                         allow_multiple_choices):
     try:
@@ -230,22 +303,137 @@ def add_or_get_question(request, question_text, permlink, days,
     return question
 
 
+def delete_choices(choice_ids):
+    # clear() keeps the voter counts in sync, the cascade doesn't.
+    for choice in Choice.objects.filter(
+            pk__in=choice_ids, voted_users__isnull=False).distinct():
+        choice.voted_users.clear()
+    Choice.objects.filter(pk__in=choice_ids).delete()
+
+
 def add_choices(question, choices, flush=False):
+    """
+    Add the choices of a poll with a single INSERT.
+
+    With flush (edits), the existing choices are diffed against the new
+    ones. The choices are listed in the id order, so the untouched choices
+    keep their ids only if they stay in front of the new ones, in the same
+    order: removed choices are deleted and the new ones are appended.
+    Otherwise (reordered or inserted choices) all of them are recreated.
+    """
+    kept = []
     if flush:
-        Choice.objects.filter(question=question).delete()
-    for choice in choices:
-        choice_instance = Choice(
-            question=question,
-            text=choice,
-        )
-        choice_instance.save()
+        existing_choices = list(Choice.objects.filter(
+            question=question).order_by("id"))
+        kept = [choice.text for choice in existing_choices
+                if choice.text in choices]
+        if kept != choices[:len(kept)]:
+            kept = []
+        removed_ids = [choice.id for choice in existing_choices
+                       if choice.text not in kept]
+        if removed_ids:
+            delete_choices(removed_ids)
+
+    added = choices[len(kept):]
+    if added:
+        Choice.objects.bulk_create([
+            Choice(question=question, text=choice) for choice in added])
+        # bulk_create doesn't send post_save, index the choices here.
+        get_search_backend().update_choices(question.pk)
+
+
+def restore_poll(question, state):
+    """Restore a poll to a state returned by Question.get_state()."""
+    question.text = state["text"]
+    question.description = state["description"]
+    question.expire_at = parse_datetime(state["expire_at"])
+    question.allow_multiple_choices = state["allow_multiple_choices"]
+    question.json_metadata = state["json_metadata"]
+    question.save()
+    add_choices(question, state["choices"], flush=True)
+    set_poll_tags(question, question.tags or [])
+    return question
+
+
+def get_poll_choices(question, choice_ids):
+    """
+    Resolve the submitted choice ids of a poll with a single query.
+    Returns None if any of the ids is invalid or belongs to another poll.
+    """
+    try:
+        choice_ids = remove_duplicates([int(c) for c in choice_ids])
+    except (TypeError, ValueError):
+        return None
+    if not choice_ids:
+        return None
+    choices = Choice.objects.filter(question=question).in_bulk(choice_ids)
+    if len(choices) != len(choice_ids):
+        return None
+    return [choices[choice_id] for choice_id in choice_ids]
+
+
+def is_lock_error(error):
+    return any(message in str(error).lower() for message in LOCK_ERRORS)
+
+
+def run_in_transaction(func, *args, **kwargs):
+    """
+    Run func in a transaction, and run it again if a concurrent writer
+    holds the database lock. Inside another transaction it isn't retried,
+    the outermost call retries the whole transaction instead.
+    """
+    retries = 0 if connection.in_atomic_block else settings.DB_LOCK_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        except OperationalError as e:
+            if attempt == retries or not is_lock_error(e):
+                raise
+            time.sleep(settings.DB_LOCK_RETRY_DELAY * (attempt + 1))
+
+
+def _register_vote(question, user, choices, block_id=None, trx_id=None):
+    # the audit entry is inserted first: a transaction starting with a
+    # read can't take the write lock of SQLite while another vote is being
+    # written, and fails with "database is locked" instead of waiting.
+    vote_audit = VoteAudit.objects.create(
+        question=question,
+        voter=user,
+        block_id=block_id,
+        trx_id=trx_id,
+    )
+    user.choice_set.add(*choices)
+    vote_audit.choices.add(*choices)
+    ChangeLogEntry.log(
+        ChangeLogEntry.KIND_VOTE,
+        question=question,
+        username=user.username,
+        data={"choice_ids": [choice.pk for choice in choices]},
+    )
+    return vote_audit
+
+
+def register_vote(question, user, choices, block_id=None, trx_id=None):
+    """
+    Register a vote and its audit log in one transaction.
+    Voters are inserted with a single M2M insert, so the voter count is
+    updated once per vote. The vote is counted and announced to the live
+    results only once the outer transaction (if any) commits.
+    """
+    vote_audit = run_in_transaction(
+        _register_vote, question, user, choices, block_id=block_id,
+        trx_id=trx_id)
+    transaction.on_commit(VOTES_REGISTERED.inc)
+    transaction.on_commit(live_results_hub.notify)
+    return vote_audit
 
 
 def fetch_poll_data(author, permlink):
     """
     Fetch a poll from the blockchain and return the poll metadata.
     """
-    c = LightSteemClient()
+    c = HiveClient(nodes=settings.HIVE_NODES)
     content = c.get_content(author, permlink)
     if content.get("id") == 0:
         raise ValueError("Not a valid blockchain Comment object")
@@ -255,17 +443,12 @@ def fetch_poll_data(author, permlink):
     if metadata.get("content_type") != "poll":
         raise ValueError("Not a poll")
 
-    votes_casted = False
-    comments = c.get_content_replies(author, permlink)
-    for comment in comments:
-        if not comment.get("json_metadata"):
-            continue
-        json_metadata = json.loads(comment.get("json_metadata"))
-        try:
-            if json_metadata and json_metadata.get("content_type") == "poll_vote":
-                votes_casted = True
-        except AttributeError:
-            continue
+    # votes are answered from the local vote tables instead of scanning
+    # every reply of the poll.
+    votes_casted = Choice.voted_users.through.objects.filter(
+        choice__question__username=author,
+        choice__question__permlink=permlink,
+    ).exists()
 
     return {
         "question": metadata.get("question"),
@@ -276,6 +459,23 @@ def fetch_poll_data(author, permlink):
     }
 
 
+def fetch_poll_data_cached(author, permlink):
+    """
+    fetch_poll_data() with a TTL cache. Only used for the polls without
+    local metadata.
+    """
+    key = "poll_data:" + hashlib.sha1(
+        f"{author}/{permlink}".encode("utf-8")).hexdigest()
+    poll_data = cache.get(key)
+    if poll_data is not None:
+        CACHE_REQUESTS.inc(cache="chain_data", result="hit")
+        return poll_data
+    CACHE_REQUESTS.inc(cache="chain_data", result="miss")
+    poll_data = fetch_poll_data(author, permlink)
+    cache.set(key, poll_data, settings.CHAIN_DATA_CACHE_TTL)
+    return poll_data
+
+
 def sanitize_filter_value(val):
     if not val:
         return
@@ -285,3 +485,77 @@ def sanitize_filter_value(val):
         return
 
 
+def get_poll_version(request, **lookup):
+    """
+    Return the (id, version, modified_at, expire_at) of a poll, or None if
+    it doesn't exist. Memoized on the request since ETag and Last-Modified
+    functions are called separately.
+    """
+    key = tuple(sorted(lookup.items()))
+    versions = request.__dict__.setdefault("_poll_versions", {})
+    if key not in versions:
+        versions[key] = Question.objects.filter(**lookup).values_list(
+            "id", "version", "modified_at", "expire_at").first()
+    return versions[key]
+
+
+def get_poll_etag(request, vary_on_user=False, vary_on_csrf=False, **lookup):
+    """
+    ETag of a poll response. Changes with the poll version, the query
+    string (filters) and when the poll closes, since the responses show
+    whether the poll is open. Pages rendering a csrf_token must vary on
+    the CSRF cookie, which is rotated on login.
+    """
+    version = get_poll_version(request, **lookup)
+    if not version:
+        return None
+    is_open = version[3] > now()
+    pieces = [str(version[0]), str(version[1]), request.get_full_path(),
+              "open" if is_open else "closed"]
+    if vary_on_user:
+        pieces.append(str(request.user.pk))
+    if vary_on_csrf:
+        pieces.append(request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""))
+    return hashlib.sha1(":".join(pieces).encode("utf-8")).hexdigest()
+
+
+def get_poll_last_modified(request, **lookup):
+    """
+    Last-Modified of a poll response. Closing the poll counts as a
+    modification.
+    """
+    version = get_poll_version(request, **lookup)
+    if not version:
+        return None
+    _, _, modified_at, expire_at = version
+    if expire_at <= now():
+        return max(modified_at, expire_at)
+    return modified_at
+
+
+def get_votes_summary(poll, **kwargs):
+    """
+    Question.votes_summary() with request coalescing. Concurrent requests
+    with the same poll version and filters share one computation.
+    The choices are returned in the Choice.summary_data() format, so only
+    plain values are cached.
+    """
+    params = ":".join(f"{k}={v}" for k, v in sorted(kwargs.items()))
+
+    def compute():
+        choice_list, choice_list_ordered, choices_selected, \
+            filter_exists, all_votes = poll.votes_summary(**kwargs)
+        choice_list_ordered = [
+            choice.summary_data() for choice in choice_list_ordered]
+        choices = {choice["id"]: choice for choice in choice_list_ordered}
+        choice_list = [choices[choice.id] for choice in choice_list]
+        if not isinstance(all_votes, int):
+            all_votes = float(all_votes)
+        return choice_list, choice_list_ordered, choices_selected, \
+            filter_exists, all_votes
+
+    return _summary_flight.do(
+        f"{poll.pk}:{poll.version}:{params}",
+        compute,
+        stale_key=f"{poll.pk}:{params}",
+    )
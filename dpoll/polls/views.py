@@ -8,26 +8,36 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.views import auth_logout
-from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Count
 from django.http import Http404
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.utils.timezone import now
-from steemconnect.client import Client
 from steemconnect.operations import Comment
 
 from base.utils import add_tz_info
-from .models import Question, Choice, User, VoteAudit
+from .models import Question, Choice, User, OutboxOperation, \
+    ChangeLogEntry, TagPopularity
+from .clients import HiveClient
+from .export import EXPORTS, EXPORT_FORMATS, export_rows, parse_filters, \
+    serialize_rows
+from .live import ResultStream, StreamLimitReached
+from .metrics import registry
+from .search import search_questions
+from .pagination import KeysetPaginator, InvalidCursor, QUESTION_ORDERINGS
 from communities.models import Community
 
 from .utils import (
     get_sc_client, get_comment_options, get_top_dpollers,
     get_top_voters, validate_input, add_or_get_question, add_choices,
-    get_comment, fetch_poll_data, sanitize_filter_value)
-
-from lightsteem.client import Client as LightsteemClient
+    get_comment, fetch_poll_data_cached, sanitize_filter_value, get_poll_etag,
+    get_votes_summary, get_poll_choices,
+    register_vote, queue_broadcast, set_poll_tags, run_in_transaction)
 
 
 TEAM_MEMBERS = [
@@ -50,6 +60,15 @@ TEAM_MEMBERS = [
     ]
 
 
+def get_keyset_page(request, queryset, ordering, per_page=10):
+    """The page of the ?cursor parameter. 404 for the invalid cursors."""
+    try:
+        return KeysetPaginator(queryset, ordering, per_page).get_page(
+            request.GET.get("cursor"))
+    except InvalidCursor:
+        raise Http404
+
+
 def index(request):
 
     query_params = {
@@ -57,31 +76,24 @@ def index(request):
         "is_deleted": False,
     }
     # ordering by new, trending, or promoted.
-    order_by = "-id"
+    ordering = QUESTION_ORDERINGS["new"]
     if request.GET.get("order"):
         if request.GET.get("order") == "trending":
-            order_by = "-voter_count"
+            ordering = QUESTION_ORDERINGS["trending"]
         elif request.GET.get("order") == "promoted":
-            order_by = "-promotion_amount"
+            ordering = QUESTION_ORDERINGS["promoted"]
             query_params.update({
                 "promotion_amount__gt": float(0.000),
             })
 
-    questions = Question.objects.filter(**query_params).order_by(order_by)
-    paginator = Paginator(questions, 10)
+    questions = Question.objects.filter(**query_params)
 
-    promoted_polls = Question.objects.filter(
+    promoted_poll = Question.objects.filter(
         expire_at__gt=now(),
         promotion_amount__gt=float(0.000),
-    ).order_by("-promotion_amount")
-
-    if len(promoted_polls):
-        promoted_poll = promoted_polls[0]
-    else:
-        promoted_poll = None
+    ).order_by("-promotion_amount").first()
 
-    page = request.GET.get('page')
-    polls = paginator.get_page(page)
+    polls = get_keyset_page(request, questions, ordering)
 
     stats = {
         'poll_count': Question.objects.all().count(),
@@ -161,48 +173,47 @@ def create_poll(request):
             )
             return redirect('create-poll')
 
-        # add question
-        question = add_or_get_question(
-            request,
-            question,
-            permlink,
-            days,
-            allow_multiple_choices
-        )
-        question.save()
-
-        # add answers attached to it
-        add_choices(question, choices)
-
-        # send it to the steem blockchain
-        sc_client = Client(access_token=request.session.get("sc_token"), oauth_base_url="https://hivesigner.com/oauth2/", sc2_api_base_url="https://hivesigner.com/api/")
-        comment = get_comment(request, question, choices, permlink, tags)
-        comment_options = get_comment_options(
-            comment,
-            reward_option=request.POST.get("reward-option")
-        )
-        if not settings.BROADCAST_TO_BLOCKCHAIN:
-            resp = {}
-        else:
-            resp = sc_client.broadcast([
-                comment.to_operation_structure(),
-                comment_options.to_operation_structure(),
-            ])
+        with transaction.atomic():
+            # add question
+            question = add_or_get_question(
+                request,
+                question,
+                permlink,
+                days,
+                allow_multiple_choices
+            )
 
-        if 'error' in resp:
-            if 'The token has invalid role' in resp.get("error_description"):
-                # expired token
-                auth_logout(request)
-                return redirect('login')
+            # add answers attached to it
+            add_choices(question, choices)
 
-            messages.add_message(
+            # queue it to be sent to the blockchain.
+            # the poll is deleted if the broadcast fails.
+            comment = get_comment(request, question, choices, permlink, tags)
+            comment_options = get_comment_options(
+                comment,
+                reward_option=request.POST.get("reward-option")
+            )
+            question.json_metadata = comment.json_metadata
+            question.save()
+            set_poll_tags(question, question.tags)
+            ChangeLogEntry.log_poll(
+                ChangeLogEntry.KIND_POLL_CREATED, question)
+            queue_broadcast(
                 request,
-                messages.ERROR,
-                resp.get("error_description", "error")
+                OutboxOperation.KIND_POLL,
+                [
+                    comment.to_operation_structure(),
+                    comment_options.to_operation_structure(),
+                ],
+                question.permlink,
+                question=question,
             )
-            question.delete()
-            return redirect('create-poll')
 
+        messages.add_message(
+            request,
+            messages.SUCCESS,
+            "Your poll will be broadcasted to the blockchain shortly."
+        )
         return redirect('detail', question.username, question.permlink)
 
     return render(request, "add.html")
@@ -223,14 +234,26 @@ def edit_poll(request, author, permlink):
     if author != request.user.username:
         raise Http404
 
+    if not poll.is_editable():
+        messages.add_message(
+            request,
+            messages.ERROR,
+            "Polls with votes or expired polls can't be edited."
+        )
+        return redirect('detail', poll.username, poll.permlink)
+
     if request.method == "GET":
-        poll_data = fetch_poll_data(poll.username, poll.permlink)
-        tags = poll_data.get("tags", [])
+        tags = poll.tags
+        if tags is None:
+            # polls created before the metadata is stored locally
+            poll_data = fetch_poll_data_cached(poll.username, poll.permlink)
+            tags = poll_data.get("tags") or []
         tags = [tag for tag in tags if tag not in settings.DEFAULT_TAGS]
         form_data = {
             "question": poll.text,
             "description": poll.description,
-            "answers": [c.text for c in Choice.objects.filter(question=poll)],
+            "answers": [c.text for c in Choice.objects.filter(
+                question=poll).order_by("id")],
             "expire_at": poll.expire_at_humanized,
             "tags": ",".join(tags),
             "allow_multiple_choices": poll.allow_multiple_choices
@@ -260,43 +283,41 @@ def edit_poll(request, author, permlink):
             })
             return render(request, "edit.html", {"form_data": form_data})
 
-        # add question
-        question = add_or_get_question(
-            request,
-            question,
-            permlink,
-            days,
-            allow_multiple_choices
-        )
-        question.save()
-
-        # add answers attached to it
-        add_choices(question, choices, flush=True)
-
-        # send it to the steem blockchain
-        sc_client = Client(access_token=request.session.get("sc_token"), oauth_base_url="https://hivesigner.com/oauth2/", sc2_api_base_url="https://hivesigner.com/api/")
-        comment = get_comment(request, question, choices, permlink, tags=tags)
-        if not settings.BROADCAST_TO_BLOCKCHAIN:
-            resp = {}
-        else:
-            resp = sc_client.broadcast([
-                comment.to_operation_structure(),
-            ])
-
-        if 'error' in resp:
-            if 'The token has invalid role' in resp.get("error_description"):
-                # expired token
-                auth_logout(request)
-                return redirect('login')
+        with transaction.atomic():
+            previous_state = poll.get_state()
+            # add question
+            question = add_or_get_question(
+                request,
+                question,
+                permlink,
+                days,
+                allow_multiple_choices
+            )
 
-            messages.add_message(
+            # add answers attached to it
+            add_choices(question, choices, flush=True)
+
+            # queue it to be sent to the blockchain
+            comment = get_comment(
+                request, question, choices, permlink, tags=tags)
+            question.json_metadata = comment.json_metadata
+            question.save()
+            set_poll_tags(question, question.tags)
+            ChangeLogEntry.log_poll(ChangeLogEntry.KIND_POLL_EDITED, question)
+            queue_broadcast(
                 request,
-                messages.ERROR,
-                resp.get("error_description", "error")
+                OutboxOperation.KIND_EDIT,
+                [comment.to_operation_structure()],
+                question.permlink,
+                question=question,
+                previous_state=previous_state,
             )
-            question.delete()
-            return redirect('edit', args=(author, permlink))
 
+        messages.add_message(
+            request,
+            messages.SUCCESS,
+            "Your poll will be broadcasted to the blockchain shortly."
+        )
         return redirect('detail', question.username, question.permlink)
 
     return render(request, "edit.html", {
@@ -304,6 +325,51 @@ def edit_poll(request, author, permlink):
     })
 
 
+def has_one_time_messages(request):
+    """
+    Pending messages, and the after_promotion notice the detail view adds,
+    must be rendered. The client can't use its cache for these requests.
+    """
+    return 'after_promotion' in request.GET or \
+        len(messages.get_messages(request)) > 0
+
+
+def detail_etag(request, user, permlink):
+    if has_one_time_messages(request):
+        return None
+    return get_poll_etag(
+        request, vary_on_user=True, vary_on_csrf=True,
+        username=user, permlink=permlink, is_deleted=False)
+
+
+def get_result_filters(params):
+    """
+    Parse the results filters (rep, sp, age, post_count, community and
+    stake_based) of the detail page and the results API into
+    Question.votes_summary() arguments.
+    """
+    community = params.get("community")
+
+    # check the existance of the community
+    try:
+        Community.objects.get(name=community)
+    except Community.DoesNotExist:
+        community = None
+
+    return {
+        "rep": sanitize_filter_value(params.get("rep")),
+        "sp": sanitize_filter_value(params.get("sp")),
+        "age": sanitize_filter_value(params.get("age")),
+        "post_count": sanitize_filter_value(params.get("post_count")),
+        "community": community,
+        "stake_based": params.get("stake_based") == "1",
+        "sa_stake_based": params.get("stake_based") == "2",
+    }
+
+
+# No Last-Modified: the page renders a csrf_token, and only the ETag can
+# vary on the CSRF cookie.
+@condition(etag_func=detail_etag)
 def detail(request, user, permlink):
 
     if 'after_promotion' in request.GET:
@@ -320,18 +386,8 @@ def detail(request, user, permlink):
     except Question.DoesNotExist:
         raise Http404
 
-    rep = sanitize_filter_value(request.GET.get("rep"))
-    sp = sanitize_filter_value(request.GET.get("sp"))
-    age = sanitize_filter_value(request.GET.get("age"))
-    post_count = sanitize_filter_value(request.GET.get("post_count"))
-    community = request.GET.get("community")
-
-    # check the existance of the community
-    try:
-        Community.objects.get(name=community)
-    except Community.DoesNotExist:
-        community = None
-
+    filters = get_result_filters(request.GET)
+    community = filters["community"]
     if community:
         messages.add_message(
             request,
@@ -339,16 +395,22 @@ def detail(request, user, permlink):
             f"Note: Only showing {community} members' choices."
         )
 
+    # closed polls are served from their frozen results when there are
+    # no filters. audit needs the full voter list, so it's always live.
+    summary = None
+    if not (filters["rep"] or filters["sp"] or filters["age"] or
+            filters["post_count"] or community) \
+            and 'audit' not in request.GET:
+        summary = poll.frozen_votes_summary(
+            stake_based=filters["stake_based"],
+            sa_stake_based=filters["sa_stake_based"],
+        )
+
+    if summary is None:
+        summary = get_votes_summary(poll, **filters)
+
     choice_list, choice_list_ordered, choices_selected, filter_exists, \
-            all_votes = poll.votes_summary(
-                age=age,
-                rep=rep,
-                sp=sp,
-                post_count=post_count,
-                stake_based=request.GET.get("stake_based") == "1",
-                sa_stake_based=request.GET.get("stake_based") == "2",
-                community=community,
-            )
+        all_votes = summary
 
     user_votes = Choice.objects.filter(
         voted_users__username=request.user.username,
@@ -376,7 +438,7 @@ def vote(request, user, permlink):
 
     # django admin users should not be able to vote.
     if not request.session.get("sc_token"):
-        redirect('logout')
+        return redirect('logout')
 
     try:
         poll = Question.objects.get(username=user, permlink=permlink)
@@ -423,19 +485,9 @@ def vote(request, user, permlink):
         )
         return redirect("detail", poll.username, poll.permlink)
 
-    for choice_id in choice_ids:
-        try:
-            choice = Choice.objects.get(pk=int(choice_id))
-        except Choice.DoesNotExist:
-            raise Http404
-
-    choice_instances = []
-    for choice_id in choice_ids:
-        choice = Choice.objects.get(pk=int(choice_id))
-        choice_instances.append(choice)
-
-    # send it to the steem blockchain
-    sc_client = Client(access_token=request.session.get("sc_token"), oauth_base_url="https://hivesigner.com/oauth2/", sc2_api_base_url="https://hivesigner.com/api/")
+    choice_instances = get_poll_choices(poll, choice_ids)
+    if not choice_instances:
+        raise Http404
 
     choice_text = ""
     for c in choice_instances:
@@ -459,56 +511,30 @@ def vote(request, user, permlink):
     )
 
     comment_options = get_comment_options(comment)
-    if not settings.BROADCAST_TO_BLOCKCHAIN:
-        resp = {}
-    else:
-        resp = sc_client.broadcast([
-            comment.to_operation_structure(),
-            comment_options.to_operation_structure(),
-        ])
-
-    # Steemconnect sometimes returns 503.
-    # https://github.com/steemscript/steemconnect/issues/356
-    if not isinstance(resp, dict):
-        messages.add_message(
-            request,
-            messages.ERROR,
-            "We got an unexpected error from Steemconnect. Please, try again."
-        )
-        return redirect("detail", poll.username, poll.permlink)
 
-    # Expected way to receive errors on broadcasting
-    if 'error' in resp:
-        messages.add_message(
+    # register the vote to the database and queue it to be sent to the
+    # blockchain. the vote is reverted if the broadcast fails.
+    def save_vote():
+        vote_audit = register_vote(poll, request.user, choice_instances)
+        queue_broadcast(
             request,
-            messages.ERROR,
-            resp.get("error_description", "error")
+            OutboxOperation.KIND_VOTE,
+            [
+                comment.to_operation_structure(),
+                comment_options.to_operation_structure(),
+            ],
+            comment.permlink,
+            question=poll,
+            vote_audit=vote_audit,
         )
 
-        return redirect("detail", poll.username, poll.permlink)
-
-    # register the vote to the database
-    for choice_instance in choice_instances:
-        choice_instance.voted_users.add(request.user)
-
-    block_id = resp.get("result", {}).get("block_num")
-    trx_id = resp.get("result", {}).get("id")
-
-    # add trx id and block id to the audit log
-    vote_audit = VoteAudit(
-        question=poll,
-        voter=request.user,
-        block_id=block_id,
-        trx_id=trx_id
-    )
-    vote_audit.save()
-    for choice_instance in choice_instances:
-        vote_audit.choices.add(choice_instance)
+    run_in_transaction(save_vote)
 
     messages.add_message(
         request,
         messages.SUCCESS,
-        "You have successfully voted!"
+        "You have successfully voted! Your vote will be broadcasted to "
+        "the blockchain shortly."
     )
 
     return redirect("detail", poll.username, poll.permlink)
@@ -520,17 +546,20 @@ def profile(request, user):
     except User.DoesNotExist:
         raise Http404
 
-    polls = user.polls_created
-    votes = user.votes_casted
-    poll_count = len(polls)
-    vote_count = len(votes)
+    # polls and votes are listed in separate tabs, 10 items per page.
+    tab = "votes" if request.GET.get("tab") == "votes" else "polls"
+    if tab == "votes":
+        queryset = user.votes_casted
+    else:
+        queryset = user.polls_created
+    page = get_keyset_page(request, queryset, ("id",))
 
     return render(request, "profile.html", {
         "user": user,
-        "polls": polls,
-        "votes": votes,
-        "poll_count": poll_count,
-        "vote_count": vote_count,
+        "tab": tab,
+        "page": page,
+        "poll_count": user.poll_count,
+        "vote_count": user.vote_count,
     })
 
 
@@ -559,19 +588,11 @@ def polls_by_vote_count(request):
     if request.GET.get("exclude_team_members"):
         questions = questions.exclude(username__in=settings.TEAM_MEMBERS)
 
+    # users voted for multiple choices are counted once.
+    questions = questions.annotate(
+        unique_voters=Count("choices__voted_users", distinct=True))
     for question in questions:
-        vote_count = 0
-        already_counted_users = []
-        for choice in question.choices.all():
-            voted_users = choice.voted_users.all()
-            for voted_user in voted_users:
-                if voted_user.pk in already_counted_users:
-                    continue
-                vote_count += 1
-                # now, with the multiple choices implemented
-                # only one choice of a user should be counted, here.
-                already_counted_users.append(voted_user.pk)
-        polls.append({"vote_count": vote_count, "poll": question})
+        polls.append({"vote_count": question.unique_voters, "poll": question})
 
     polls = sorted(polls, key=lambda x: x["vote_count"], reverse=True)
 
@@ -590,13 +611,9 @@ def vote_transaction_details(request):
     except Question.DoesNotExist:
         raise Http404
 
-    choice_instances = []
-    for choice_id in choices:
-        try:
-            choice = Choice.objects.get(pk=int(choice_id))
-        except Choice.DoesNotExist:
-            raise Http404
-        choice_instances.append(choice)
+    choice_instances = get_poll_choices(poll, choices)
+    if not choice_instances:
+        raise Http404
 
     choice_text = ""
     for c in choice_instances:
@@ -636,23 +653,23 @@ def sync_vote(request):
     except (TypeError, ValueError):
         return HttpResponse('Invalid block ID', status=400)
 
-    c = LightsteemClient(nodes=["https://api.hivekings.com"])
+    c = HiveClient(nodes=settings.HIVE_NODES)
     block_data = c.get_block(block_num)
     if not block_data:
         # block data may return null if it's invalid
         return HttpResponse('Invalid block ID', status=400)
 
     vote_tx = None
-    for transaction in block_data.get("transactions", []):
-        if transaction.get("transaction_id") == trx_id:
-            vote_tx = transaction
+    for block_tx in block_data.get("transactions", []):
+        if block_tx.get("transaction_id") == trx_id:
+            vote_tx = block_tx
             break
 
     if not vote_tx:
         return HttpResponse('Invalid transaction ID', status=400)
 
     vote_op = None
-    for op_type, op_value in transaction.get("operations", []):
+    for op_type, op_value in vote_tx.get("operations", []):
         if op_type != "comment":
             continue
         vote_op = op_value
@@ -684,6 +701,14 @@ def sync_vote(request):
     except Question.DoesNotExist:
         return HttpResponse("parent_author/parent_permlink is not a poll.", status=400)
 
+    # the votes cast after the expiration are rejected. the block time is
+    # checked, so the late syncs of the earlier votes are still accepted.
+    voted_at = now()
+    if block_data.get("timestamp"):
+        voted_at = add_tz_info(parse(block_data["timestamp"]))
+    if voted_at >= question.expire_at:
+        return HttpResponse("This poll is expired.", status=400)
+
     # Validate the choice
     choices = Choice.objects.filter(
         question=question,
@@ -712,18 +737,9 @@ def sync_vote(request):
             question=question).count() != 0:
         return HttpResponse("You have already voted on that poll.", status=400)
 
-    # register the vote
-    for selected_choice in selected_choices:
-        selected_choice.voted_users.add(user)
-
-    # add vote audit entry
-    vote_audit = VoteAudit(
-        question=question,
-        voter=user,
-        block_id=block_num,
-        trx_id=trx_id
-    )
-    vote_audit.save()
+    # register the vote with the vote audit entry
+    register_vote(
+        question, user, selected_choices, block_id=block_num, trx_id=trx_id)
 
     return HttpResponse("Vote is registered to the database.", status=200)
 
@@ -737,12 +753,112 @@ def vote_check(request):
     if not request.GET.get("voter_username"):
         raise Http404
 
-    users = set()
-    for choice in Choice.objects.filter(question=question):
-        for voted_user in choice.voted_users.all():
-            users.add(voted_user.username)
+    voted = Choice.objects.filter(
+        question=question,
+        voted_users__username=request.GET.get("voter_username"),
+    ).exists()
+
+    return JsonResponse({"voted": voted})
 
-    if request.GET.get("voter_username") in users:
-        return JsonResponse({"voted": True})
-    else:
-        return JsonResponse({"voted": False})
+
+def has_token_access(request, token):
+    """Staff users, or the clients sending the token in an
+    "Authorization: Bearer <token>" header."""
+    if request.user.is_staff:
+        return True
+    if not token:
+        return False
+    return constant_time_compare(
+        request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}")
+
+
+def export(request, kind):
+    """Stream the polls, choices, votes or audits as NDJSON or CSV.
+    Staff only, or with the EXPORT_TOKEN."""
+    if not has_token_access(request, settings.EXPORT_TOKEN):
+        return HttpResponse("Forbidden.", status=403)
+    if kind not in EXPORTS:
+        raise Http404
+
+    output_format = request.GET.get("format", "ndjson")
+    if output_format not in EXPORT_FORMATS:
+        return HttpResponse("Invalid format.", status=400)
+    try:
+        filters = parse_filters(request.GET)
+    except (ValueError, OverflowError):
+        return HttpResponse("Invalid filters.", status=400)
+
+    content_type = "application/x-ndjson" if output_format == "ndjson" \
+        else "text/csv"
+    response = StreamingHttpResponse(
+        serialize_rows(export_rows(kind, filters), output_format),
+        content_type=content_type)
+    response["Content-Disposition"] = \
+        f'attachment; filename="dpoll-{kind}.{output_format}"'
+    return response
+
+
+def tag(request, tag):
+    """Polls of a tag, newest first."""
+    tag = tag.lower()
+    popularity = TagPopularity.objects.filter(tag=tag).first()
+    questions = Question.objects.filter(poll_tags__tag=tag, is_deleted=False)
+    polls = get_keyset_page(request, questions, ("id",))
+    return render(request, "tag.html", {
+        "tag": tag, "popularity": popularity, "polls": polls})
+
+
+def search(request):
+    """Full-text search over the polls, ordered by relevance."""
+    query = request.GET.get("q", "")
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+
+    page_size = settings.SEARCH_PAGE_SIZE
+    # fetch one more poll to know if there is a next page.
+    polls = search_questions(query, page_size + 1, (page - 1) * page_size)
+    return render(request, "search.html", {
+        "query": query,
+        "polls": polls[:page_size],
+        "page": page,
+        "has_next": len(polls) > page_size,
+    })
+
+
+def live_results(request, user, permlink):
+    """Stream the results of a poll as server-sent events. Over the stream
+    limit, the clients are told to poll the results API instead."""
+    try:
+        poll = Question.objects.get(
+            username=user, permlink=permlink, is_deleted=False)
+    except Question.DoesNotExist:
+        raise Http404
+
+    try:
+        stream = ResultStream(poll.pk)
+    except StreamLimitReached:
+        response = JsonResponse({
+            "detail": "Too many live streams, poll the results instead.",
+            "results_url": reverse(
+                "poll_view_set-results", kwargs={"pk": poll.pk}),
+            "poll_interval": settings.LIVE_RESULTS_FALLBACK_INTERVAL,
+        }, status=503)
+        response["Retry-After"] = settings.LIVE_RESULTS_FALLBACK_INTERVAL
+        return response
+
+    response = StreamingHttpResponse(
+        stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # don't let nginx buffer the events
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def metrics(request):
+    """Prometheus scrape endpoint. Staff only, or with the METRICS_TOKEN."""
+    if not has_token_access(request, settings.METRICS_TOKEN):
+        return HttpResponse("Forbidden.", status=403)
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4")
@@ -2,8 +2,8 @@ import getpass
 from datetime import timedelta
 from decimal import Decimal
 
+from base.profiling import ProfiledCommand
 from django.conf import settings
-from django.core.management.base import BaseCommand
 from django.db.models import Sum
 from django.utils.timezone import now
 from lightsteem.client import Client
@@ -21,7 +21,7 @@ Flow:
 """
 
 
-class Command(BaseCommand):
+class Command(ProfiledCommand):
     def handle(self, *args, **options):
         active_key = getpass.getpass(
             f"Active key of f{settings.SPONSORS_ACCOUNT}")
@@ -1,4 +1,4 @@
-from django.core.management.base import BaseCommand
+from base.profiling import ProfiledCommand
 
 from lightsteem.client import Client
 from lightsteem.helpers.amount import Amount
@@ -15,7 +15,7 @@ BLACKLIST = [
 ]
 
 
-class Command(BaseCommand):
+class Command(ProfiledCommand):
     def handle(self, *args, **options):
         client = Client(nodes=["https://api.hivekings.com"])
         acc = client.account(settings.CURATION_BOT_ACCOUNT)
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.13 on 2026-10-19 04:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sponsors', '0003_auto_20181126_1942'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sponsor',
+            index=models.Index(fields=['delegation_amount', 'id'], name='sponsor_delegation_id_idx'),
+        ),
+    ]
@@ -20,6 +20,13 @@ class Sponsor(models.Model):
     def __str__(self):
         return self.username
 
+    class Meta:
+        indexes = [
+            # keyset pagination of the sponsors API
+            models.Index(fields=['delegation_amount', 'id'],
+                         name='sponsor_delegation_id_idx'),
+        ]
+
     @property
     def sp(self):
         from .views import steem_per_mvests, vests_to_sp
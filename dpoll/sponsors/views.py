@@ -1,12 +1,12 @@
 from django.shortcuts import render
-from lightsteem.client import Client
 from lightsteem.helpers.amount import Amount
+from polls.clients import HiveClient
 
 from .models import Sponsor
 
 
 def steem_per_mvests():
-    c = Client(nodes=["https://api.hivekings.com"])
+    c = HiveClient(nodes=["https://api.hivekings.com"])
     info = c.get_dynamic_global_properties()
     return (float(Amount(info["total_vesting_fund_steem"]).amount) /
             (float(Amount(info["total_vesting_shares"]).amount) / 1e6))